@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-message auth overhead (ensure_identity + bearer_token for the MAS
+call) with the memoized identity path vs the previous header-dict path.
+Usage: python scripts/bench_identity.py [messages] [environ_keys]
+
+`cl.user_session` is replaced by a plain dict for the run, so only the auth code itself
+is measured. The previous path is reproduced inline: a session lookup, then for every MAS
+request the header getter, either hitting the global header dict or (for sessions whose
+user was not in it) rebuilding the headers from the whole WSGI environ.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "app"))
+
+import chainlit as cl  # noqa: E402
+
+from config import settings  # noqa: E402
+
+settings.enable_password_auth = False  # OBO: the path deployed apps take
+
+from auth.ensure_identity import ensure_identity  # noqa: E402
+from auth.identity_store import identity_store  # noqa: E402
+
+EMAIL = "analyst@example.com"
+
+
+class _Session(dict):
+    def set(self, key, value):
+        self[key] = value
+
+
+class _User:
+    identifier = EMAIL
+    display_name = EMAIL
+
+
+def make_token(ttl_s: float) -> str:
+    claims = base64.urlsafe_b64encode(json.dumps({"exp": int(time.time() + ttl_s), "sub": EMAIL}).encode())
+    return "eyJhbGciOiJSUzI1NiJ9." + claims.decode().rstrip("=") + "." + "s" * 342
+
+
+def make_environ(token: str, keys: int) -> dict:
+    environ = {f"HTTP_X_HEADER_{i}": f"value-{i}" for i in range(keys)}
+    environ.update({"HTTP_X_FORWARDED_ACCESS_TOKEN": token, "HTTP_X_FORWARDED_EMAIL": EMAIL})
+    return environ
+
+
+def legacy_headers(session: dict, global_headers: dict) -> dict:
+    """The previous ensure_identity._headers_getter (logging aside)."""
+    user = session.get("user")
+    if user and user.identifier in global_headers:
+        return global_headers[user.identifier]
+    environ = session.get("environ")
+    headers = {}
+    for key, value in environ.items():
+        if key.startswith("HTTP_"):
+            headers[key[5:].lower().replace("_", "-")] = value
+    return headers
+
+
+async def legacy_ensure_identity(session: dict):
+    identity = session.get("identity")
+    if identity:
+        return identity
+
+
+async def run_legacy(session: dict, global_headers: dict, messages: int) -> float:
+    session["identity"] = object()
+    started = time.perf_counter()
+    for _ in range(messages):
+        await legacy_ensure_identity(session)
+        token = legacy_headers(session, global_headers).get("x-forwarded-access-token")
+        assert token
+    return time.perf_counter() - started
+
+
+async def run_current(messages: int) -> float:
+    started = time.perf_counter()
+    for _ in range(messages):
+        identity = await ensure_identity()
+        token = identity.token_source.bearer_token()
+        assert token
+    return time.perf_counter() - started
+
+
+async def main(messages: int, environ_keys: int) -> None:
+    token = make_token(3600)
+    environ = make_environ(token, environ_keys)
+    rows = []
+
+    cl.user_session = _Session(user=_User(), environ=environ)
+    stored = legacy_headers(cl.user_session, {})  # header auth stored the request's headers
+    rows.append(("previous, header dict hit", await run_legacy(cl.user_session, {EMAIL: stored}, messages)))
+    rows.append(("previous, environ walk", await run_legacy(cl.user_session, {}, messages)))
+
+    identity_store.discard(EMAIL)
+    cl.user_session = _Session(user=_User(), environ=environ)
+    first = time.perf_counter()
+    await ensure_identity()
+    first = time.perf_counter() - first
+    rows.append(("memoized identity", await run_current(messages)))
+
+    # Token inside the refresh window: every call goes back to the store
+    identity_store.put(EMAIL, make_token(settings.identity_refresh_before_s / 2))
+    cl.user_session = _Session(user=_User(), environ=make_environ(make_token(30), environ_keys))
+    await ensure_identity()
+    rows.append(("memoized, token near expiry", await run_current(messages)))
+
+    print(f"{messages} messages, {environ_keys + 2} environ headers; first call {first * 1e6:.1f} us")
+    print(f"{'path':32} {'total ms':>10} {'ns/message':>12}")
+    for name, elapsed in rows:
+        print(f"{name:32} {elapsed * 1000:10.2f} {elapsed / messages * 1e9:12.0f}")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    keys = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    asyncio.run(main(n, keys))
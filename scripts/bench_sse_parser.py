@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: incremental SSE parser vs the previous line-based /invocations loop.
+Usage: python scripts/bench_sse_parser.py [num_deltas] [chunk_size]
+
+Both paths read the same synthetic MAS stream through an httpx.Response, so the
+line-based loop pays for `aiter_lines()` exactly as it did in MASChatClient.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "app"))
+
+import httpx  # noqa: E402
+
+from services.sse_parser import JSON_BACKEND, iter_sse_json  # noqa: E402
+
+
+def build_stream(num_deltas: int) -> bytes:
+    frames = [b'data: {"type":"response.created","response":{"id":"resp_1"}}\n\n']
+    for i in range(num_deltas):
+        if i % 50 == 0:
+            frames.append(b": keepalive\n\n")
+        delta = json.dumps({"type": "response.output_text.delta", "item_id": "msg_1", "delta": f"tok{i} "})
+        frames.append(f"data: {delta}\n\n".encode())
+    frames.append(b"data: [DONE]\n\n")
+    return b"".join(frames)
+
+
+def make_response(payload: bytes, chunk_size: int) -> httpx.Response:
+    async def chunks():
+        for i in range(0, len(payload), chunk_size):
+            yield payload[i:i + chunk_size]
+
+    return httpx.Response(200, content=chunks())
+
+
+async def legacy_events(resp: httpx.Response):
+    """The pre-parser MASChatClient._stream_rest_sse body."""
+    async for line in resp.aiter_lines():
+        if not line:
+            continue
+        if line.startswith(":"):
+            continue
+        if line.lower().startswith("data:"):
+            data = line[5:].strip()
+        else:
+            data = line.strip()
+        if not data or data == "[DONE]":
+            continue
+        try:
+            obj = json.loads(data)
+        except json.JSONDecodeError:
+            continue
+        yield obj
+
+
+async def legacy_loop(resp: httpx.Response) -> int:
+    count = 0
+    async for _ in legacy_events(resp):
+        count += 1
+    return count
+
+
+async def parser_loop(resp: httpx.Response) -> int:
+    count = 0
+    async for _ in iter_sse_json(resp.aiter_bytes()):
+        count += 1
+    return count
+
+
+async def bench(name, fn, payload: bytes, chunk_size: int, rounds: int = 5) -> float:
+    best = float("inf")
+    count = 0
+    for _ in range(rounds):
+        resp = make_response(payload, chunk_size)
+        t0 = time.perf_counter()
+        count = await fn(resp)
+        best = min(best, time.perf_counter() - t0)
+    print(f"  {name:<12} {best * 1000:8.2f} ms  ({count} events, {best / max(count, 1) * 1e6:.2f} us/event)")
+    return best
+
+
+async def main() -> None:
+    num_deltas = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    payload = build_stream(num_deltas)
+    print(f"SSE stream: {num_deltas} deltas, {len(payload)} bytes, chunk={chunk_size}, json={JSON_BACKEND}")
+    legacy = await bench("line-based", legacy_loop, payload, chunk_size)
+    parser = await bench("sse_parser", parser_loop, payload, chunk_size)
+    print(f"  speedup      {legacy / parser:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
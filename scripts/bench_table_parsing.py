@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark result-table parsing on large agent answers.
+
+Builds a markdown answer with a pipe table of N rows (currency, percent, thousands
+separators, dates, low-cardinality text) and compares:
+  legacy     the old regex extract_first_table: all-object string DataFrame
+  per-cell   streaming extraction + a per-cell Python type parser (apply)
+  typed      streaming extraction + vectorized infer_dtypes (what the renderer uses)
+Reports parse time, DataFrame memory, and Arrow IPC / Parquet encode time and size.
+
+Usage: python scripts/bench_table_parsing.py [rows] [--rounds N]
+"""
+
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "app"))
+
+import pandas as pd  # noqa: E402
+
+from services.table_parser import StreamingTableExtractor  # noqa: E402
+from services.table_types import to_arrow_ipc, to_parquet  # noqa: E402
+
+_LEGACY_RE = re.compile(
+    r"^\s*\|.+?\|\s*$\n^\s*\|(?:\s*[:-]+-+\s*\|)+\s*$\n(?:^\s*\|.+?\|\s*$\n?)+",
+    re.MULTILINE
+)
+
+
+def legacy_extract(md: str):
+    m = _LEGACY_RE.search(md)
+    lines = [l.strip() for l in m.group(0).strip().splitlines()]
+    header = [c.strip() for c in lines[0].strip("|").split("|")]
+    rows = [[c.strip() for c in l.strip("|").split("|")] for l in lines[2:] if "|" in l]
+    return pd.DataFrame(rows, columns=header)
+
+
+def _cell_value(cell: str):
+    s = cell.replace("$", "").replace(",", "").replace("%", "")
+    try:
+        return float(s)
+    except ValueError:
+        try:
+            return pd.Timestamp(s)
+        except ValueError:
+            return cell
+
+
+def per_cell_extract(md: str):
+    df = legacy_extract(md)
+    return df.apply(lambda col: col.map(_cell_value)).infer_objects()
+
+
+def typed_extract(md: str, delta_chars: int = 24):
+    extractor = StreamingTableExtractor()
+    for i in range(0, len(md), delta_chars):
+        extractor.feed(md[i:i + delta_chars])
+    return extractor.close().tables[0]
+
+
+def build_answer(rows: int) -> str:
+    rnd = random.Random(7)
+    regions = ["AMER", "EMEA", "APJ", "LATAM"]
+    segments = ["Enterprise", "Mid-Market", "SMB", "Public Sector", "Startup"]
+    lines = [
+        "Here is the revenue breakdown by segment for 2024:",
+        "",
+        "| Region | Segment | Revenue | Growth | Units | Date | Margin |",
+        "|---|---|---|---|---|---|---|",  # the legacy regex rejects ---: alignment
+    ]
+    for _ in range(rows):
+        lines.append(
+            f"| {rnd.choice(regions)} | {rnd.choice(segments)} | ${rnd.uniform(1e3, 5e6):,.2f} "
+            f"| {rnd.uniform(-20, 40):.1f}% | {rnd.randint(1, 250000):,} "
+            f"| 2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} | {rnd.uniform(-0.2, 0.6):.3f} |"
+        )
+    lines += ["", "Enterprise continues to lead revenue growth."]
+    return "\n".join(lines)
+
+
+def timed(fn, rounds: int):
+    samples, result = [], None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    rows = int(args[0]) if args else 10_000
+    rounds = int(sys.argv[sys.argv.index("--rounds") + 1]) if "--rounds" in sys.argv else 5
+    md = build_answer(rows)
+    print(f"{rows} rows, {len(md) / 1024:.0f} KiB of markdown, median of {rounds} rounds\n")
+
+    print(f"{'variant':<10}{'parse ms':>10}{'memory KiB':>12}  dtypes")
+    for name, fn in (
+        ("legacy", lambda: legacy_extract(md)),
+        ("per-cell", lambda: per_cell_extract(md)),
+        ("typed", lambda: typed_extract(md)),
+    ):
+        ms, df = timed(fn, rounds)
+        mem = df.memory_usage(index=False, deep=True).sum() / 1024
+        dtypes = ", ".join(str(t) for t in df.dtypes)
+        print(f"{name:<10}{ms:>10.1f}{mem:>12.0f}  {dtypes}")
+
+    df = typed_extract(md)
+    for name, encode in (("arrow ipc", to_arrow_ipc), ("parquet", to_parquet)):
+        ms, data = timed(lambda: encode(df), rounds)
+        if data is None:
+            print(f"{name:<10} skipped (pyarrow not installed)")
+        else:
+            print(f"{name:<10}{ms:>10.1f} ms encode, {len(data) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark Chainlit thread-list and thread-resume latency on Lakebase, before and after the
+schema migrations in src/app/data/migrations.py.
+
+Builds a synthetic dataset in a throwaway schema (the real tables are never touched),
+times the queries, applies the migrations there, and times them again.
+Usage: python scripts/bench_thread_queries.py [users] [threads_per_user] [steps_per_thread] [--keep]
+Requires the same environment as the app (PGHOST, PGUSER, PGDATABASE, DATABASE_INSTANCE, ...).
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "app"))
+
+from sqlalchemy import text  # noqa: E402
+
+from data.lakebase import create_sync_engine  # noqa: E402
+from data.migrations import run_migrations  # noqa: E402
+
+SCHEMA_SQL = '''
+CREATE TABLE users (
+    "id" UUID PRIMARY KEY, "identifier" TEXT NOT NULL UNIQUE, "metadata" JSONB NOT NULL, "createdAt" TEXT
+);
+CREATE TABLE threads (
+    "id" UUID PRIMARY KEY, "createdAt" TEXT, "name" TEXT, "userId" UUID, "userIdentifier" TEXT,
+    "tags" TEXT[], "metadata" JSONB,
+    FOREIGN KEY ("userId") REFERENCES users("id") ON DELETE CASCADE
+);
+CREATE TABLE steps (
+    "id" UUID PRIMARY KEY, "name" TEXT NOT NULL, "type" TEXT NOT NULL, "threadId" UUID NOT NULL,
+    "parentId" UUID, "streaming" BOOLEAN NOT NULL, "waitForAnswer" BOOLEAN, "isError" BOOLEAN,
+    "metadata" JSONB, "tags" TEXT[], "input" TEXT, "output" TEXT, "createdAt" TEXT, "command" TEXT,
+    "start" TEXT, "end" TEXT, "generation" JSONB, "showInput" TEXT, "language" TEXT, "indent" INT,
+    "defaultOpen" BOOLEAN,
+    FOREIGN KEY ("threadId") REFERENCES threads("id") ON DELETE CASCADE
+);
+CREATE TABLE elements (
+    "id" UUID PRIMARY KEY, "threadId" UUID, "type" TEXT, "url" TEXT, "chainlitKey" TEXT,
+    "name" TEXT NOT NULL, "display" TEXT, "objectKey" TEXT, "size" TEXT, "page" INT,
+    "language" TEXT, "forId" UUID, "mime" TEXT, "props" JSONB,
+    FOREIGN KEY ("threadId") REFERENCES threads("id") ON DELETE CASCADE
+);
+CREATE TABLE feedbacks (
+    "id" UUID PRIMARY KEY, "forId" UUID NOT NULL, "threadId" UUID NOT NULL, "value" INT NOT NULL,
+    "comment" TEXT,
+    FOREIGN KEY ("threadId") REFERENCES threads("id") ON DELETE CASCADE
+);
+'''
+
+# Generated server-side so large datasets load in seconds.
+POPULATE_SQL = '''
+INSERT INTO users ("id", "identifier", "metadata", "createdAt")
+SELECT gen_random_uuid(), 'user' || u || '@example.com', '{}'::jsonb, to_char(now(), 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"')
+FROM generate_series(1, :users) u;
+
+INSERT INTO threads ("id", "createdAt", "name", "userId", "userIdentifier", "metadata")
+SELECT gen_random_uuid(),
+       to_char(now() - (t || ' minutes')::interval, 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"'),
+       'Thread ' || t, u."id", u."identifier", '{}'::jsonb
+FROM users u, generate_series(1, :threads) t;
+
+INSERT INTO steps ("id", "name", "type", "threadId", "streaming", "output", "createdAt")
+SELECT gen_random_uuid(), 'Assistant', CASE WHEN s % 2 = 0 THEN 'user_message' ELSE 'assistant_message' END,
+       t."id", false, repeat('answer text ', 20),
+       to_char(now() + (s || ' seconds')::interval, 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"')
+FROM threads t, generate_series(1, :steps) s;
+
+INSERT INTO elements ("id", "threadId", "type", "name", "forId")
+SELECT gen_random_uuid(), s."threadId", 'dataframe', 'Results', s."id"
+FROM steps s WHERE s."type" = 'assistant_message' AND random() < 0.3;
+
+INSERT INTO feedbacks ("id", "forId", "threadId", "value")
+SELECT gen_random_uuid(), s."id", s."threadId", 1
+FROM steps s WHERE s."type" = 'assistant_message' AND random() < 0.05;
+'''
+
+# Shaped like the queries Chainlit's SQLAlchemyDataLayer issues for the sidebar and resume.
+THREAD_LIST_SQL = text('''
+SELECT "id", "createdAt", "name" FROM threads
+WHERE "userIdentifier" = :identifier ORDER BY "createdAt" DESC LIMIT 20
+''')
+RESUME_SQL = [
+    text('SELECT * FROM steps WHERE "threadId" = :thread_id ORDER BY "createdAt"'),
+    text('SELECT * FROM elements WHERE "threadId" = :thread_id'),
+    text('SELECT * FROM feedbacks WHERE "threadId" = :thread_id'),
+]
+
+
+def timed(conn, queries, params_fn, rounds: int):
+    samples = []
+    for _ in range(rounds):
+        params = params_fn()
+        started = time.perf_counter()
+        for q in queries:
+            conn.execute(q, params).fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def measure(conn, identifiers, thread_ids, rounds: int):
+    return {
+        "thread list": timed(conn, [THREAD_LIST_SQL], lambda: {"identifier": random.choice(identifiers)}, rounds),
+        "thread resume": timed(conn, RESUME_SQL, lambda: {"thread_id": random.choice(thread_ids)}, rounds),
+    }
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    keep = "--keep" in sys.argv
+    users = int(args[0]) if len(args) > 0 else 200
+    threads = int(args[1]) if len(args) > 1 else 50
+    steps = int(args[2]) if len(args) > 2 else 20
+    rounds = 50
+
+    schema = f"bench_chainlit_{uuid.uuid4().hex[:8]}"
+    engine = create_sync_engine(connect_args={"options": f"-csearch_path={schema}"}, pool_size=1)
+    print(f"Schema {schema}: {users} users x {threads} threads x {steps} steps")
+
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(f"CREATE SCHEMA {schema}"))
+            conn.execute(text(SCHEMA_SQL))
+            for statement in POPULATE_SQL.split(";\n\n"):
+                conn.execute(text(statement), {"users": users, "threads": threads, "steps": steps})
+            conn.execute(text("ANALYZE"))
+            conn.commit()
+            identifiers = [r[0] for r in conn.execute(text('SELECT "identifier" FROM users'))]
+            thread_ids = [r[0] for r in conn.execute(text('SELECT "id" FROM threads ORDER BY random() LIMIT 500'))]
+            before = measure(conn, identifiers, thread_ids, rounds)
+            conn.commit()
+
+        applied = run_migrations(engine)
+        print(f"Applied migrations: {applied}")
+
+        with engine.connect() as conn:
+            conn.execute(text("ANALYZE"))
+            after = measure(conn, identifiers, thread_ids, rounds)
+
+        print(f"{'query':<15}{'before p50':>12}{'before p95':>12}{'after p50':>12}{'after p95':>12}")
+        for name in before:
+            (b50, b95), (a50, a95) = before[name], after[name]
+            print(f"{name:<15}{b50:>10.2f}ms{b95:>10.2f}ms{a50:>10.2f}ms{a95:>10.2f}ms")
+    finally:
+        if not keep:
+            with engine.connect() as conn:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+                conn.commit()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark: how concurrent chat sessions scale with worker processes (cores).
+
+For each worker count W, the same total number of sessions is split over W processes,
+each driving the streaming pipeline (MASChatClient -> normalize -> ChainlitStream, as in
+scripts/loadtest_chat.py) against its own mock MAS endpoint, the way multiworker.py spreads
+users over Chainlit workers. Reports aggregate tokens/s, speed-up over one worker and the
+worst per-worker TTFT / end-to-end p95.
+
+Usage:
+  python scripts/bench_workers.py --workers 1,2,4 --sessions 400 --tokens 400 --tokens-per-sec 0
+  python scripts/bench_workers.py --workers 1,2,4,8 --sessions 800 --scenario table
+
+--tokens-per-sec 0 streams as fast as the mock can, which makes the driver CPU-bound (the
+case extra workers help with); mock servers share the machine, so keep W at or below
+half the cores for clean numbers.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "src", "app"))
+
+import loadtest_chat  # noqa: E402
+import mock_mas_server  # noqa: E402
+
+
+def _driver(port: int, args: argparse.Namespace, sessions: int, start, results) -> None:
+    os.environ.update({
+        "DATABRICKS_HOST": f"http://127.0.0.1:{port}",
+        "SERVING_ENDPOINT": "mock-mas",
+        "DATABRICKS_TOKEN": "mock",
+        "ENABLE_PASSWORD_AUTH": "true",
+        "ENABLE_HEADER_AUTH": "false",
+        "LOG_LEVEL": "WARNING",
+    })
+    ns = argparse.Namespace(**{**vars(args), "sessions": sessions, "concurrency": 0, "memory": False})
+    start.wait()
+    results.put(asyncio.run(loadtest_chat.drive(ns)))
+
+
+def run(workers: int, args: argparse.Namespace) -> dict:
+    script = mock_mas_server.script_from_args(args)
+    servers, ports = [], []
+    for _ in range(workers):
+        port = loadtest_chat._free_port()
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(
+            target=loadtest_chat._run_server, args=(script, port, ready, 0.0, 0.0), daemon=True
+        )
+        server.start()
+        if not ready.wait(10):
+            raise RuntimeError("Mock MAS server failed to start")
+        servers.append(server)
+        ports.append(port)
+
+    start, results = multiprocessing.Event(), multiprocessing.Queue()
+    shares = [args.sessions // workers + (i < args.sessions % workers) for i in range(workers)]
+    drivers = [
+        multiprocessing.Process(target=_driver, args=(port, args, share, start, results))
+        for port, share in zip(ports, shares)
+    ]
+    for d in drivers:
+        d.start()
+    time.sleep(1.0)  # let the drivers import the app before the clock starts
+    started = time.perf_counter()
+    start.set()
+    per_worker = [results.get() for _ in drivers]
+    wall = time.perf_counter() - started
+    for d in drivers:
+        d.join()
+    for s in servers:
+        s.terminate()
+
+    tokens = sum(r["tokens"] for r in per_worker)
+    return {
+        "workers": workers,
+        "sessions": args.sessions,
+        "errors": sum(r["errors"] for r in per_worker),
+        "wall_s": wall,
+        "tokens": tokens,
+        "tokens_per_sec": tokens / wall if wall else 0.0,
+        "ttft_p95_ms": max(r["ttft_ms"]["p95"] for r in per_worker),
+        "e2e_p95_ms": max(r["e2e_ms"]["p95"] for r in per_worker),
+        "cpu_us_per_token": max(r["cpu_us_per_token"] or 0.0 for r in per_worker),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--sessions", type=int, default=200)
+    mock_mas_server.add_arguments(parser)
+    args = parser.parse_args()
+    counts = [int(w) for w in args.workers.split(",")]
+
+    print(f"{os.cpu_count()} cores; {args.sessions} sessions x {args.tokens} tokens, "
+          f"scenario {args.recording or args.scenario}, {args.tokens_per_sec:g} tokens/s per stream")
+    print(f"{'workers':>7} {'wall s':>8} {'tokens/s':>10} {'speed-up':>9} {'TTFT p95':>10} {'E2E p95':>10} {'errors':>7}")
+    baseline = None
+    for workers in counts:
+        r = run(workers, args)
+        baseline = baseline or r["tokens_per_sec"]
+        print(f"{workers:>7} {r['wall_s']:8.2f} {r['tokens_per_sec']:10.0f} {r['tokens_per_sec'] / baseline:8.2f}x "
+              f"{r['ttft_p95_ms']:8.0f}ms {r['e2e_p95_ms']:8.0f}ms {r['errors']:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for the Chainlit app entry point (cold-start regression guard).
+
+Imports src/app/app.py in fresh interpreters under `python -X importtime`, then fails
+(exit 1) if the median cumulative import time exceeds the budget or if any module that
+must stay lazy (pandas, the OpenAI / Databricks SDKs, ...) was imported at startup.
+Prints the slowest imports so regressions are easy to attribute.
+
+Usage: python scripts/check_import_time.py [--max-ms 2000] [--runs 5] [--top 15]
+Run it with the app's dependencies installed (src/app/requirements.txt).
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app")
+
+# Loaded on first use (or by the background warm-up in routes.py), never at import.
+LAZY_MODULES = ("pandas", "numpy", "pyarrow", "openai", "databricks.sdk", "tiktoken")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure(module: str):
+    # Enough configuration for the app modules to import; nothing is contacted.
+    env = {
+        "ENABLE_PASSWORD_AUTH": "true",
+        "DATABRICKS_HOST": "https://example.cloud.databricks.com",
+        "SERVING_ENDPOINT": "import-check",
+        **os.environ,
+    }
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise SystemExit(f"import {module} failed")
+
+    imports = []  # (name, self_us, cumulative_us, depth)
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            imports.append((m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2))
+    total_us = next(cum for name, _, cum, depth in imports if name == module and depth == 0)
+    return total_us, imports
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--max-ms", type=float, default=float(os.environ.get("IMPORT_BUDGET_MS", 2000)))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    measure(args.module)  # warm the bytecode cache; the first run also compiles .pyc files
+    runs = [measure(args.module) for _ in range(args.runs)]
+    totals_ms = [total / 1000 for total, _ in runs]
+    median_ms = statistics.median(totals_ms)
+    imports = runs[-1][1]
+
+    print(f"import {args.module}: median {median_ms:.0f} ms over {args.runs} runs "
+          f"(min {min(totals_ms):.0f}, max {max(totals_ms):.0f}), budget {args.max_ms:.0f} ms\n")
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for name, self_us, cum_us, depth in sorted(imports, key=lambda i: -i[2])[:args.top]:
+        print(f"{cum_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {'  ' * depth}{name}")
+
+    failures = []
+    if median_ms > args.max_ms:
+        failures.append(f"import time {median_ms:.0f} ms exceeds budget {args.max_ms:.0f} ms")
+    imported = {name for name, _, _, _ in imports}
+    for lazy in LAZY_MODULES:
+        if lazy in imported:
+            failures.append(f"{lazy} is imported at startup; import it on first use instead")
+    for f in failures:
+        print(f"FAIL: {f}")
+    if not failures:
+        print("\nOK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
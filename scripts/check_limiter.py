@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Behaviour check for the adaptive MAS concurrency limiter (services/concurrency.py).
+
+Drives AdaptiveLimiter with simulated upstream calls and fails (exit 1) when it misreads
+the endpoint:
+
+  mixed    no load, first byte 50-600 ms depending on the question: the limit must not
+           back off (regression guard: a minimum-latency baseline collapsed it to the floor)
+  loaded   light traffic, then a burst; first byte grows with calls in flight beyond the
+           endpoint's capacity: the latency gradient must back the limit off
+  overload the endpoint answers 429 beyond its capacity: the limit must come down
+
+Usage: python scripts/check_limiter.py [--seconds 6] [--callers 40]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app"))
+
+from services.concurrency import AdaptiveLimiter  # noqa: E402
+
+INITIAL = 16
+
+
+async def simulate(scenario: str, seconds: float, callers: int) -> AdaptiveLimiter:
+    limiter = AdaptiveLimiter(initial=INITIAL, min_limit=2, max_limit=64)
+    capacity = 8
+    in_flight = 0
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+
+    async def caller(i: int) -> None:
+        nonlocal in_flight
+        rng = random.Random(i)
+        if scenario == "loaded" and i >= 4:
+            await asyncio.sleep(seconds / 2)  # the burst joins a settled long window
+        while loop.time() < deadline:
+            async with limiter.slot(f"user{i % 10}") as permit:
+                in_flight += 1
+                try:
+                    if scenario == "mixed":
+                        first_byte = rng.uniform(0.05, 0.6)
+                    else:
+                        first_byte = 0.05 * max(1.0, in_flight / capacity) ** 2
+                    await asyncio.sleep(first_byte)
+                    if scenario == "overload" and in_flight > capacity:
+                        permit.overloaded()
+                        continue
+                    permit.first_byte(first_byte)
+                    await asyncio.sleep(0.05)
+                finally:
+                    in_flight -= 1
+
+    await asyncio.gather(*(caller(i) for i in range(callers)))
+    return limiter
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=6.0)
+    parser.add_argument("--callers", type=int, default=40)
+    args = parser.parse_args()
+
+    failed = False
+    for scenario, ok in (
+        ("mixed", lambda s: s.limit >= INITIAL and not s.latency_backoffs),
+        ("loaded", lambda s: s.latency_backoffs > 0),
+        ("overload", lambda s: s.limit < INITIAL),
+    ):
+        stats = asyncio.run(simulate(scenario, args.seconds, args.callers)).stats()
+        passed = ok(stats)
+        failed |= not passed
+        print(f"{scenario:>9}: limit {INITIAL} -> {stats.limit}, latency backoffs {stats.latency_backoffs}, "
+              f"overloads {stats.overloads}, first byte p50 short/long "
+              f"{stats.first_byte_ms_p50_short:.0f}/{stats.first_byte_ms_p50_long:.0f} ms  "
+              f"{'ok' if passed else 'FAIL'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Offline load test of the chat streaming pipeline against a local mock MAS endpoint.
+
+Starts scripts/mock_mas_server.py in a subprocess, then drives N concurrent simulated
+sessions through MASChatClient -> normalize -> ChainlitStream exactly as routes.on_message
+does. ChainlitStream renders into a headless message sink that records websocket frames.
+
+Reports p50/p95/p99 time-to-first-token and end-to-end latency, tokens/sec, frames,
+driver CPU per token and (with --memory) traced memory per session. Use the --max-*
+thresholds to fail (exit 1) on regressions, e.g. in CI before a deploy.
+
+Usage:
+  python scripts/loadtest_chat.py --sessions 50 --tokens 400 --tokens-per-sec 200
+  python scripts/loadtest_chat.py --scenario error --sessions 20
+  python scripts/loadtest_chat.py --sessions 50 --drop-rate 0.2 --fail-rate 0.1
+  python scripts/loadtest_chat.py --sessions 100 --max-ttft-p95-ms 800 --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "src", "app"))
+
+import mock_mas_server  # noqa: E402
+
+
+class _HeadlessMessage:
+    """Stands in for cl.Message: no websocket, just counts what would be emitted."""
+
+    def __init__(self, content: str = "", elements=None, **kwargs):
+        self.content = content
+        self.elements = elements or []
+        self.frames = 0
+
+    async def send(self):
+        self.frames += 1
+        return self
+
+    async def update(self):
+        self.frames += 1
+        return self
+
+    async def stream_token(self, token: str, is_sequence: bool = False):
+        self.frames += 1
+        self.content += token
+
+
+class _HeadlessDataframe:
+    def __init__(self, df=None, name=None, **kwargs):
+        self.df = df
+        self.name = name
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _run_server(script, port, ready, fail_rate, drop_rate) -> None:
+    asyncio.run(mock_mas_server.serve(script, port=port, ready=ready, fail_rate=fail_rate, drop_rate=drop_rate))
+
+
+def _pct(values, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def run_session(client, identity, ChainlitStream, normalize, ev):
+    messages = [{"role": "user", "content": "Analyze the overall revenue by Segments in 2024"}]
+    started = time.perf_counter()
+    first_token = None
+    errored = False
+    streamed, final = [], None
+    renderer = ChainlitStream()
+    await renderer.start()
+    try:
+        async for event in normalize(client.stream_raw(identity, messages)):
+            if isinstance(event, ev.TextDelta):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                streamed.append(event.delta)
+                await renderer.on_text_delta(event.delta)
+            elif isinstance(event, ev.TextDone):
+                final = event.text
+                errored = errored or event.text.startswith("❌")
+                await renderer.on_text_done(event.text)
+            elif isinstance(event, ev.ToolCall):
+                await renderer.on_tool_call(event.name, event.args)
+            elif isinstance(event, ev.ToolOutput):
+                await renderer.on_tool_output(event.name, event.output)
+    except Exception:
+        errored = True
+        await renderer.flush()
+    frames = sum(m.frames for m in (renderer.status_msg, renderer.text_msg) if m is not None)
+    return {
+        "ttft": first_token,
+        "e2e": time.perf_counter() - started,
+        "tokens": renderer.deltas_received,
+        "frames": frames,
+        "error": errored,
+        # Streamed text that does not match the final answer (e.g. repeated after a retry)
+        "mismatch": final is not None and not errored and "".join(streamed).strip() != final,
+    }
+
+
+async def drive(args) -> dict:
+    # Imported only now: config reads the environment prepared in main().
+    from auth.identity import Identity, PatTokenSource
+    from services import mas_normalizer as ev
+    from services import renderer as renderer_module
+    from services.mas_client import MASChatClient
+
+    renderer_module.cl = types.SimpleNamespace(Message=_HeadlessMessage, Dataframe=_HeadlessDataframe)
+
+    client = MASChatClient()
+    await client.startup()
+    identity = Identity(email="loadtest@example.com", auth_type="pat", token_source=PatTokenSource("mock"))
+    gate = asyncio.Semaphore(args.concurrency or args.sessions)
+
+    async def one():
+        async with gate:
+            return await run_session(client, identity, renderer_module.ChainlitStream, ev.normalize, ev)
+
+    if args.memory:
+        tracemalloc.start()
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(args.sessions)))
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+    if args.memory:
+        tracemalloc.stop()
+    pool = client.pool_stats()
+    limiter = client.limiter_stats()
+    retries = client.retry_stats()
+    await client.aclose()
+
+    ttft = [r["ttft"] * 1000 for r in results if r["ttft"] is not None]
+    e2e = [r["e2e"] * 1000 for r in results]
+    tokens = sum(r["tokens"] for r in results)
+    return {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency or args.sessions,
+        "scenario": args.recording or args.scenario,
+        "errors": sum(r["error"] for r in results),
+        "text_mismatches": sum(r["mismatch"] for r in results),
+        "ttft_ms": {"p50": _pct(ttft, 50), "p95": _pct(ttft, 95), "p99": _pct(ttft, 99)},
+        "e2e_ms": {"p50": _pct(e2e, 50), "p95": _pct(e2e, 95), "p99": _pct(e2e, 99)},
+        "wall_s": wall,
+        "tokens": tokens,
+        "tokens_per_sec": tokens / wall if wall else 0.0,
+        "frames_per_session": statistics.mean(r["frames"] for r in results),
+        "cpu_us_per_token": cpu / tokens * 1e6 if tokens else None,
+        "memory_kb_per_session": peak / args.sessions / 1024 if peak is not None else None,
+        "connections": {"new": pool.new_connections, "reused": pool.reused_connections},
+        "limiter": limiter.model_dump() if limiter else None,
+        "retries": retries.model_dump(),
+    }
+
+
+def report(r: dict) -> None:
+    print(f"\nSessions: {r['sessions']} (concurrency {r['concurrency']}), scenario: {r['scenario']}, errors: {r['errors']}")
+    for key, label in (("ttft_ms", "TTFT"), ("e2e_ms", "End-to-end")):
+        p = r[key]
+        print(f"  {label:<11} p50 {p['p50']:8.1f} ms   p95 {p['p95']:8.1f} ms   p99 {p['p99']:8.1f} ms")
+    print(f"  Throughput  {r['tokens_per_sec']:.0f} tokens/s over {r['wall_s']:.2f} s ({r['tokens']} tokens)")
+    print(f"  Frames      {r['frames_per_session']:.1f} per session")
+    if r["cpu_us_per_token"] is not None:
+        print(f"  CPU         {r['cpu_us_per_token']:.1f} us per token (driver process)")
+    if r["memory_kb_per_session"] is not None:
+        print(f"  Memory      {r['memory_kb_per_session']:.1f} KiB peak traced per session")
+    print(f"  Connections new={r['connections']['new']} reused={r['connections']['reused']}")
+    retries = r["retries"]
+    if retries["retries"] or retries["hedges"]:
+        print(f"  Retries     {retries['retries']} ({retries['resumed']} resumed mid-stream, "
+              f"{retries['exhausted']} gave up), hedges {retries['hedges']}, "
+              f"text mismatches {r['text_mismatches']}")
+    if r["limiter"]:
+        lim = r["limiter"]
+        print(f"  Limiter     limit={lim['limit']} queued={lim['queued_total']} rejected={lim['rejected']} "
+              f"wait avg {lim['wait_ms_avg']:.0f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=0, help="max sessions in flight (0 = all)")
+    parser.add_argument("--memory", action="store_true", help="trace memory per session (slower)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--max-ttft-p95-ms", type=float)
+    parser.add_argument("--max-e2e-p95-ms", type=float)
+    parser.add_argument("--max-cpu-us-per-token", type=float)
+    mock_mas_server.add_arguments(parser)
+    args = parser.parse_args()
+
+    port = _free_port()
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=_run_server,
+        args=(mock_mas_server.script_from_args(args), port, ready, args.fail_rate, args.drop_rate),
+        daemon=True,
+    )
+    server.start()
+    if not ready.wait(10):
+        print("Mock MAS server failed to start")
+        return 2
+
+    os.environ.update({
+        "DATABRICKS_HOST": f"http://127.0.0.1:{port}",
+        "SERVING_ENDPOINT": "mock-mas",
+        "DATABRICKS_TOKEN": "mock",
+        "ENABLE_PASSWORD_AUTH": "true",
+        "ENABLE_HEADER_AUTH": "false",
+    })
+    try:
+        results = asyncio.run(drive(args))
+    finally:
+        server.terminate()
+
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    if args.max_ttft_p95_ms is not None and results["ttft_ms"]["p95"] > args.max_ttft_p95_ms:
+        failures.append(f"TTFT p95 {results['ttft_ms']['p95']:.1f} ms > {args.max_ttft_p95_ms} ms")
+    if args.max_e2e_p95_ms is not None and results["e2e_ms"]["p95"] > args.max_e2e_p95_ms:
+        failures.append(f"E2E p95 {results['e2e_ms']['p95']:.1f} ms > {args.max_e2e_p95_ms} ms")
+    if (args.max_cpu_us_per_token is not None and results["cpu_us_per_token"] is not None
+            and results["cpu_us_per_token"] > args.max_cpu_us_per_token):
+        failures.append(f"CPU {results['cpu_us_per_token']:.1f} us/token > {args.max_cpu_us_per_token}")
+    for f in failures:
+        print(f"REGRESSION: {f}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Local mock of a Databricks serving endpoint's /invocations API for offline load tests.
+
+Serves POST /serving-endpoints/{name}/invocations and streams MAS-style SSE events
+(response.created, function_call / function_call_output items, output_text deltas, the
+final message item, response.completed or response.error) at a configurable rate.
+Uses only the standard library; HTTP/1.1 with keep-alive and chunked responses.
+
+Usage:
+  python scripts/mock_mas_server.py [--port 8099] [--scenario answer|table|error]
+         [--tokens 400] [--tokens-per-sec 200] [--first-byte-ms 300] [--tool-ms 500]
+         [--recording events.jsonl] [--fail-rate 0.1] [--drop-rate 0.1]
+
+--fail-rate answers that share of requests with 503 + Retry-After; --drop-rate cuts that
+share of streams at a random point mid-answer (exercises retries and stream resume).
+
+A recording is a JSONL file of raw MAS events; an optional "_delay_ms" key on an event
+sets the pause before it is sent (the key is stripped).
+"""
+
+import argparse
+import asyncio
+import json
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+# (delay_s_before_event, event)
+Script = List[Tuple[float, Dict[str, Any]]]
+
+_TABLE = (
+    "\n\n| Segment | Revenue | Growth |\n|---|---|---|\n"
+    + "".join(f"| Segment {i} | ${1000 * i:,}.50 | {i * 1.5:.1f}% |\n" for i in range(1, 21))
+    + "\n"
+)
+
+
+def build_script(scenario: str, tokens: int, tokens_per_sec: float, first_byte_ms: float, tool_ms: float) -> Script:
+    gap = 1.0 / tokens_per_sec if tokens_per_sec > 0 else 0.0
+    words = [f"tok{i} " for i in range(tokens)]
+    if scenario == "table":
+        words[tokens // 2:tokens // 2] = [line + "\n" for line in _TABLE.splitlines()]
+    text = "".join(words)
+
+    script: Script = [(first_byte_ms / 1000, {"type": "response.created", "response": {"id": "resp_mock"}})]
+    script.append((0.0, {
+        "type": "response.output_item.done",
+        "item": {"type": "function_call", "name": "genie_space", "arguments": "{}", "call_id": "call_1"},
+    }))
+    script.append((tool_ms / 1000, {
+        "type": "response.output_item.done",
+        "item": {"type": "function_call_output", "call_id": "call_1", "output": "rows: 20"},
+    }))
+    for i, word in enumerate(words):
+        script.append((gap, {"type": "response.output_text.delta", "item_id": "msg_1", "delta": word}))
+        if scenario == "error" and i == len(words) // 2:
+            script.append((0.0, {"type": "response.error", "error": "mock upstream failure"}))
+            return script
+    script.append((0.0, {
+        "type": "response.output_item.done",
+        "item_id": "msg_1",
+        "item": {"type": "message", "content": [{"type": "output_text", "text": text}]},
+    }))
+    script.append((0.0, {
+        "type": "response.completed",
+        "response": {"usage": {"input_tokens": 50, "output_tokens": tokens, "total_tokens": 50 + tokens}},
+    }))
+    return script
+
+
+def load_recording(path: str) -> Script:
+    script: Script = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                ev = json.loads(line)
+                script.append((ev.pop("_delay_ms", 0) / 1000, ev))
+    return script
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    method, path, _ = lines[0].split(" ", 2)
+    headers = {k.strip().lower(): v.strip() for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)}
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path, headers, body
+
+
+def _chunk(data: bytes) -> bytes:
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+async def _stream(writer: asyncio.StreamWriter, script: Script, drop_at: Optional[int] = None) -> bool:
+    """Stream the script; with drop_at, stop before that event without ending the body."""
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+        b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n"
+    )
+    pending = 0.0
+    for i, (delay, ev) in enumerate(script):
+        if i == drop_at:
+            await writer.drain()
+            return False
+        pending += delay
+        # asyncio.sleep is ~1 ms granular; accumulate tiny gaps and sleep in larger steps.
+        if pending >= 0.002:
+            await writer.drain()
+            await asyncio.sleep(pending)
+            pending = 0.0
+        writer.write(_chunk(b"data: " + json.dumps(ev).encode() + b"\n\n"))
+    writer.write(_chunk(b"data: [DONE]\n\n") + b"0\r\n\r\n")
+    await writer.drain()
+    return True
+
+
+def _final_json(script: Script) -> bytes:
+    output = [ev["item"] for _, ev in script if ev.get("type") == "response.output_item.done"]
+    return json.dumps({"id": "resp_mock", "output": output}).encode()
+
+
+def make_handler(script: Script, fail_rate: float = 0.0, drop_rate: float = 0.0):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    method, path, headers, body = await _read_request(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                if method != "POST" or not path.endswith("/invocations"):
+                    writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+                elif random.random() < fail_rate:
+                    writer.write(
+                        b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 0\r\n"
+                        b"Content-Length: 4\r\n\r\nbusy"
+                    )
+                elif json.loads(body or b"{}").get("stream", False):
+                    drop_at = random.randrange(1, len(script)) if random.random() < drop_rate else None
+                    if not await _stream(writer, script, drop_at):
+                        return  # closes the connection mid-body
+                else:
+                    payload = _final_json(script)
+                    writer.write(
+                        b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                        b"Content-Length: %d\r\n\r\n%s" % (len(payload), payload)
+                    )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except ConnectionError:
+            return  # client went away mid-response (cancelled or hedged request)
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(
+    script: Script, host: str = "127.0.0.1", port: int = 8099, ready=None,
+    fail_rate: float = 0.0, drop_rate: float = 0.0,
+) -> None:
+    server = await asyncio.start_server(make_handler(script, fail_rate, drop_rate), host, port, backlog=1024)
+    if ready is not None:
+        ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--scenario", choices=["answer", "table", "error"], default="answer")
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--first-byte-ms", type=float, default=300.0)
+    parser.add_argument("--tool-ms", type=float, default=500.0)
+    parser.add_argument("--recording", help="JSONL file of raw MAS events to replay instead of a scenario")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share of streams cut mid-answer")
+
+
+def script_from_args(args: argparse.Namespace) -> Script:
+    if args.recording:
+        return load_recording(args.recording)
+    return build_script(args.scenario, args.tokens, args.tokens_per_sec, args.first_byte_ms, args.tool_ms)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(f"Mock MAS endpoint on http://{args.host}:{args.port}/serving-endpoints/<name>/invocations")
+    asyncio.run(serve(script_from_args(args), args.host, args.port, fail_rate=args.fail_rate, drop_rate=args.drop_rate))
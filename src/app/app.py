@@ -4,3 +4,4 @@ from typing import Optional, Dict
 from data import layer
 from auth import header, password_auth
 import routes
+import health
@@ -1,52 +1,51 @@
 import chainlit as cl
 from config import settings
 from auth.identity import Identity, OboTokenSource, PatTokenSource
-from typing import Dict
-from utils.logging import logger
+from typing import Optional
+from utils.logging import get_logger
+from auth.identity_store import identity_store, token_from_headers
 
-# Import the global headers from header.py
-from auth.header import _global_headers
+logger = get_logger("auth")
 
-def _headers_getter() -> Dict[str, str]:
-    logger.info("[DEBUG] _headers_getter() called from ensure_identity")
-    
-    # Try to get headers from global storage first
-    user = cl.user_session.get("user")
-    logger.info(f"[DEBUG] User: {user}")
-    if user and user.identifier in _global_headers:
-        headers = _global_headers[user.identifier]
-        logger.info(f"[DEBUG] Found headers in global storage: {list(headers.keys())}")
-        return headers
-    
-    logger.info(f"[DEBUG] Global headers available: {list(_global_headers.keys())}")
-    
-    # Try to get headers from environ (newer Chainlit versions)
+def _session_token() -> Optional[str]:
+    """Forwarded token from the session's connect environ, else its request object."""
     environ = cl.user_session.get("environ")
     if environ:
-        logger.info(f"[DEBUG] Found environ object: {type(environ)}")
-        # Extract HTTP headers from environ
-        headers = {}
-        for key, value in environ.items():
-            if key.startswith('HTTP_'):
-                # Convert HTTP_X_FORWARDED_ACCESS_TOKEN to x-forwarded-access-token
-                header_name = key[5:].lower().replace('_', '-')
-                headers[header_name] = value
-        if headers:
-            logger.info(f"[DEBUG] Extracted headers from environ: {list(headers.keys())}")
-            return headers
-    
+        # WSGI-style keys: x-forwarded-access-token -> HTTP_X_FORWARDED_ACCESS_TOKEN
+        token = token_from_headers({
+            "x-forwarded-access-token": environ.get("HTTP_X_FORWARDED_ACCESS_TOKEN"),
+            "authorization": environ.get("HTTP_AUTHORIZATION"),
+        })
+        if token:
+            return token
     # Fallback to request object (might be None on Databricks)
     request = cl.user_session.get("request")
-    logger.info(f"[DEBUG] Request object: {request}")
     if request is None:
-        logger.warning("[DEBUG] Request object is None, returning empty headers")
-        return {}
-    return request.headers or {}
+        return None
+    return token_from_headers(request.headers or {})
+
+
+async def _obo_token_source(email: str) -> OboTokenSource:
+    # The session's own headers are read once, and only if header auth did not store a token
+    if await identity_store.load(email) is None:
+        token = _session_token()
+        if token:
+            await identity_store.publish(email, token)
+        else:
+            logger.warning("No forwarded token available for %s", email)
+    return OboTokenSource(
+        lambda: identity_store.get(email),
+        refresh_before_s=settings.identity_refresh_before_s,
+    )
 
 
-async def ensure_identity():
+async def ensure_identity() -> Optional[Identity]:
+    """The session's Identity, built on the first call (chat start/resume) and reused for every message."""
     identity = cl.user_session.get("identity")
     if identity:
+        if identity.auth_type == "obo" and identity.token_source.expiring():
+            # The shared tier (if any) may hold a newer token for this user
+            await identity_store.load(identity.email, refresh=True)
         return identity
 
     user = cl.user_session.get("user")
@@ -54,35 +53,20 @@ async def ensure_identity():
         logger.warning("User not found for this session. Please login again.")
         return None
 
-    display_name = user.display_name
-    logger.info(f"[DEBUG] User object: {user}")
-    logger.info(f"[DEBUG] User metadata: {user.metadata if hasattr(user, 'metadata') else 'No metadata'}")
-    
-    # Try to access all session keys to see what's available
-    session_keys = list(cl.user_session.keys()) if hasattr(cl.user_session, 'keys') else []
-    logger.info(f"[DEBUG] Available session keys: {session_keys}")
-    
-    # Try to access environ directly
-    environ = cl.user_session.get("environ")
-    if environ:
-        logger.info(f"[DEBUG] Environ keys: {list(environ.keys())}")
-        # Look for any HTTP headers in environ
-        for key, value in environ.items():
-            if 'token' in key.lower() or 'auth' in key.lower() or key.startswith('HTTP_'):
-                logger.info(f"[DEBUG] Potential auth header: {key} = {value[:20]}...")
-
     if settings.enable_password_auth:
         auth_type = "pat"
         token_source = PatTokenSource(settings.pat)
     else:
         auth_type = "obo"
-        token_source = OboTokenSource(_headers_getter)
+        token_source = await _obo_token_source(user.identifier)
 
-    cl.user_session.set("identity", Identity(
+    identity = Identity(
         email=user.identifier,  # Set email to the user identifier
-        display_name=display_name,
+        display_name=user.display_name,
         auth_type=auth_type,
         token_source=token_source
-    ))
+    )
+    cl.user_session.set("identity", identity)
 
-    logger.info(f"Identity: {cl.user_session.get('identity')}")
+    logger.info("Identity established for %s (%s)", user.identifier, auth_type)
+    return identity
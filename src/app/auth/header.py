@@ -1,39 +1,21 @@
 import chainlit as cl
 from config import settings
 from typing import Dict, Optional
-from utils.logging import logger
-from auth.identity import OboTokenSource, Identity
+from utils.logging import get_logger
+from auth.identity_store import identity_store, token_from_headers
 
-# Global storage for headers - workaround for Chainlit context issue
-_global_headers = {}
-
-def _headers_getter() -> Dict[str, str]:
-    # Try to get headers from global storage first
-    user = cl.user_session.get("user")
-    if user and user.identifier in _global_headers:
-        return _global_headers[user.identifier]
-    
-    # Fallback to request object (might be None on Databricks)
-    request = cl.user_session.get("request")
-    if request is None:
-        return {}
-    return request.headers or {}
+logger = get_logger("auth")
 
 
 if settings.enable_header_auth:
     logger.info("[AUTH] Header auth is ENABLED - registering callback")
     
     @cl.header_auth_callback
-    def auth_from_header(headers: Dict[str, str]) -> Optional[cl.User]:
-        logger.info(f"[AUTH] *** HEADER_AUTH_CALLBACK CALLED ***")
-        logger.info(f"[AUTH] Received headers count: {len(headers)}")
-        logger.info(f"[AUTH] Received headers: {list(headers.keys())}")
-        logger.info(f"[AUTH] All headers: {headers}")
+    async def auth_from_header(headers: Dict[str, str]) -> Optional[cl.User]:
+        # Header names only: the values include the user's forwarded access token.
+        logger.debug("[AUTH] Header auth callback, %d headers: %s", len(headers), list(headers.keys()))
         
-        # Try different possible header names for the token
-        token = (headers.get("x-forwarded-access-token") or 
-                headers.get("X-Forwarded-Access-Token") or
-                headers.get("authorization"))
+        token = token_from_headers(headers)
         
         # Try different possible header names for email/user
         email = (headers.get("x-forwarded-email") or 
@@ -41,14 +23,11 @@ if settings.enable_header_auth:
                 headers.get("x-forwarded-user") or 
                 headers.get("X-Forwarded-User"))
         
-        logger.info(f"[AUTH] Token found: {'Yes' if token else 'No'}")
-        logger.info(f"[AUTH] Email found: {email}")
-        
         if token and email:
-            logger.info(f"[AUTH] Header auth success: {email}")
+            logger.info("[AUTH] Header auth success: %s", email)
 
-            # Store headers in global storage for later use
-            _global_headers[email] = headers
+            # Keep the forwarded token for MAS calls (Chainlit sessions do not expose the headers)
+            await identity_store.publish(email, token)
 
             user = cl.User(
                 identifier=email,
@@ -60,8 +39,9 @@ if settings.enable_header_auth:
             return user
 
         logger.warning(
-            "[AUTH] Header auth failed — rejecting request (no fallback in Databricks App)")
-        logger.warning(f"[AUTH] Available headers: {list(headers.keys())}")
+            "[AUTH] Header auth failed (token=%s, email=%s) — rejecting request (no fallback in Databricks App); headers: %s",
+            bool(token), bool(email), list(headers.keys()),
+        )
         return None  # No fallback inside Databricks app
 else:
     logger.info("Not running on Databricks — skipping header auth")
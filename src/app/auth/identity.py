@@ -1,17 +1,37 @@
+import time
 from pydantic import BaseModel, Field
-from typing import Any, Protocol, Optional, Callable, Dict, Literal
+from typing import Any, Protocol, Optional, Callable, Literal
+from auth.identity_store import CachedIdentity
 
 class TokenSource(Protocol):
     def bearer_token(self) -> str: ...
 
 
 class OboTokenSource(TokenSource):
-    def __init__(self, headers_getter: Callable[[], Dict[str, str]]):
-        self._headers_getter = headers_getter
-
-    def bearer_token(self) -> str:
-        h = self._headers_getter() or {}
-        return h.get("x-forwarded-access-token")
+    """
+    The user's forwarded token, memoized with its expiry (decoded once, when the token is
+    stored). `resolve` (a store lookup) runs again only once the token is within
+    `refresh_before_s` of expiring, to pick up the newer token the user's next request
+    forwarded; until it expires the current one is kept if nothing newer is there.
+    """
+
+    def __init__(self, resolve: Callable[[], Optional[CachedIdentity]], refresh_before_s: float = 60.0):
+        self._resolve = resolve
+        self._refresh_before_s = refresh_before_s
+        self._cached: Optional[CachedIdentity] = None
+
+    def expiring(self) -> bool:
+        """No token yet, or the current one is within `refresh_before_s` of expiring."""
+        return self._cached is None or time.time() >= self._cached.expires_at - self._refresh_before_s
+
+    def bearer_token(self) -> Optional[str]:
+        cached = self._cached
+        if cached is None or time.time() >= cached.expires_at - self._refresh_before_s:
+            cached = self._resolve() or cached
+            self._cached = cached
+            if cached is None or time.time() >= cached.expires_at:
+                return None
+        return cached.token
 
 
 class PatTokenSource(TokenSource):
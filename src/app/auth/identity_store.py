@@ -0,0 +1,181 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Protocol, Tuple
+from pydantic import BaseModel
+from config import settings
+from utils.logging import get_logger
+
+logger = get_logger("auth")
+
+
+def token_expiry(token: Optional[str]) -> Optional[float]:
+    """`exp` (epoch seconds) of a JWT access token, or None for opaque/unreadable tokens."""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def token_from_headers(headers: Dict[str, str]) -> Optional[str]:
+    token = (headers.get("x-forwarded-access-token") or
+             headers.get("X-Forwarded-Access-Token") or
+             headers.get("authorization"))
+    if token and token[:7].lower() == "bearer ":
+        token = token[7:]
+    return token
+
+
+class IdentityBackend(Protocol):
+    """Tier shared by app workers behind the in-process store (SHARED_STATE=memory in tests)."""
+
+    async def get(self, email: str) -> Optional[Tuple[str, float]]: ...
+
+    async def set(self, email: str, token: str, expires_at: float) -> None: ...
+
+
+class CachedIdentity:
+    __slots__ = ("email", "token", "expires_at")
+
+    def __init__(self, email: str, token: str, expires_at: float):
+        self.email = email
+        self.token = token
+        self.expires_at = expires_at
+
+
+class IdentityStoreStats(BaseModel):
+    users: int = 0
+    capacity: int = 0
+    stores: int = 0
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evicted: int = 0
+    shared_hits: int = 0
+    shared_errors: int = 0
+
+
+class IdentityStore:
+    """
+    Forwarded identities (email and OBO access token) by user, replacing a dict of every
+    user's full request headers that was never cleaned up.
+
+    Only the two fields the app uses are kept. An entry lives until its token expires
+    (JWT `exp`, otherwise `ttl_s` after it was stored; `ttl_s` also caps `exp`), so an
+    expired token is never handed out, and the least recently used entries are dropped
+    beyond `capacity`, so memory stays flat however many users sign in. The lock keeps it
+    safe to use from worker threads as well as the event loop.
+
+    With a shared IdentityBackend attached, tokens received at login are published to it,
+    and a store that has no (or only an expiring) token for a user loads it from there.
+    Deployments attach none: tokens are never persisted outside the process.
+    """
+
+    _SWEEP_INTERVAL_S = 60.0
+
+    def __init__(self, capacity: int, ttl_s: float):
+        self._capacity = capacity
+        self._ttl_s = ttl_s
+        self._entries: "OrderedDict[str, CachedIdentity]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = IdentityStoreStats(capacity=capacity)
+        self._next_sweep = 0.0
+        self._shared: Optional[IdentityBackend] = None
+
+    def attach(self, shared: Optional[IdentityBackend]) -> None:
+        self._shared = shared
+
+    def put(self, email: str, token: str, expires_at: Optional[float] = None) -> Optional[CachedIdentity]:
+        """Store (or refresh) a user's identity; returns None if the token is already expired."""
+        now = time.time()
+        if expires_at is None:
+            expires_at = now + self._ttl_s
+            exp = token_expiry(token)
+            if exp is not None:
+                expires_at = min(expires_at, exp)
+        if expires_at <= now:
+            logger.warning("Forwarded token for %s is already expired; not cached", email)
+            return None
+        entry = CachedIdentity(email, token, expires_at)
+        with self._lock:
+            self._entries[email] = entry
+            self._entries.move_to_end(email)
+            self._stats.stores += 1
+            if len(self._entries) > self._capacity:
+                self._evict(now)
+        return entry
+
+    def get(self, email: Optional[str]) -> Optional[CachedIdentity]:
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            if entry.expires_at <= time.time():
+                del self._entries[email]
+                self._stats.expired += 1
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(email)
+            self._stats.hits += 1
+            return entry
+
+    def token(self, email: Optional[str]) -> Optional[str]:
+        entry = self.get(email)
+        return entry.token if entry is not None else None
+
+    async def publish(self, email: str, token: str) -> Optional[CachedIdentity]:
+        """put(), and hand the token to the other workers through the shared tier."""
+        entry = self.put(email, token)
+        if entry is not None and self._shared is not None:
+            try:
+                await self._shared.set(email, token, entry.expires_at)
+            except Exception as e:
+                self._stats.shared_errors += 1
+                logger.warning("Shared identity write for %s failed: %s", email, e)
+        return entry
+
+    async def load(self, email: str, refresh: bool = False) -> Optional[CachedIdentity]:
+        """The user's identity, from the shared tier when it is missing here (or `refresh`)."""
+        entry = self.get(email)
+        if self._shared is None or (entry is not None and not refresh):
+            return entry
+        try:
+            shared = await self._shared.get(email)
+        except Exception as e:
+            self._stats.shared_errors += 1
+            logger.warning("Shared identity read for %s failed: %s", email, e)
+            return entry
+        if shared is None or (entry is not None and shared[1] <= entry.expires_at):
+            return entry
+        self._stats.shared_hits += 1
+        return self.put(email, shared[0], shared[1]) or entry
+
+    def discard(self, email: str) -> None:
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def _evict(self, now: float) -> None:
+        # At capacity, drop expired entries before live ones; the full scan runs at most once
+        # a minute, otherwise this is a plain O(1) LRU eviction.
+        if now >= self._next_sweep:
+            self._next_sweep = now + self._SWEEP_INTERVAL_S
+            for email in [e for e, entry in self._entries.items() if entry.expires_at <= now]:
+                del self._entries[email]
+                self._stats.expired += 1
+        while len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
+            self._stats.evicted += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> IdentityStoreStats:
+        return self._stats.model_copy(update={"users": len(self._entries)})
+
+
+identity_store = IdentityStore(settings.identity_cache_max_users, settings.identity_ttl_s)
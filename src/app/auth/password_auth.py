@@ -1,10 +1,12 @@
 import chainlit as cl
 from config import settings
-from utils.logging import logger
+from utils.logging import get_logger
 from typing import Optional
 from auth.identity import PatTokenSource, Identity
 from config import settings
 
+logger = get_logger("auth")
+
 users = {
     "admin": "admin",
     "tester": "tester",
@@ -14,7 +16,7 @@ if settings.enable_password_auth:
     @cl.password_auth_callback
     def auth_from_password(username: str, password: str) -> Optional[cl.User]:
         if (username, password) in users.items():
-            logger.info(f"[AUTH] Password auth success for user: {username}")
+            logger.info("[AUTH] Password auth success for user: %s", username)
             
             user = cl.User(
                 identifier=username,
@@ -25,7 +27,7 @@ if settings.enable_password_auth:
             )
             return user
 
-        logger.warning(f"[AUTH] Password auth failed for user: {username}")
+        logger.warning("[AUTH] Password auth failed for user: %s", username)
         return None
 else:
     logger.info("Password auth is disabled")
\ No newline at end of file
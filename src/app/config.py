@@ -1,15 +1,31 @@
+from pydantic import Field
 from pydantic_settings import BaseSettings
-from utils.logging import logger
-from dotenv import load_dotenv
-from typing import Optional, List, Dict
+from utils.logging import configure_logging, logger
+from typing import Optional, List, Dict, Literal
 
 import os
-load_dotenv()
+
+# Local development reads a .env file; deployed apps get their environment from app.yaml,
+# so python-dotenv is only imported when there is a file to load.
+_env_file = next(
+    (p for p in (os.path.join(os.getcwd(), ".env"), os.path.join(os.path.dirname(__file__), ".env"))
+     if os.path.isfile(p)),
+    None,
+)
+if _env_file:
+    from dotenv import load_dotenv
+    load_dotenv(_env_file)
 
 
 class Settings(BaseSettings):
     enable_header_auth: bool = False
     enable_password_auth: bool = True
+    # Forwarded OBO tokens kept per user: evicted at the token's own expiry (JWT `exp`, else
+    # after IDENTITY_TTL_S, which also caps it) and least-recently-used beyond the capacity
+    identity_cache_max_users: int = 5000
+    identity_ttl_s: float = 3600.0
+    # A session's memoized token is re-resolved from the store only this close to its expiry
+    identity_refresh_before_s: float = 60.0
 
     # Lakebase
     pg_database_instance: Optional[str] = None
@@ -18,10 +34,40 @@ class Settings(BaseSettings):
     pg_user: Optional[str] = None
     pg_database: Optional[str] = None
     pg_sslmode: Optional[str] = "require"
+    # Renew the OAuth token in the background once it has less than this left
+    pg_token_refresh_before_s: int = 600
+    pg_token_retry_max_s: float = 30.0
+    # Data layer connection pool (recycle stays below the ~1h OAuth token lifetime)
+    pg_pool_size: int = 5
+    pg_max_overflow: int = 10
+    pg_pool_timeout_s: float = 30.0
+    pg_pool_recycle_s: int = 2700
+    pg_pool_pre_ping: bool = True
+    pg_pool_prewarm: int = 2
+    pg_pool_stats_interval_s: int = 300
+    # Write-behind step persistence: creates/updates are coalesced per step and written as
+    # batched upserts at turn end, after this delay, or once this many steps are pending
+    # (0 ms = write each step immediately, as SQLAlchemyDataLayer does)
+    pg_write_behind_ms: int = 500
+    pg_write_behind_max_steps: int = 200
+    # Schema migrations (data/migrations.py) at startup; timestamptz conversion is opt-in
+    pg_run_migrations: bool = True
+    pg_migrate_timestamptz: bool = False
+
+    # Readable secondary for thread list, resume and feedback reads: PG_REPLICA_HOST, or the
+    # instance's read_only_dns when it has readable secondaries. Reads fall back to the primary
+    # when the replica is unhealthy, may be more than PG_REPLICA_MAX_STALENESS_S behind, or
+    # has not yet replayed this process's own writes to the thread/user being read
+    pg_read_replica: bool = True
+    pg_replica_host: Optional[str] = None
+    pg_replica_max_staleness_s: float = 5.0
 
     @property
     def pg_connection_string(self) -> str:
-        return f"postgresql+psycopg://{self.pg_user}:@{self.pg_host}:{self.pg_port}/{self.pg_database}?sslmode={self.pg_sslmode}"
+        return self.pg_connection_string_for(self.pg_host)
+
+    def pg_connection_string_for(self, host: Optional[str]) -> str:
+        return f"postgresql+psycopg://{self.pg_user}:@{host}:{self.pg_port}/{self.pg_database}?sslmode={self.pg_sslmode}"
 
     @property
     def log_database_instance(self) -> str:
@@ -33,9 +79,45 @@ class Settings(BaseSettings):
 
     # Serving Endopints
     agent_endpoint: Optional[str] = None
+
+    # HTTP transport to serving endpoints (shared pool)
+    http_timeout_s: int = 180
+    # Finer-grained limits: TCP/TLS connect, the longest gap between streamed chunks, and the
+    # wait for the first event of an answer (http_timeout_s still bounds writes and pool waits)
+    http_connect_timeout_s: float = 10.0
+    http_read_timeout_s: float = 180.0
+    http_first_byte_timeout_s: float = 120.0
+    http2_enabled: bool = True
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry_s: float = 60.0
+
+    # Adaptive (AIMD) limit on concurrent MAS calls per process, driven by 429/503 responses,
+    # first-byte timeouts and a sustained rise in time to first byte under load. Calls over
+    # the limit wait in a per-user round-robin queue and see their position in the status
+    # card; MAS_CONCURRENCY_PER_USER > 0 caps slots per user. Off by default; enable it for
+    # endpoints that push back under load (429/503). It starts at the HTTP pool size, so a
+    # healthy endpoint is never held below what the pool would allow anyway
+    mas_concurrency_enabled: bool = False
+    mas_concurrency_initial: int = 100
+    mas_concurrency_min: int = 2
+    mas_concurrency_max: int = 100
+    mas_concurrency_per_user: int = 0
+    mas_latency_tolerance: float = 3.0
+    mas_queue_max: int = 200
+    mas_queue_timeout_s: float = 120.0
+    # Retries of failed MAS calls (connect errors, 429/5xx, streams dropped mid-answer) with
+    # exponential backoff and full jitter; a resumed stream skips text already shown.
+    # MAS_HEDGE_AFTER_S > 0 starts a second request when the first has sent nothing by then
+    mas_retry_attempts: int = 2
+    mas_retry_backoff_s: float = 0.5
+    mas_retry_backoff_max_s: float = 8.0
+    mas_hedge_after_s: float = 0.0
+
     @property
     def agent_base_url(self) -> str:
-        if self.databricks_host.startswith("https://"):
+        # An explicit scheme is kept (http:// lets scripts/loadtest_chat.py target a local mock)
+        if self.databricks_host.startswith(("https://", "http://")):
             return f"{self.databricks_host}/serving-endpoints"
         else:
             return f"https://{self.databricks_host}/serving-endpoints"
@@ -43,9 +125,66 @@ class Settings(BaseSettings):
 
     # Chat 
     history_max_turns: int = 10
+    history_max_tokens: int = 30000
+    history_tokenizer: str = "o200k_base"
+    # Budget used instead of history_max_tokens when no tokenizer is available
     history_max_chars: int = 120000
 
-    chat_starter_messages: List[Dict[str, str]] = [
+    # Response cache for repeated questions (scope "user" = per identity, "global" = shared).
+    # Single-flight coalescing of identical in-flight requests uses the same scope.
+    response_cache_enabled: bool = True
+    response_cache_ttl_s: int = 900
+    response_cache_max_entries: int = 256
+    response_cache_scope: Literal["user", "global"] = "user"
+    response_cache_persistent: bool = False
+    single_flight_enabled: bool = True
+
+    # Streaming: coalesce text deltas into fewer websocket frames (0 ms disables batching)
+    stream_flush_interval_ms: int = 40
+    stream_max_batch_chars: int = 512
+    # Attach each extracted result table as a Parquet download (requires pyarrow)
+    table_parquet_export: bool = False
+    # CPU-heavy post-processing (table DataFrames, Parquet export) runs in a bounded pool
+    # ("thread" or "process"; "off" keeps it on the event loop) once a table has at least
+    # CPU_OFFLOAD_MIN_CELLS cells; smaller work stays inline
+    cpu_offload: Literal["off", "thread", "process"] = "thread"
+    cpu_offload_workers: int = 2
+    cpu_offload_min_cells: int = 2000
+    cpu_offload_max_pending: int = 16
+    # Event-loop watchdog: lag is sampled every LOOP_LAG_INTERVAL_MS (0 disables). When the
+    # loop is LOOP_STALL_MS overdue a watchdog thread captures its stack and the chat turn
+    # that was running; the LOOP_STALL_WORST longest stalls are kept and written to
+    # TRACE_DUMP_DIR/loop_stalls.json on SIGUSR1 and at shutdown
+    loop_lag_interval_ms: int = 50
+    loop_stall_ms: int = 100
+    loop_stall_worst: int = 20
+    # Logging: JSON lines via a background thread. LOG_SAMPLING / LOG_RATE_LIMITS are JSON
+    # objects keyed by category (logger "app.<category>"), e.g. '{"stream": 0.01}' keeps 1%
+    # of sub-WARNING stream records and '{"auth": 5}' allows 5 records/s
+    log_level: str = "INFO"
+    log_format: Literal["json", "text"] = "json"
+    log_sampling: Dict[str, float] = {}
+    log_rate_limits: Dict[str, float] = {}
+    log_queue_size: int = 10000
+
+    # Per-turn latency tracing (spans mirrored to OpenTelemetry when opentelemetry-api is
+    # installed); TRACE_DUMP_DIR writes traces.jsonl and latency_histograms.json locally
+    tracing_enabled: bool = True
+    trace_dump_dir: Optional[str] = None
+    trace_max_users: int = 500
+    trace_recent: int = 200
+
+    # Import deferred modules (pandas, tokenizer) in the background once the app has started
+    warm_lazy_imports: bool = True
+
+    # Multi-worker mode (python multiworker.py): APP_WORKERS Chainlit processes behind a
+    # sticky proxy. SHARED_STATE picks the tier shared between processes: "lakebase" (the
+    # response cache; the launcher's default when unset), "memory" (process-local, for
+    # tests; also shares identities), "none" keeps only the in-process tiers
+    app_workers: int = 1
+    shared_state: Optional[Literal["none", "memory", "lakebase"]] = None
+
+    chat_starter_messages: List[Dict[str, str]] = Field(repr=False, default=[
         {"label": "Revenue Analytics", "message": "Analyze the overall revenue by Segments in 2024"}, 
         {"label": "Route Performance", "message": "Analyze the performance of FLL to LAS in 2024"},
         {"label": "Customer Segments", "message": "What are the key customer segments and their lifetime values?"},
@@ -54,10 +193,10 @@ class Settings(BaseSettings):
         {"label": "Product Performance", "message": "What are the top performing product categories this month?"},
         {"label": "Channel Analysis", "message": "Compare sales performance across different channels"},
         {"label": "Stockout Analysis", "message": "Show me products with recent stockout events and revenue impact"}
-    ]
+    ])
 
     # Local Only
-    pat: Optional[str] = None
+    pat: Optional[str] = Field(default=None, repr=False)
 
     @property
     def is_valid(self) -> bool:
@@ -94,13 +233,18 @@ env_vars = {
     'pat': os.getenv("DATABRICKS_TOKEN"),
 }
 
-print(f"Environment Variables: {env_vars}")
-
 # Filter out None values to use defaults
 filtered_vars = {k: v for k, v in env_vars.items() if v is not None}
 
 settings = Settings(
     **filtered_vars
 )
+configure_logging(
+    level=settings.log_level,
+    fmt=settings.log_format,
+    sampling=settings.log_sampling,
+    rate_limits=settings.log_rate_limits,
+    queue_size=settings.log_queue_size,
+)
 
-logger.info(f"Settings: {settings}")
\ No newline at end of file
+logger.info("Settings: %s", settings)
\ No newline at end of file
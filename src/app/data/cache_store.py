@@ -0,0 +1,75 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from data.lakebase import create_sync_engine
+from utils.logging import logger
+
+_CREATE_SQL = text('''
+CREATE TABLE IF NOT EXISTS response_cache (
+    "key" TEXT PRIMARY KEY,
+    "events" JSONB NOT NULL,
+    "createdAt" TIMESTAMPTZ NOT NULL DEFAULT now(),
+    "expiresAt" TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS response_cache_expires_idx ON response_cache ("expiresAt");
+''')
+
+_GET_SQL = text('''
+SELECT "events" FROM response_cache WHERE "key" = :key AND "expiresAt" > now()
+''')
+
+_SET_SQL = text('''
+INSERT INTO response_cache ("key", "events", "expiresAt")
+VALUES (:key, CAST(:events AS JSONB), now() + make_interval(secs => :ttl_s))
+ON CONFLICT ("key") DO UPDATE
+SET "events" = EXCLUDED."events", "createdAt" = now(), "expiresAt" = EXCLUDED."expiresAt"
+''')
+
+_PURGE_SQL = text('''
+DELETE FROM response_cache WHERE "expiresAt" <= now()
+''')
+
+
+class LakebaseCacheStore:
+    '''
+    Persistent response-cache tier in Lakebase, shared by every app instance.
+    Uses a sync SQLAlchemy engine run in a worker thread so the event loop never blocks on I/O.
+    '''
+
+    def __init__(self):
+        self._engine = create_sync_engine()
+        self._ready = False
+
+    def _ensure_table(self) -> None:
+        if self._ready:
+            return
+        with self._engine.begin() as conn:
+            conn.execute(_CREATE_SQL)
+        self._ready = True
+
+    def _get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        self._ensure_table()
+        with self._engine.connect() as conn:
+            row = conn.execute(_GET_SQL, {"key": key}).first()
+        return row[0] if row else None
+
+    def _set(self, key: str, events: List[Dict[str, Any]], ttl_s: int) -> None:
+        self._ensure_table()
+        with self._engine.begin() as conn:
+            conn.execute(_SET_SQL, {"key": key, "events": json.dumps(events), "ttl_s": ttl_s})
+
+    def purge_expired(self) -> int:
+        self._ensure_table()
+        with self._engine.begin() as conn:
+            deleted = conn.execute(_PURGE_SQL).rowcount
+        logger.info(f"Response cache purge: {deleted} expired rows")
+        return deleted
+
+    async def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, events: List[Dict[str, Any]], ttl_s: int) -> None:
+        await asyncio.to_thread(self._set, key, events, ttl_s)
@@ -1,18 +1,21 @@
-from dataclasses import field
 from config import settings
 from utils.logging import logger
-from databricks.sdk import WorkspaceClient
-from databricks.sdk.core import Config
 from pydantic import BaseModel, field_validator
-from threading import Lock
-from typing import Optional
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, Optional
 from datetime import datetime, timedelta, timezone
+import random
+import time
 import uuid
 
+if TYPE_CHECKING:
+    from databricks.sdk import WorkspaceClient
+
 
 class Credential(BaseModel):
     token: str
     expiration_time: datetime
+    issued_at: datetime = datetime.min.replace(tzinfo=timezone.utc)
 
     @field_validator("expiration_time")
     @classmethod
@@ -23,27 +26,158 @@ class Credential(BaseModel):
         return self.expiration_time - datetime.now(timezone.utc)
 
 
+class CredentialStats(BaseModel):
+    refreshes: int = 0
+    failures: int = 0
+    blocking_refreshes: int = 0
+    last_refresh_ms: float = 0.0
+    avg_refresh_ms: float = 0.0
+    token_age_s: Optional[float] = None
+    valid_for_s: Optional[float] = None
+
+
 class LakebaseCredentialProvider:
-    def __init__(self):
+    '''
+    Lakebase OAuth credentials for the SQLAlchemy `do_connect` hook.
+
+    A background thread renews the token once its remaining validity drops below
+    `refresh_before`, retrying with jittered exponential backoff on failure, so the hot path
+    is a plain attribute read with no lock and no network call. Only when there is no usable
+    token at all (cold start, or the refresher kept failing) does a caller mint one inline.
+    One WorkspaceClient is reused for every refresh.
+    '''
+
+    # Never hand out a token this close to expiry, even if the refresher is behind.
+    MIN_VALIDITY = timedelta(minutes=1)
+
+    def __init__(
+        self,
+        refresh_before: timedelta = timedelta(seconds=settings.pg_token_refresh_before_s),
+        retry_max_s: float = settings.pg_token_retry_max_s,
+    ):
         self.lock = Lock()
         self._cached: Optional[Credential] = None
+        self._workspace_client: Optional["WorkspaceClient"] = None
+        self._refresh_before = max(refresh_before, self.MIN_VALIDITY)
+        self._retry_max_s = retry_max_s
+        self._wake = Event()
+        self._stop = Event()
+        self._refresher: Optional[Thread] = None
+        self._stats = CredentialStats()
+        self._refresh_total_s = 0.0
+
+    def _client(self) -> "WorkspaceClient":
+        if self._workspace_client is None:
+            # Imported here: the SDK is slow to import and only needed once a token is minted.
+            from databricks.sdk import WorkspaceClient
+
+            self._workspace_client = WorkspaceClient()
+        return self._workspace_client
 
-    def _client(self) -> WorkspaceClient:
-        return WorkspaceClient()
+    # ---------- Hot path ----------
 
     def get_credential(self) -> Credential:
+        cred = self._cached
+        if cred is not None:
+            remaining = cred.valid_for()
+            if remaining > self.MIN_VALIDITY:
+                if remaining <= self._refresh_before:
+                    self._wake.set()  # refresher is behind; nudge it, keep serving this token
+                return cred
+
         with self.lock:
-            if self._cached and self._cached.valid_for() > timedelta(minutes=1):
-                return self._cached
-            
-            w = self._client()
-            request_id = str(uuid.uuid4())
-            cred = w.database.generate_database_credential(
-                request_id=request_id, instance_names=[settings.pg_database_instance]
-                )
-            self._cached = Credential(token=cred.token, expiration_time=cred.expiration_time)
-            return self._cached
-    
+            cred = self._cached
+            if cred is not None and cred.valid_for() > self.MIN_VALIDITY:
+                return cred
+            self._stats.blocking_refreshes += 1
+            return self._refresh_locked()
+
+    def database_instance(self):
+        '''Instance metadata (read-write / read-only DNS, readable secondaries) via the shared client.'''
+        return self._client().database.get_database_instance(name=settings.pg_database_instance)
+
     def invalidate(self) -> None:
         with self.lock:
-            self._cached = None
\ No newline at end of file
+            self._cached = None
+        self._wake.set()
+
+    # ---------- Refresh ----------
+
+    def _refresh_locked(self) -> Credential:
+        started = time.perf_counter()
+        try:
+            cred = self._client().database.generate_database_credential(
+                request_id=str(uuid.uuid4()), instance_names=[settings.pg_database_instance]
+            )
+        except Exception:
+            self._stats.failures += 1
+            raise
+        elapsed = time.perf_counter() - started
+        self._cached = Credential(
+            token=cred.token,
+            expiration_time=cred.expiration_time,
+            issued_at=datetime.now(timezone.utc),
+        )
+        self._stats.refreshes += 1
+        self._refresh_total_s += elapsed
+        self._stats.last_refresh_ms = round(elapsed * 1000, 2)
+        self._stats.avg_refresh_ms = round(self._refresh_total_s / self._stats.refreshes * 1000, 2)
+        logger.info(f"Lakebase credential refreshed in {self._stats.last_refresh_ms} ms")
+        return self._cached
+
+    def _seconds_until_refresh(self) -> float:
+        cred = self._cached
+        if cred is None:
+            return 0.0
+        return max((cred.valid_for() - self._refresh_before).total_seconds(), 0.0)
+
+    def _run(self) -> None:
+        attempt = 0
+        while not self._stop.is_set():
+            if attempt:
+                # Full jitter: spreads retries from many app instances hitting the same API.
+                delay = random.uniform(0, min(self._retry_max_s, 2 ** attempt))
+            else:
+                # Small jitter so replicas started together do not refresh in lockstep.
+                delay = self._seconds_until_refresh() * random.uniform(0.9, 1.0)
+            self._wake.wait(timeout=delay)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if self._seconds_until_refresh() > 0:
+                attempt = 0
+                continue
+            try:
+                with self.lock:
+                    self._refresh_locked()
+                attempt = 0
+            except Exception as e:
+                attempt += 1
+                logger.warning(f"Lakebase credential refresh failed (attempt {attempt}): {e}")
+
+    def start(self) -> None:
+        '''Start the background refresher (idempotent).'''
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._stop.clear()
+        self._refresher = Thread(target=self._run, name="lakebase-credential-refresh", daemon=True)
+        self._refresher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=5)
+            self._refresher = None
+
+    # ---------- Metrics ----------
+
+    def stats(self) -> CredentialStats:
+        cred = self._cached
+        update = {}
+        if cred is not None:
+            update = {
+                "token_age_s": round((datetime.now(timezone.utc) - cred.issued_at).total_seconds(), 1),
+                "valid_for_s": round(cred.valid_for().total_seconds(), 1),
+            }
+        return self._stats.model_copy(update=update)
@@ -1,44 +1,461 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import time
 from config import settings
 from utils.logging import logger
+from pydantic import BaseModel
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 from sqlalchemy import create_engine, text, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from chainlit.data.sql_alchemy import SQLAlchemyDataLayer
+from chainlit.data.utils import queue_until_user_message
 from data.credentials import LakebaseCredentialProvider
+from data.replica import ReplicaRouter, ReplicaStats
+from data.write_behind import StepWriteBuffer, WriteBehindStats
+
+if TYPE_CHECKING:
+    from chainlit.step import StepDict
 
 _credential_provider = LakebaseCredentialProvider()
+_data_layer: Optional["LakebaseDataLayer"] = None
+_stats_task: Optional[asyncio.Task] = None
+_replica_task: Optional[asyncio.Task] = None
+_migrations_task: Optional[asyncio.Task] = None
+# Thread/user keys of the read running in this task that may be served by the replica
+_replica_read_keys: contextvars.ContextVar[Optional[tuple]] = contextvars.ContextVar(
+    "lakebase_replica_read", default=None
+)
+# Postgres caps bind parameters per statement at 65535
+_MAX_BIND_PARAMS = 65535
+
+
+class DbPoolStats(BaseModel):
+    size: int = 0
+    checked_out: int = 0
+    checked_in: int = 0
+    overflow: int = 0
+    checkouts: int = 0
+    wait_ms_avg: float = 0.0
+    wait_ms_max: float = 0.0
 
-def create_sync_engine():
+
+class _TimedQueuePool(AsyncAdaptedQueuePool):
     '''
-    This function creates a SQLAlchemy pool for the PostgreSQL on Lakebase with OAuth token.
+    Queue pool that records how long each checkout waited (queueing, plus connect time
+    when a new connection had to be opened).
     '''
-    postgres_pool = create_engine(settings.pg_connection_string)
 
-    @event.listens_for(postgres_pool, "do_connect")
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_total_s += waited
+            self.wait_max_s = max(self.wait_max_s, waited)
+
+
+def _pool_options() -> dict:
+    # Recycle connections well before the OAuth token they were opened with expires.
+    return {
+        "pool_size": settings.pg_pool_size,
+        "max_overflow": settings.pg_max_overflow,
+        "pool_timeout": settings.pg_pool_timeout_s,
+        "pool_recycle": settings.pg_pool_recycle_s,
+        "pool_pre_ping": settings.pg_pool_pre_ping,
+    }
+
+
+def _attach_token_hook(sync_engine) -> None:
+    @event.listens_for(sync_engine, "do_connect")
     def provide_token(dialect, conn_rec, cargs, cparams):
         credential = _credential_provider.get_credential()
         cparams["password"] = credential.token
 
+
+def _step_parameters(step_dict: dict) -> Dict[str, Any]:
+    '''Step row for an upsert, prepared exactly as SQLAlchemyDataLayer.create_step does.'''
+    step_dict["showInput"] = (
+        str(step_dict.get("showInput", "")).lower()
+        if "showInput" in step_dict
+        else None
+    )
+    parameters = {
+        key: value
+        for key, value in step_dict.items()
+        if value is not None and not (isinstance(value, dict) and not value)
+    }
+    parameters["metadata"] = json.dumps(step_dict.get("metadata", {}))
+    parameters["generation"] = json.dumps(step_dict.get("generation", {}))
+    return parameters
+
+
+def _multi_row_upsert(table: str, rows: List[Dict[str, Any]], update_columns: List[str]):
+    '''INSERT ... VALUES (...), (...) ON CONFLICT ("id") DO UPDATE for rows with the same columns.'''
+    columns = list(rows[0])
+    values, parameters = [], {}
+    for i, row in enumerate(rows):
+        values.append("(" + ", ".join(f":{key}_{i}" for key in columns) + ")")
+        parameters.update({f"{key}_{i}": row[key] for key in columns})
+    updates = ", ".join(f'"{key}" = EXCLUDED."{key}"' for key in update_columns)
+    query = f'''
+        INSERT INTO {table} ({", ".join(f'"{key}"' for key in columns)})
+        VALUES {", ".join(values)}
+        ON CONFLICT ("id") DO UPDATE
+        SET {updates};
+    '''
+    return text(query), parameters
+
+
+@contextlib.contextmanager
+def _replica_read(*keys: str):
+    '''Let the queries of the enclosed read go to the replica, subject to ReplicaRouter.'''
+    token = _replica_read_keys.set(keys)
+    try:
+        yield
+    finally:
+        _replica_read_keys.reset(token)
+
+
+def _same_column_runs(rows: List[Dict[str, Any]]):
+    '''Consecutive rows with identical columns, in order, each small enough for one statement.'''
+    run: List[Dict[str, Any]] = []
+    for row in rows:
+        if run and (row.keys() != run[0].keys() or (len(run) + 1) * len(row) > _MAX_BIND_PARAMS):
+            yield run
+            run = []
+        run.append(row)
+    if run:
+        yield run
+
+
+def create_sync_engine(**engine_kwargs):
+    '''
+    This function creates a SQLAlchemy pool for the PostgreSQL on Lakebase with OAuth token.
+    Extra keyword arguments are passed to `create_engine` (e.g. `connect_args`).
+    '''
+    postgres_pool = create_engine(settings.pg_connection_string, **{**_pool_options(), **engine_kwargs})
+    _attach_token_hook(postgres_pool)
     return postgres_pool
 
 
+class LakebaseDataLayer(SQLAlchemyDataLayer):
+    '''
+    Chainlit SQLAlchemy data layer on Lakebase with an explicitly configured async pool.
+    SQLAlchemyDataLayer would build its engine with default pool settings, so its constructor
+    is bypassed and the engine is built here.
+
+    Step creates/updates (every message send/update, status card refresh, ...) are
+    buffered write-behind (see StepWriteBuffer) and written as batched multi-row upserts at
+    turn end, on a timer, or when enough are pending, instead of two round trips each.
+    Reads and deletes that could observe buffered steps flush first.
+
+    With a readable secondary attached, thread listing, thread/resume loads (steps,
+    elements, feedback) and thread-author checks read from it while ReplicaRouter
+    considers it fresh enough; everything else, and any failed replica read, uses the
+    primary.
+    '''
+
+    def __init__(self, conninfo: str, storage_provider=None, user_thread_limit: Optional[int] = 1000):
+        # SQLAlchemyDataLayer.__init__ is skipped: it would build a default engine only to be
+        # replaced. Its methods rely on exactly these attributes being set (chainlit 2.7):
+        # _conninfo, user_thread_limit, show_logger, storage_provider, engine, async_session.
+        self._conninfo = conninfo
+        self.user_thread_limit = user_thread_limit
+        self.show_logger = False
+        self.storage_provider = storage_provider
+        if storage_provider is None:
+            logger.warning("No storage client configured; elements will not be persisted")
+        self.engine = create_async_engine(conninfo, poolclass=_TimedQueuePool, **_pool_options())
+        self.async_session = sessionmaker(bind=self.engine, expire_on_commit=False, class_=AsyncSession)
+        # For async engines, we need to use the sync engine for event listeners
+        _attach_token_hook(self.engine.sync_engine)
+        self._writes: Optional[StepWriteBuffer] = None
+        if settings.pg_write_behind_ms > 0:
+            self._writes = StepWriteBuffer(
+                self._write_batch, settings.pg_write_behind_ms / 1000, settings.pg_write_behind_max_steps
+            )
+        self.replica_engine = None
+        self.replica_session = None
+        self._replicas: Optional[ReplicaRouter] = None
+
+    def attach_replica(self, host: str) -> None:
+        '''Second pool, same options and token hook, on the readable secondary at `host`.'''
+        self.replica_engine = create_async_engine(
+            settings.pg_connection_string_for(host), poolclass=_TimedQueuePool, **_pool_options()
+        )
+        self.replica_session = sessionmaker(bind=self.replica_engine, expire_on_commit=False, class_=AsyncSession)
+        _attach_token_hook(self.replica_engine.sync_engine)
+        self._replicas = ReplicaRouter(settings.pg_replica_max_staleness_s)
+        logger.info(f"Lakebase read replica attached: {host}")
+
+    # ---------- Read replica ----------
+
+    async def execute_sql(self, query: str, parameters: dict):
+        keys = _replica_read_keys.get()
+        if keys is None or self._replicas is None or not self._replicas.use_replica(*keys):
+            return await super().execute_sql(query, parameters)
+        try:
+            async with self.replica_session() as session:
+                result = await session.execute(text(query), parameters)
+                if result.returns_rows:
+                    return self.clean_result([dict(row._mapping) for row in result.fetchall()])
+                return result.rowcount
+        except Exception as e:
+            self._replicas.fell_back()
+            logger.warning(f"Lakebase replica read failed, using the primary: {e}")
+            return await super().execute_sql(query, parameters)
+
+    async def probe_replica(self) -> None:
+        '''Check whether the replica has replayed the primary's current WAL position.'''
+        started = time.monotonic()
+        try:
+            async with self.engine.connect() as primary:
+                lsn = (await primary.execute(text("SELECT pg_current_wal_lsn()::text"))).scalar()
+            async with self.replica_engine.connect() as replica:
+                # NULL: the host is not replaying WAL at all (e.g. it was promoted)
+                caught_up = (await replica.execute(
+                    text("SELECT COALESCE(pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn), true)"),
+                    {"lsn": lsn},
+                )).scalar()
+        except Exception as e:
+            if self._replicas.healthy:
+                logger.warning(f"Lakebase replica probe failed, reading from the primary: {e}")
+            self._replicas.probe_failed()
+            return
+        self._replicas.probe_succeeded(started, bool(caught_up))
+
+    def _wrote(self, *keys: str) -> None:
+        if self._replicas is not None:
+            for key in filter(None, keys):
+                self._replicas.wrote(key)
+
+    def replica_stats(self) -> ReplicaStats:
+        return self._replicas.stats() if self._replicas is not None else ReplicaStats()
+
+    async def update_thread(self, thread_id: str, name=None, user_id=None, metadata=None, tags=None):
+        await super().update_thread(thread_id, name=name, user_id=user_id, metadata=metadata, tags=tags)
+        self._wrote(f"thread:{thread_id}", f"user:{user_id}" if user_id else "")
+
+    # ---------- Write-behind steps ----------
+
+    @queue_until_user_message()
+    async def create_step(self, step_dict: "StepDict"):
+        if self._writes is None:
+            await super().create_step(step_dict)
+            self._wrote(f"thread:{step_dict.get('threadId')}")
+            return
+        self._writes.add(step_dict.get("threadId"), _step_parameters(step_dict))
+
+    @queue_until_user_message()
+    async def delete_step(self, step_id: str):
+        if self._writes is not None:
+            self._writes.discard(step_id)
+        await self.flush_writes()
+        await super().delete_step(step_id)
+
+    async def _write_batch(self, thread_ids: List[str], steps: List[Dict[str, Any]]) -> int:
+        '''Upsert the touched threads, then the steps, in one transaction; returns the statement count.'''
+        statements = 0
+        async with self.async_session() as session:
+            async with session.begin():
+                if thread_ids:
+                    # Same thread upsert as SQLAlchemyDataLayer.update_thread(thread_id)
+                    now = await self.get_current_timestamp()
+                    rows = [{"id": thread_id, "createdAt": now} for thread_id in thread_ids]
+                    await session.execute(*_multi_row_upsert("threads", rows, ["createdAt"]))
+                    statements += 1
+                for run in _same_column_runs(steps):
+                    update_columns = [key for key in run[0] if key != "id"]
+                    await session.execute(*_multi_row_upsert("steps", run, update_columns))
+                    statements += 1
+        self._wrote(*(f"thread:{thread_id}" for thread_id in thread_ids))
+        return statements
+
+    async def flush_writes(self) -> None:
+        if self._writes is not None and not await self._writes.flush():
+            logger.warning("Lakebase write-behind flush failed; buffered steps are retried in the background")
+
+    def flush_writes_soon(self) -> None:
+        if self._writes is not None:
+            self._writes.flush_soon()
+
+    def write_stats(self) -> Optional[WriteBehindStats]:
+        return self._writes.stats() if self._writes is not None else None
+
+    async def close_writes(self) -> None:
+        if self._writes is not None:
+            await self._writes.close()
+
+    # Reads and deletes see buffered steps (read-your-writes within the process)
+
+    async def get_thread(self, thread_id: str):
+        await self.flush_writes()
+        with _replica_read(f"thread:{thread_id}"):
+            return await super().get_thread(thread_id)
+
+    async def get_thread_author(self, thread_id: str) -> str:
+        with _replica_read(f"thread:{thread_id}"):
+            return await super().get_thread_author(thread_id)
+
+    async def list_threads(self, pagination, filters):
+        await self.flush_writes()
+        with _replica_read(f"user:{filters.userId}"):
+            return await super().list_threads(pagination, filters)
+
+    async def delete_thread(self, thread_id: str):
+        await self.flush_writes()
+        result = await super().delete_thread(thread_id)
+        self._wrote(f"thread:{thread_id}")
+        return result
+
+    async def upsert_feedback(self, feedback):
+        await self.flush_writes()
+        result = await super().upsert_feedback(feedback)
+        self._wrote(f"thread:{feedback.threadId}" if feedback.threadId else "")
+        return result
+
+    async def prewarm(self, connections: int) -> None:
+        '''Open `connections` pooled connections up front so early threads skip connect/TLS/auth.'''
+        if connections <= 0:
+            return
+        started = time.perf_counter()
+        async with contextlib.AsyncExitStack() as stack:
+            conns = await asyncio.gather(
+                *(stack.enter_async_context(self.engine.connect()) for _ in range(connections))
+            )
+            await asyncio.gather(*(c.execute(text("SELECT 1")) for c in conns))
+        logger.info(f"Lakebase pool pre-warmed {connections} connections in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def pool_stats(self) -> DbPoolStats:
+        pool = self.engine.sync_engine.pool
+        checkouts = pool.checkouts
+        return DbPoolStats(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            checkouts=checkouts,
+            wait_ms_avg=round(pool.wait_total_s / checkouts * 1000, 2) if checkouts else 0.0,
+            wait_ms_max=round(pool.wait_max_s * 1000, 2),
+        )
+
+
 def create_chainlit_data_layer():
     '''
     This function creates a data layer for Chainlit using Lakebase with OAuth token using SQLAlchemy.
     '''
-    data_layer = SQLAlchemyDataLayer(settings.pg_connection_string)
+    global _data_layer
+    _data_layer = LakebaseDataLayer(settings.pg_connection_string)
+    return _data_layer
 
-    engine = data_layer.engine
-    # For async engines, we need to use the sync engine for event listeners
-    if hasattr(engine, 'sync_engine'):
-        sync_engine = engine.sync_engine
-    else:
-        sync_engine = engine
 
-    @event.listens_for(sync_engine, "do_connect")
-    def provide_token(dialect, conn_rec, cargs, cparams):
-        credential = _credential_provider.get_credential()
-        cparams["password"] = credential.token
+async def _log_pool_stats(interval_s: int):
+    while True:
+        await asyncio.sleep(interval_s)
+        logger.info(f"Lakebase pool: {pool_stats()}")
+
+
+async def _discover_replica_host() -> Optional[str]:
+    '''read_only_dns of the database instance, if it has readable secondaries.'''
+    if not settings.pg_database_instance:
+        return None
+    try:
+        instance = await asyncio.to_thread(_credential_provider.database_instance)
+    except Exception as e:
+        logger.warning(f"Lakebase instance lookup for a read replica failed: {e}")
+        return None
+    if not getattr(instance, "enable_readable_secondaries", False) or not getattr(instance, "read_only_dns", None):
+        logger.info("Lakebase instance has no readable secondaries; all reads use the primary")
+        return None
+    return instance.read_only_dns
+
+
+async def _probe_replica(interval_s: float):
+    while True:
+        await _data_layer.probe_replica()
+        await asyncio.sleep(interval_s)
+
+
+async def startup():
+    '''
+    Mint the first Lakebase token off the event loop and start background renewal, so
+    `do_connect` never has to call the credentials API inline; then start pending schema
+    migrations in the background, pre-warm the pool and attach the read replica, if any.
+    '''
+    global _stats_task, _replica_task, _migrations_task
+    try:
+        await asyncio.to_thread(_credential_provider.get_credential)
+    except Exception as e:
+        logger.warning(f"Initial Lakebase credential fetch failed, will retry in background: {e}")
+    _credential_provider.start()
+
+    if settings.pg_run_migrations:
+        from data.migrations import run_startup_migrations
+        # Not awaited: a concurrent index build on a large steps table can take minutes, and
+        # the app serves (more slowly) without the indexes meanwhile
+        _migrations_task = asyncio.create_task(run_startup_migrations())
+
+    from chainlit.data import get_data_layer
+    get_data_layer()  # instantiate the registered data layer now rather than on first request
+    if _data_layer is not None:
+        try:
+            await _data_layer.prewarm(settings.pg_pool_prewarm)
+        except Exception as e:
+            logger.warning(f"Lakebase pool pre-warm failed: {e}")
+        if settings.pg_pool_stats_interval_s > 0:
+            _stats_task = asyncio.create_task(_log_pool_stats(settings.pg_pool_stats_interval_s))
+        if settings.pg_read_replica:
+            host = settings.pg_replica_host or await _discover_replica_host()
+            if host:
+                _data_layer.attach_replica(host)
+                # Probe often enough that a healthy replica never looks older than the tolerance
+                interval_s = max(settings.pg_replica_max_staleness_s / 3, 0.5)
+                _replica_task = asyncio.create_task(_probe_replica(interval_s))
+
+
+def flush_writes_soon() -> None:
+    '''Write buffered steps now (in the background), e.g. at the end of a chat turn.'''
+    if _data_layer is not None:
+        _data_layer.flush_writes_soon()
+
+
+async def shutdown():
+    if _stats_task is not None:
+        _stats_task.cancel()
+    if _replica_task is not None:
+        _replica_task.cancel()
+    if _data_layer is not None:
+        await _data_layer.close_writes()
+    _credential_provider.stop()
+    logger.info(f"Lakebase credentials: {_credential_provider.stats()}")
+
+
+def credential_stats():
+    return _credential_provider.stats()
+
+
+def pool_stats() -> Optional[DbPoolStats]:
+    return _data_layer.pool_stats() if _data_layer is not None else None
+
+
+def write_stats() -> Optional[WriteBehindStats]:
+    return _data_layer.write_stats() if _data_layer is not None else None
+
 
-    return data_layer
+def replica_stats() -> Optional[ReplicaStats]:
+    return _data_layer.replica_stats() if _data_layer is not None else None
 
 
 def test_database_connection():
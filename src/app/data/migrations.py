@@ -0,0 +1,162 @@
+import asyncio
+from typing import List, Optional
+from pydantic import BaseModel
+from sqlalchemy import text
+from config import settings
+from utils.logging import logger
+
+# Held by the one app replica/worker applying migrations; the others skip instead of waiting.
+_ADVISORY_LOCK_KEY = 80_224_101
+
+_CREATE_VERSION_TABLE = text('''
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    "version" INT PRIMARY KEY,
+    "name" TEXT NOT NULL,
+    "appliedAt" TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+''')
+
+_INVALID_INDEX = text('''
+SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+WHERE c.relname = :name AND NOT i.indisvalid
+''')
+
+
+class Migration(BaseModel):
+    version: int
+    name: str
+    statements: List[str]
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    concurrent: bool = False
+    # Settings flag that must be true for this migration to run; skipped (not recorded) otherwise
+    opt_in: Optional[str] = None
+
+
+def _index(name: str, ddl: str) -> str:
+    return f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {ddl}'
+
+
+# Names match lakebase/sql/migrations/001_initial_indexes.sql where the index is the same,
+# so databases that already ran that script are not given duplicates.
+MIGRATIONS: List[Migration] = [
+    Migration(
+        version=1,
+        name="chat_history_indexes",
+        concurrent=True,
+        statements=[
+            # Thread list: WHERE "userId"/"userIdentifier" = ? ORDER BY "createdAt" DESC LIMIT n
+            _index("idx_threads_user_created", 'ON threads ("userId", "createdAt")'),
+            _index("idx_threads_user_identifier_created", 'ON threads ("userIdentifier", "createdAt")'),
+            # Thread resume: steps/elements/feedbacks WHERE "threadId" IN (...)
+            _index("idx_steps_thread_created", 'ON steps ("threadId", "createdAt")'),
+            _index("idx_elements_thread_id", 'ON elements ("threadId")'),
+            _index("idx_elements_for_id", 'ON elements ("forId")'),
+            _index("idx_feedbacks_thread_id", 'ON feedbacks ("threadId")'),
+            _index("idx_feedbacks_for_id", 'ON feedbacks ("forId")'),
+        ],
+    ),
+    Migration(
+        version=2,
+        name="timestamptz_columns",
+        # Opt-in: Chainlit writes these as ISO strings and passes the values it reads back
+        # straight to the UI, so verify the deployed Chainlit version copes with datetimes
+        # first. Views that reference these columns must be dropped and recreated around it.
+        opt_in="pg_migrate_timestamptz",
+        statements=[
+            f'ALTER TABLE {table} ALTER COLUMN "{column}" TYPE TIMESTAMPTZ '
+            f'USING CAST(NULLIF("{column}", \'\') AS TIMESTAMPTZ)'
+            for table, column in [
+                ("users", "createdAt"),
+                ("threads", "createdAt"),
+                ("steps", "createdAt"),
+                ("steps", "start"),
+                ("steps", "end"),
+            ]
+        ],
+    ),
+]
+
+
+def _index_name(statement: str) -> Optional[str]:
+    parts = statement.split()
+    return parts[parts.index("EXISTS") + 1] if "CONCURRENTLY" in parts else None
+
+
+_RECORD = text('''
+INSERT INTO schema_migrations ("version", "name") VALUES (:version, :name)
+ON CONFLICT ("version") DO NOTHING
+''')
+
+
+def _apply(conn, migration: Migration) -> None:
+    record = {"version": migration.version, "name": migration.name}
+    if migration.concurrent:
+        for statement in migration.statements:
+            name = _index_name(statement)
+            # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would keep
+            if name and conn.execute(_INVALID_INDEX, {"name": name}).first():
+                logger.warning(f"Dropping invalid index {name} before rebuilding it")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            conn.execute(text(statement))
+        conn.execute(_RECORD, record)
+        return
+
+    # The connection is in autocommit mode; open an explicit transaction so the DDL and
+    # its version row commit (or roll back) together.
+    conn.execute(text("BEGIN"))
+    try:
+        for statement in migration.statements:
+            conn.execute(text(statement))
+        conn.execute(_RECORD, record)
+        conn.execute(text("COMMIT"))
+    except Exception:
+        conn.execute(text("ROLLBACK"))
+        raise
+
+
+def run_migrations(engine, migrations: List[Migration] = MIGRATIONS) -> List[str]:
+    '''
+    Apply pending migrations in version order. Idempotent, and safe to run from several
+    processes at once: only the one that gets the advisory lock applies them, the others
+    return at once. Waiting for the lock would mean sitting in a running statement with a
+    snapshot, which CREATE INDEX CONCURRENTLY in the lock holder waits for (a deadlock).
+    Returns the names of the migrations applied.
+    '''
+    applied: List[str] = []
+    with engine.connect() as raw:
+        conn = raw.execution_options(isolation_level="AUTOCOMMIT")
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY}).scalar():
+            logger.info("Another process is applying schema migrations; skipping")
+            return applied
+        try:
+            if conn.execute(text("SELECT to_regclass('threads')")).scalar() is None:
+                logger.warning("Chainlit tables not found; run the schema setup before migrations")
+                return applied
+            conn.execute(_CREATE_VERSION_TABLE)
+            done = {row[0] for row in conn.execute(text('SELECT "version" FROM schema_migrations'))}
+            for migration in sorted(migrations, key=lambda m: m.version):
+                if migration.version in done:
+                    continue
+                if migration.opt_in and not getattr(settings, migration.opt_in, False):
+                    logger.info(f"Skipping opt-in migration {migration.version:03d}_{migration.name}")
+                    continue
+                logger.info(f"Applying migration {migration.version:03d}_{migration.name}")
+                _apply(conn, migration)
+                applied.append(migration.name)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+    return applied
+
+
+async def run_startup_migrations() -> None:
+    '''Run pending migrations in a worker thread; failures are logged, not fatal.'''
+    from data.lakebase import create_sync_engine
+
+    engine = create_sync_engine()
+    try:
+        applied = await asyncio.to_thread(run_migrations, engine)
+        logger.info(f"Schema migrations applied: {applied or 'none pending'}")
+    except Exception as e:
+        logger.error(f"Schema migrations failed: {e}")
+    finally:
+        engine.dispose()
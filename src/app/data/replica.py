@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+from pydantic import BaseModel
+
+
+class ReplicaStats(BaseModel):
+    configured: bool = False
+    healthy: bool = False
+    staleness_s: Optional[float] = None
+    replica_reads: int = 0
+    primary_reads: int = 0
+    fallbacks: int = 0
+    probes: int = 0
+    probe_failures: int = 0
+
+
+class ReplicaRouter:
+    '''
+    Decides whether a read may be served by the readable secondary.
+
+    A periodic probe records the last moment the replica was known to have replayed
+    everything the primary had committed (`caught_up_at`). Reads go to the replica only
+    while that moment is within `max_staleness_s`, and never for a thread or user this
+    process has written to since then, so a user always reads their own writes (a new
+    thread shows up in their list, a just-finished answer is there on resume). Writes are
+    remembered only for the staleness window, so the bookkeeping stays small.
+    '''
+
+    def __init__(self, max_staleness_s: float):
+        self.max_staleness_s = max_staleness_s
+        self.healthy = False
+        self._caught_up_at: Optional[float] = None
+        self._writes: "OrderedDict[str, float]" = OrderedDict()
+        self._stats = ReplicaStats(configured=True)
+
+    # ---------- Probe results ----------
+
+    def probe_succeeded(self, started: float, caught_up: bool) -> None:
+        '''`caught_up`: the replica had replayed the primary's WAL position read at `started` (monotonic).'''
+        self._stats.probes += 1
+        self.healthy = True
+        if caught_up:
+            self._caught_up_at = started
+
+    def probe_failed(self) -> None:
+        self._stats.probes += 1
+        self._stats.probe_failures += 1
+        self.healthy = False
+
+    # ---------- Routing ----------
+
+    def wrote(self, key: str) -> None:
+        '''Record a write to a thread ("thread:<id>") or by a user ("user:<id>").'''
+        now = time.monotonic()
+        self._writes[key] = now
+        self._writes.move_to_end(key)
+        horizon = now - self.max_staleness_s
+        while self._writes:
+            oldest_key, written = next(iter(self._writes.items()))
+            if written >= horizon:
+                break
+            del self._writes[oldest_key]
+
+    def staleness(self) -> Optional[float]:
+        if self._caught_up_at is None:
+            return None
+        return time.monotonic() - self._caught_up_at
+
+    def use_replica(self, *keys: str) -> bool:
+        staleness = self.staleness()
+        fresh = self.healthy and staleness is not None and staleness <= self.max_staleness_s
+        if fresh:
+            fresh = not any(self._writes.get(key, 0.0) > self._caught_up_at for key in keys if key)
+        if fresh:
+            self._stats.replica_reads += 1
+        else:
+            self._stats.primary_reads += 1
+        return fresh
+
+    def fell_back(self) -> None:
+        '''A replica read failed and was retried on the primary.'''
+        self._stats.fallbacks += 1
+        self.healthy = False
+
+    def stats(self) -> ReplicaStats:
+        staleness = self.staleness()
+        return self._stats.model_copy(update={
+            "healthy": self.healthy,
+            "staleness_s": round(staleness, 3) if staleness is not None else None,
+        })
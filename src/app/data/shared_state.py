@@ -0,0 +1,62 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config import settings
+
+
+class MemoryCacheStore:
+    '''Process-local CacheStore with the shared-tier interface, for tests and single-process runs.'''
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+
+    async def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            self._entries.pop(key, None)
+            return None
+        return entry[1]
+
+    async def set(self, key: str, events: List[Dict[str, Any]], ttl_s: int) -> None:
+        self._entries[key] = (time.time() + ttl_s, events)
+
+
+class MemoryIdentityBackend:
+    '''Process-local IdentityBackend, for tests and single-process runs.'''
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, float]] = {}
+
+    async def get(self, email: str) -> Optional[Tuple[str, float]]:
+        entry = self._entries.get(email)
+        if entry is None or entry[1] <= time.time():
+            self._entries.pop(email, None)
+            return None
+        return entry
+
+    async def set(self, email: str, token: str, expires_at: float) -> None:
+        current = self._entries.get(email)
+        if current is None or current[1] < expires_at:
+            self._entries[email] = (token, expires_at)
+
+
+def create_cache_store():
+    '''Shared response-cache tier for SHARED_STATE (RESPONSE_CACHE_PERSISTENT also selects Lakebase).'''
+    if settings.shared_state == "memory":
+        return MemoryCacheStore()
+    if settings.shared_state == "lakebase" or settings.response_cache_persistent:
+        from data.cache_store import LakebaseCacheStore
+        return LakebaseCacheStore()
+    return None
+
+
+def create_identity_backend():
+    '''
+    Shared identity tier for SHARED_STATE=memory, else None (the in-process store only).
+
+    Forwarded tokens are never written to Lakebase: sticky routing sends a user's
+    /auth/header call and websocket to the same worker, and a session can always read its
+    own forwarded token from its connect headers.
+    '''
+    if settings.shared_state == "memory":
+        return MemoryIdentityBackend()
+    return None
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from pydantic import BaseModel
+from utils.logging import logger
+
+# (thread ids, step rows in first-seen order) -> number of statements executed
+BatchWriter = Callable[[List[str], List[Dict[str, Any]]], Awaitable[int]]
+
+
+class WriteBehindStats(BaseModel):
+    pending_steps: int = 0
+    writes_buffered: int = 0
+    writes_coalesced: int = 0
+    flushes: int = 0
+    steps_written: int = 0
+    statements: int = 0
+    failures: int = 0
+    last_flush_ms: float = 0.0
+
+
+class StepWriteBuffer:
+    '''
+    Write-behind buffer for Chainlit step creates/updates.
+
+    Writes to the same step are merged (later fields win), so a message that is sent,
+    updated on every tool event and finalised costs one row in the next batch. A flush
+    writes the touched threads and all buffered steps in one transaction, in the order the
+    steps were first seen. Flushes are serialised; a failed batch is put back ahead of any
+    writes buffered since (newer fields still win) and retried with backoff, so a later
+    state is never overwritten by an earlier one.
+    '''
+
+    _RETRY_MAX_S = 30.0
+
+    def __init__(self, write: BatchWriter, interval_s: float, max_pending: int):
+        self._write = write
+        self._interval_s = interval_s
+        self._max_pending = max_pending
+        self._steps: Dict[str, Dict[str, Any]] = {}
+        self._threads: Dict[str, None] = {}  # ordered set
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._retry_s = interval_s
+        self._stats = WriteBehindStats()
+
+    def add(self, thread_id: Optional[str], params: Dict[str, Any]) -> None:
+        if thread_id:
+            self._threads.setdefault(thread_id, None)
+        pending = self._steps.get(params["id"])
+        if pending is None:
+            self._steps[params["id"]] = params
+        else:
+            pending.update(params)
+            self._stats.writes_coalesced += 1
+        self._stats.writes_buffered += 1
+        self.flush_soon(0.0 if len(self._steps) >= self._max_pending else self._interval_s)
+
+    def discard(self, step_id: str) -> None:
+        self._steps.pop(step_id, None)
+
+    def flush_soon(self, delay_s: float = 0.0) -> None:
+        '''Schedule a flush; an earlier pending flush is kept, a later one is brought forward.'''
+        if self._timer is not None:
+            if delay_s > 0:
+                return
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().create_task(self._flush_later(delay_s))
+
+    async def _flush_later(self, delay_s: float) -> None:
+        await asyncio.sleep(delay_s)
+        self._timer = None
+        if await self.flush():
+            self._retry_s = self._interval_s
+        elif self._steps or self._threads:
+            self._retry_s = min(max(self._retry_s * 2, 0.5), self._RETRY_MAX_S)
+            self.flush_soon(self._retry_s)
+
+    async def flush(self) -> bool:
+        '''Write everything buffered now; returns False (keeping the batch) if the write failed.'''
+        async with self._lock:
+            if not self._steps and not self._threads:
+                return True
+            steps, self._steps = self._steps, {}
+            threads, self._threads = self._threads, {}
+            started = time.perf_counter()
+            try:
+                statements = await self._write(list(threads), list(steps.values()))
+            except Exception as e:
+                failed = len(steps)
+                for step_id, params in self._steps.items():
+                    if step_id in steps:
+                        steps[step_id].update(params)
+                    else:
+                        steps[step_id] = params
+                threads.update(self._threads)
+                self._steps, self._threads = steps, threads
+                self._stats.failures += 1
+                logger.warning(f"Lakebase write-behind flush of {failed} steps failed, will retry: {e}")
+                return False
+            self._stats.flushes += 1
+            self._stats.steps_written += len(steps)
+            self._stats.statements += statements
+            self._stats.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+            return True
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not await self.flush():
+            logger.error(f"Lakebase write-behind: {len(self._steps)} buffered steps could not be written at shutdown")
+
+    def stats(self) -> WriteBehindStats:
+        return self._stats.model_copy(update={"pending_steps": len(self._steps)})
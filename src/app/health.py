@@ -0,0 +1,42 @@
+import os
+from chainlit.server import app
+from auth.identity_store import identity_store
+from data import lakebase
+import routes
+from services.offload import cpu_executor
+from utils.logging import logging_stats
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness plus pool/cache statistics for monitoring. Contains no user data or secrets."""
+    db_pool = lakebase.pool_stats()
+    db_writes = lakebase.write_stats()
+    db_replica = lakebase.replica_stats()
+    limiter = routes.mas_client.limiter_stats()
+    return {
+        "status": "ok",
+        # Which process answered in multi-worker mode (multiworker.py); None when single-process
+        "worker": os.environ.get("APP_WORKER_INDEX"),
+        "lakebase_pool": db_pool.model_dump() if db_pool else None,
+        "lakebase_writes": db_writes.model_dump() if db_writes else None,
+        "lakebase_replica": db_replica.model_dump() if db_replica else None,
+        "lakebase_credentials": lakebase.credential_stats().model_dump(mode="json"),
+        "identity_store": identity_store.stats().model_dump(),
+        "mas_http_pool": routes.mas_client.pool_stats().model_dump(),
+        "mas_limiter": limiter.model_dump() if limiter else None,
+        "mas_retries": routes.mas_client.retry_stats().model_dump(),
+        "response_cache": routes.response_cache.stats().model_dump() if routes.response_cache else None,
+        "single_flight": routes.single_flight.stats().model_dump() if routes.single_flight else None,
+        "latency": routes.tracer.snapshot(),
+        "event_loop_lag": routes.loop_lag.snapshot(),
+        "cpu_offload": cpu_executor.stats().model_dump(),
+        "logging": logging_stats(),
+    }
+
+
+# chainlit.server registers its UI catch-all (GET /{full_path:path}) when imported, and
+# routes match in order: move /healthz ahead of it or it would be served index.html
+app.router.routes.insert(0, app.router.routes.pop(
+    next(i for i, r in enumerate(app.router.routes) if getattr(r, "endpoint", None) is healthz)
+))
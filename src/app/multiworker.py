@@ -0,0 +1,228 @@
+"""
+Multi-worker launcher: runs APP_WORKERS `chainlit run app.py` processes on local ports
+behind a sticky TCP proxy on the public port, so SSE relays, table parsing and pandas work
+spread over several cores instead of one event loop.
+
+    python multiworker.py            # app.yaml: command: ['python', 'multiworker.py']
+
+Chainlit keeps sessions (websocket state, uploads, ask/continue callbacks) in process
+memory, so every request of a user must reach the same worker. The proxy reads only the
+request head, picks the worker by rendezvous hashing of the user (X-Forwarded-Email, else
+the Chainlit auth cookie, else the client address), and then relays bytes both ways;
+websocket upgrades stay on the chosen worker for their lifetime. Plain HTTP requests are
+exchanged with `Connection: close` on both sides, so a keep-alive connection carrying
+several users' requests is never pinned to one worker. Workers that exit are restarted; while one is down its
+users move to the others (and back once it is up).
+
+The response cache is shared between workers through SHARED_STATE (data/shared_state.py);
+the launcher defaults it to "lakebase" when APP_WORKERS > 1. Forwarded user tokens are not
+shared: each user's requests reach one worker, which reads them from the user's headers.
+With APP_WORKERS=1 this simply execs `chainlit run app.py`.
+"""
+
+import asyncio
+import hashlib
+import os
+import signal
+import sys
+from typing import List, Optional, Tuple
+from config import settings
+from utils.logging import logger
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Longest request head the proxy will read before picking a worker
+_MAX_HEAD = 64 * 1024
+_RESTART_BACKOFF_MAX_S = 30.0
+
+
+def _chainlit_command() -> List[str]:
+    return [sys.executable, "-m", "chainlit", "run", "app.py", "--headless"]
+
+
+def _rendezvous(key: bytes, workers: List[int]) -> int:
+    '''Highest-random-weight choice: removing a worker only moves the users it had.'''
+    return max(workers, key=lambda w: hashlib.blake2b(key + b"/%d" % w, digest_size=8).digest())
+
+
+def _sticky_key(head: bytes, peer: Optional[Tuple]) -> bytes:
+    email = cookie = None
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"x-forwarded-email":
+            email = value.strip().lower()
+        elif name == b"cookie":
+            for part in value.split(b";"):
+                k, _, v = part.strip().partition(b"=")
+                if k == b"access_token":
+                    cookie = v
+    return email or cookie or (peer[0].encode() if peer else b"")
+
+
+def _is_upgrade(head: bytes) -> bool:
+    return any(
+        line.lower().startswith(b"upgrade:") and b"websocket" in line.lower()
+        for line in head.split(b"\r\n")[1:]
+    )
+
+
+def _close_after(head: bytes) -> bytes:
+    '''The same request/response head with `Connection: close`, so exactly one exchange uses the connection.'''
+    lines = head[:-4].split(b"\r\n")
+    kept = [lines[0]] + [
+        line for line in lines[1:]
+        if not line.lower().startswith((b"connection:", b"keep-alive:"))
+    ]
+    return b"\r\n".join(kept + [b"Connection: close"]) + b"\r\n\r\n"
+
+
+async def _relay(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while data := await reader.read(65536):
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()  # half-close: the other direction may still be sending
+    except (ConnectionError, OSError):
+        writer.close()
+
+
+class Worker:
+    def __init__(self, index: int, port: int):
+        self.index = index
+        self.port = port
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.ready = False
+        self.restarts = 0
+
+
+class Supervisor:
+    '''Starts the Chainlit workers, restarts them when they exit, and runs the sticky proxy.'''
+
+    def __init__(self, workers: int, host: str, port: int, base_port: int):
+        self.host = host
+        self.port = port
+        self.workers = [Worker(i, base_port + i) for i in range(workers)]
+        self._stopping = False
+        self._probes: set = set()
+
+    # ---------- Workers ----------
+
+    async def _run_worker(self, worker: Worker) -> None:
+        backoff = 1.0
+        while not self._stopping:
+            env = {
+                **os.environ,
+                "CHAINLIT_HOST": "127.0.0.1",
+                "CHAINLIT_PORT": str(worker.port),
+                "APP_WORKER_INDEX": str(worker.index),
+            }
+            worker.process = await asyncio.create_subprocess_exec(*_chainlit_command(), cwd=HERE, env=env)
+            logger.info(f"Worker {worker.index} started (pid {worker.process.pid}, port {worker.port})")
+            ready = asyncio.create_task(self._wait_ready(worker))
+            code = await worker.process.wait()
+            ready.cancel()
+            worker.ready = False
+            if self._stopping:
+                return
+            worker.restarts += 1
+            logger.warning(f"Worker {worker.index} exited with {code}; restarting in {backoff:.0f} s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, _RESTART_BACKOFF_MAX_S)
+
+    async def _wait_ready(self, worker: Worker) -> None:
+        while True:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", worker.port)
+                writer.close()
+                worker.ready = True
+                logger.info(f"Worker {worker.index} ready")
+                return
+            except OSError:
+                await asyncio.sleep(0.2)
+
+    def _pick(self, key: bytes) -> Optional[Worker]:
+        ready = [w.index for w in self.workers if w.ready]
+        if not ready:
+            return None
+        return self.workers[_rendezvous(key, ready)]
+
+    # ---------- Proxy ----------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        upstream: Optional[asyncio.StreamWriter] = None
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                return
+            worker = self._pick(_sticky_key(head, writer.get_extra_info("peername")))
+            if worker is None:
+                writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            upgrade = _is_upgrade(head)
+            try:
+                up_reader, upstream = await asyncio.open_connection("127.0.0.1", worker.port, limit=_MAX_HEAD)
+            except OSError:
+                if worker.ready:
+                    worker.ready = False
+                    probe = asyncio.create_task(self._wait_ready(worker))
+                    self._probes.add(probe)
+                    probe.add_done_callback(self._probes.discard)
+                writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            upstream.write(head if upgrade else _close_after(head))
+            to_worker = asyncio.create_task(_relay(reader, upstream))
+            if not upgrade:
+                # Tell the client too: its next request must come on a new connection
+                try:
+                    writer.write(_close_after(await up_reader.readuntil(b"\r\n\r\n")))
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    to_worker.cancel()
+                    return
+            # The response ends the exchange (HTTP) or the websocket closed
+            await _relay(up_reader, writer)
+            to_worker.cancel()
+        finally:
+            for w in (writer, upstream):
+                if w is not None:
+                    w.close()
+
+    async def serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopped = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stopped.set)
+
+        runners = [asyncio.create_task(self._run_worker(w)) for w in self.workers]
+        server = await asyncio.start_server(self._handle, self.host, self.port, limit=_MAX_HEAD)
+        logger.info(f"Sticky proxy on {self.host}:{self.port} -> {len(self.workers)} workers")
+        async with server:
+            await stopped.wait()
+
+        self._stopping = True
+        for w in self.workers:
+            if w.process is not None and w.process.returncode is None:
+                w.process.terminate()
+        await asyncio.wait(runners, timeout=30)
+        for w in self.workers:
+            if w.process is not None and w.process.returncode is None:
+                w.process.kill()
+
+
+def main() -> None:
+    host = os.environ.get("CHAINLIT_HOST", "0.0.0.0")
+    port = int(os.environ.get("DATABRICKS_APP_PORT") or os.environ.get("CHAINLIT_PORT") or 8000)
+    if settings.app_workers <= 1:
+        os.chdir(HERE)
+        os.execv(sys.executable, _chainlit_command() + ["--host", host, "--port", str(port)])
+
+    if settings.shared_state is None:
+        os.environ["SHARED_STATE"] = "lakebase"
+        logger.info("SHARED_STATE not set; workers share the response cache through Lakebase")
+    base_port = int(os.environ.get("APP_WORKER_BASE_PORT") or port + 1)
+    asyncio.run(Supervisor(settings.app_workers, host, port, base_port).serve())
+
+
+if __name__ == "__main__":
+    main()
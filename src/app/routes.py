@@ -1,73 +1,160 @@
+import asyncio
 import chainlit as cl
+import functools
+import importlib
+import signal
+import time
+from typing import Optional
 from utils.logging import logger
 from auth.ensure_identity import ensure_identity
+from auth.identity_store import identity_store
+from data import lakebase
+from data.shared_state import create_cache_store, create_identity_backend
 from services.mas_client import MASChatClient
-from services.mas_normalizer import normalize
+from services.mas_normalizer import (
+    ResponseCreated,
+    TextDelta,
+    TextDone,
+    ToolCall,
+    ToolOutput,
+    Usage,
+    normalize,
+)
+from services.history import ConversationHistory, get_length_counter
 from services.renderer import ChainlitStream
+from services.concurrency import set_queue_listener
+from services.response_cache import ResponseCache
+from services.single_flight import SingleFlight
+from services.tracing import Tracer
+from services.loop_lag import LoopLagMonitor
+from services.offload import cpu_executor
 from config import settings
 
 mas_client = MASChatClient()
 
-HIST_MAX_TURNS = settings.history_max_turns
-HIST_MAX_CHARS = settings.history_max_chars
 
-def _msg_char_len(msg: dict) -> int:
-    """Heuristic length of a message's content; works for string content."""
-    c = msg.get("content", "")
-    if isinstance(c, str):
-        return len(c)
-    # If your MAS uses the newer content blocks [{type,text}, ...], sum lengths
-    try:
-        return sum(len(block.get("text", "")) for block in c if isinstance(c, list))
-    except Exception:
-        return 0
+def _create_response_cache() -> Optional[ResponseCache]:
+    if not settings.response_cache_enabled:
+        return None
+    return ResponseCache(
+        ttl_s=settings.response_cache_ttl_s,
+        max_entries=settings.response_cache_max_entries,
+        scope=settings.response_cache_scope,
+        store=create_cache_store(),
+    )
+
 
-def _build_messages_with_history(user_text: str) -> list[dict]:
+response_cache = _create_response_cache()
+tracer = Tracer(
+    enabled=settings.tracing_enabled,
+    dump_dir=settings.trace_dump_dir,
+    max_users=settings.trace_max_users,
+    recent=settings.trace_recent,
+)
+loop_lag = LoopLagMonitor(
+    settings.loop_lag_interval_ms / 1000,
+    stall_ms=settings.loop_stall_ms,
+    worst=settings.loop_stall_worst,
+    dump_dir=settings.trace_dump_dir,
+)
+single_flight = SingleFlight(scope=settings.response_cache_scope) if settings.single_flight_enabled else None
+
+
+def _mas_events(identity, messages: list[dict]):
+    """Raw MAS events for a turn: response cache -> single-flight -> MASChatClient."""
+    upstream = mas_client.stream_raw
+    if single_flight is not None:
+        upstream = functools.partial(single_flight.stream, upstream=mas_client.stream_raw)
+    if response_cache is not None:
+        return response_cache.stream(identity, messages, upstream)
+    return upstream(identity, messages)
+
+
+async def _session_history(user_text: str) -> ConversationHistory:
     """
-    Build OpenAI-style messages with a trimmed history:
-      - Keep the earliest system message (if present)
-      - Keep up to HIST_MAX_TURNS most recent non-system turns
-      - Enforce a coarse HIST_MAX_CHARS budget
-      - Append the current user message last
+    The session's incrementally-maintained history. Seeded once from the Chainlit chat
+    context (covers resumed threads); afterwards routes append each answered turn.
     """
-    history = cl.chat_context.to_openai() or []
-
-    # 1) Extract and keep at most one system message (the first system in history)
-    system_msgs = [m for m in history if m.get("role") == "system"]
-    system_prefix = [system_msgs[0]] if system_msgs else []
-
-    # 2) Non-system messages, newest → oldest
-    non_system = [m for m in history if m.get("role") != "system"]
-
-    # Keep last N turns
-    recent = non_system[-HIST_MAX_TURNS:] if len(non_system) > HIST_MAX_TURNS else non_system[:]
-
-    # 3) Enforce a rough char budget (walk from the end backwards)
-    budget = HIST_MAX_CHARS
-    trimmed: list[dict] = []
-    for m in reversed(recent):
-        l = _msg_char_len(m)
-        if l > budget and trimmed:
-            break
-        budget -= l
-        trimmed.append(m)
-    trimmed.reverse()  # restore chronological order
-
-    # 4) Append current user message
-    current = {"role": "user", "content": user_text}
-
-    messages = [*system_prefix, *trimmed, current]
-
-    # Optional observability
-    logger.info(
-        "history_built",
-        extra={
-            "system": len(system_prefix),
-            "kept_turns": len(trimmed),
-            "total_chars": sum(_msg_char_len(m) for m in trimmed),
-        },
-    )
-    return messages
+    history = cl.user_session.get("history")
+    if history is None:
+        seed = cl.chat_context.to_openai() or []
+        # The chat context already holds the incoming message; build() appends it itself.
+        if seed and seed[-1].get("role") == "user" and seed[-1].get("content") == user_text:
+            seed = seed[:-1]
+        # Off the event loop: the first load may download the encoding (or wait for the warm-up
+        # thread doing so)
+        counter = await asyncio.to_thread(
+            get_length_counter, settings.history_tokenizer, settings.history_max_tokens, settings.history_max_chars
+        )
+        history = cl.user_session.get("history")  # a concurrent message may have set it meanwhile
+        if history is None:
+            history = ConversationHistory.from_messages(seed, settings.history_max_turns, counter)
+            cl.user_session.set("history", history)
+    return history
+
+
+# Modules deliberately kept out of the import path at startup (see scripts/check_import_time.py)
+_LAZY_MODULES = ("pandas", "services.table_types")
+_warmup_task: Optional[asyncio.Task] = None
+
+
+def _warm_lazy_imports():
+    started = time.perf_counter()
+    for module in _LAZY_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning(f"Warm-up import of {module} failed: {e}")
+    get_length_counter(settings.history_tokenizer, settings.history_max_tokens, settings.history_max_chars)
+    logger.info(f"Lazy modules warmed in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+@cl.on_app_startup
+async def on_app_startup():
+    global _warmup_task
+    await mas_client.startup()
+    await lakebase.startup()
+    identity_store.attach(create_identity_backend())
+    loop_lag.start()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, _dump_loop_stalls)
+    except (NotImplementedError, RuntimeError, ValueError):
+        pass  # not the main thread, or no signals on this platform
+    if settings.warm_lazy_imports:
+        # Off the startup path: the app starts serving while these load in a worker thread.
+        _warmup_task = asyncio.create_task(asyncio.to_thread(_warm_lazy_imports))
+
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    await mas_client.aclose()
+    await lakebase.shutdown()
+    loop_lag.stop()
+    cpu_executor.shutdown()
+    path = tracer.dump()
+    if path:
+        logger.info(f"Latency histograms written to {path}")
+    _dump_loop_stalls()
+
+
+def _dump_loop_stalls():
+    '''SIGUSR1: write the worst event-loop stalls (to the log when TRACE_DUMP_DIR is unset).'''
+    worst = loop_lag.worst()
+    if not worst:
+        return
+    path = loop_lag.dump()
+    if path:
+        logger.info(f"Event-loop stalls written to {path}")
+        return
+    # In the message, so both log formats show it redacted; no emails (the trace id links
+    # a stall to its turn)
+    for stall in worst:
+        stack = "\n  ".join(stall["stack"] or ["(no stack captured)"])
+        logger.warning(
+            f"Event-loop stall {stall['lag_ms']:.0f} ms at {stall['site']} "
+            f"(task {stall['task']}, trace {stall.get('trace_id')})\n  {stack}"
+        )
+
 
 @cl.set_starters
 async def set_starters():
@@ -94,37 +181,72 @@ async def on_chat_start():
 
 @cl.on_message
 async def on_message(message: cl.Message):
-    identity = await ensure_identity()
-    logger.info(f"Identity: {identity}")
+    trace = tracer.start(endpoint=settings.agent_endpoint)
+    with trace.span("identity"):
+        identity = await ensure_identity()
+    trace.user = identity.email if identity else None
+    logger.debug("Identity: %s", identity)
 
-    messages = _build_messages_with_history(message.content)
-    logger.info(f"[DEBUG] Messages: {messages}")
+    with trace.span("history"):
+        history = await _session_history(message.content)
+        messages = history.build(message.content)
+    logger.debug("MAS request messages: %s", messages)
 
     renderer = ChainlitStream()
-    await renderer.start()
+    with trace.span("status_card"):
+        await renderer.start()
+    set_queue_listener(renderer.on_queued)
+    answer = None
+    error = None
 
     try:
-        raw_events = mas_client.stream_raw(identity, messages)
+        raw_events = _mas_events(identity, messages)
         async for event in normalize(raw_events):
-            if event["type"] == "response.created":
-                # Acknowledge the response.created event
-                logger.info(f"[DEBUG] Acknowledged response.created event")
-            elif event["type"] == "text.delta":
-                await renderer.on_text_delta(event["delta"])
-            elif event["type"] == "text.done":
-                await renderer.on_text_done(event["text"])
-            elif event["type"] == "tool.call":
-                await renderer.on_tool_call(event["name"], event["args"])
-            elif event["type"] == "tool.output":
-                await renderer.on_tool_output(event["name"], event["output"])
+            received = time.perf_counter()
+            # Ordered by frequency: deltas dominate long answers.
+            if isinstance(event, TextDelta):
+                trace.token()
+                await renderer.on_text_delta(event.delta)
+            elif isinstance(event, TextDone):
+                # An upstream error is displayed like an answer, but the turn has failed
+                answer = None if event.error else event.text
+                await renderer.on_text_done(event.text)
+            elif isinstance(event, ToolCall):
+                trace.tool_call(event.call_id, event.name)
+                await renderer.on_tool_call(event.name, event.args)
+            elif isinstance(event, ToolOutput):
+                trace.tool_output(event.call_id, event.name)
+                await renderer.on_tool_output(event.name, event.output)
+            elif isinstance(event, ResponseCreated):
+                trace.mark("response_created")
+            elif isinstance(event, Usage):
+                trace.set(input_tokens=event.input_tokens, output_tokens=event.output_tokens)
+                logger.info(
+                    "MAS usage: input=%s output=%s total=%s",
+                    event.input_tokens, event.output_tokens, event.total_tokens,
+                )
+            trace.rendered(time.perf_counter() - received)
     except Exception as e:
-        logger.error(f"Error: {e}")
+        error = e
+        logger.error("MAS stream failed: %s", e, exc_info=True)
+        await renderer.flush()
         await cl.Message(content=str(e)).send()
 
+    if answer:
+        # Only answered turns enter the history, so a failed question is not resent next time
+        history.append({"role": "user", "content": message.content})
+        history.append({"role": "assistant", "content": answer})
+    trace.set(frames=renderer.frames_sent)
+    trace.finish(error)
+    # The turn's message/step writes are buffered; persist them now rather than on the timer.
+    lakebase.flush_writes_soon()
+    if response_cache is not None:
+        logger.debug("Response cache: %s", response_cache.stats())
+
 
 @cl.on_chat_resume
 async def on_chat_resume():
     identity = await ensure_identity()
-    logger.info(f"Identity: {identity}")
+    logger.debug("Identity: %s", identity)
     logger.info("Chat resumed")
 
@@ -0,0 +1,312 @@
+# services/concurrency.py
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import statistics
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from pydantic import BaseModel
+
+from utils.logging import logger
+
+# (position, estimated wait in seconds); position 0 means the call was admitted
+QueueListener = Callable[[int, float], Awaitable[None]]
+
+_queue_listener: contextvars.ContextVar[Optional[QueueListener]] = contextvars.ContextVar(
+    "mas_queue_listener", default=None
+)
+
+
+def set_queue_listener(listener: Optional[QueueListener]) -> None:
+    """Report queue position and wait estimates for MAS calls made by this task (and its child tasks)."""
+    _queue_listener.set(listener)
+
+
+class Overloaded(RuntimeError):
+    """No slot could be granted: the local queue is full or the wait timed out."""
+
+
+class LimiterStats(BaseModel):
+    limit: int
+    in_flight: int = 0
+    queued: int = 0
+    admitted: int = 0
+    queued_total: int = 0
+    rejected: int = 0
+    overloads: int = 0
+    latency_backoffs: int = 0
+    wait_ms_avg: float = 0.0
+    first_byte_ms_p50_long: float = 0.0
+    first_byte_ms_p50_short: float = 0.0
+
+
+class Permit:
+    """A held concurrency slot; the caller reports how the upstream call went."""
+
+    __slots__ = ("user", "queued_s", "first_byte_s", "overload")
+
+    def __init__(self, user: str, queued_s: float):
+        self.user = user
+        self.queued_s = queued_s
+        self.first_byte_s: Optional[float] = None
+        self.overload = False
+
+    def first_byte(self, seconds: float) -> None:
+        self.first_byte_s = seconds
+
+    def overloaded(self) -> None:
+        self.overload = True
+
+
+class _Waiter:
+    __slots__ = ("user", "future")
+
+    def __init__(self, user: str, future: asyncio.Future):
+        self.user = user
+        self.future = future
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for calls to the serving endpoint, with a fair queue.
+
+    The limit grows by about one slot per window of successful calls while the limit is
+    actually in use, and shrinks multiplicatively when the endpoint answers 429/503 or misses
+    the first-byte deadline. Time to first byte also counts, but only as a gradient: while
+    the limit is in use, the median of the last few calls must exceed `latency_tolerance`
+    times the median of a long window. An agent's first byte depends on the question (tool
+    calls, Genie queries), so individual slow answers, or a minimum-latency baseline, say
+    nothing about load; a sustained shift of the whole distribution does. Callers over the limit wait in per-user FIFOs that are served round
+    robin, so one user's burst cannot starve everyone else; an optional per-user cap bounds
+    how many slots a single user holds. Waiters get their position and a wait estimate
+    through the task's queue listener (see set_queue_listener).
+    """
+
+    # Smoothing for the slot hold time
+    _EWMA = 0.2
+    # First-byte samples in the short and long windows, and the long-window fill needed
+    # before the latency gradient is trusted
+    _SHORT_WINDOW = 20
+    _LONG_WINDOW = 200
+    _MIN_SAMPLES = 50
+    # Assumed slot hold time until turns have been observed, for wait estimates
+    _HOLD_PRIOR_S = 15.0
+
+    def __init__(
+        self,
+        *,
+        initial: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        per_user: int = 0,
+        latency_tolerance: float = 3.0,
+        backoff: float = 0.7,
+        max_queue: int = 200,
+        queue_timeout_s: float = 120.0,
+        update_interval_s: float = 1.0,
+    ) -> None:
+        self._limit = float(min(max(initial, min_limit), max_limit))
+        self._min = min_limit
+        self._max = max_limit
+        self._per_user = per_user
+        self._tolerance = latency_tolerance
+        self._backoff = backoff
+        self._max_queue = max_queue
+        self._queue_timeout_s = queue_timeout_s
+        self._update_interval_s = update_interval_s
+
+        self._in_flight = 0
+        self._user_in_flight: Dict[str, int] = {}
+        # Per-user FIFOs; the first key is served next and moves to the back (round robin)
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._queued = 0
+
+        self._short: Deque[float] = deque(maxlen=self._SHORT_WINDOW)
+        self._long: Deque[float] = deque(maxlen=self._LONG_WINDOW)
+        self._short_p50_s: Optional[float] = None
+        self._hold_s = self._HOLD_PRIOR_S
+        self._last_decrease = 0.0
+        self._wait_total_s = 0.0
+        self._waits = 0
+        self._stats = LimiterStats(limit=self.limit)
+
+    @property
+    def limit(self) -> int:
+        return max(self._min, int(self._limit))
+
+    def has_capacity(self) -> bool:
+        """A call started now would be admitted without queueing."""
+        return not self._queued and self._in_flight < self.limit
+
+    # ---------- Acquire / release ----------
+
+    @contextlib.asynccontextmanager
+    async def slot(self, user: str) -> AsyncIterator[Permit]:
+        """Hold one slot for the duration of an upstream call (waiting in the fair queue if needed)."""
+        queued_s = await self._acquire(user)
+        permit = Permit(user, queued_s)
+        started = time.monotonic()
+        try:
+            yield permit
+        finally:
+            self._release(user)
+            self._adapt(permit, time.monotonic() - started)
+            self._wake()
+
+    def _eligible(self, user: str) -> bool:
+        return not self._per_user or self._user_in_flight.get(user, 0) < self._per_user
+
+    def _admit(self, user: str) -> None:
+        self._in_flight += 1
+        self._user_in_flight[user] = self._user_in_flight.get(user, 0) + 1
+        self._stats.admitted += 1
+
+    def _release(self, user: str) -> None:
+        self._in_flight -= 1
+        remaining = self._user_in_flight.get(user, 1) - 1
+        if remaining:
+            self._user_in_flight[user] = remaining
+        else:
+            self._user_in_flight.pop(user, None)
+
+    async def _acquire(self, user: str) -> float:
+        if not self._queued and self._in_flight < self.limit and self._eligible(user):
+            self._admit(user)
+            return 0.0
+        if self._queued >= self._max_queue:
+            self._stats.rejected += 1
+            raise Overloaded("The assistant is busy right now; please try again in a moment.")
+
+        waiter = _Waiter(user, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(user, deque()).append(waiter)
+        self._queued += 1
+        self._stats.queued_total += 1
+        self._wake()  # capacity may be free for this user while the queue head is at its per-user cap
+        listener = _queue_listener.get()
+        started = time.monotonic()
+        deadline = started + self._queue_timeout_s
+        reported = None
+        try:
+            while not waiter.future.done():
+                if listener is not None:
+                    position, eta_s = self.position(waiter)
+                    # Only touch the status card when something visible changed
+                    if (position, round(eta_s)) != reported:
+                        reported = (position, round(eta_s))
+                        await listener(position, eta_s)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats.rejected += 1
+                    raise Overloaded(
+                        f"The assistant is busy; no capacity freed up within {self._queue_timeout_s:.0f} s. "
+                        "Please try again."
+                    )
+                await asyncio.wait({waiter.future}, timeout=min(self._update_interval_s, remaining))
+            if listener is not None:
+                await listener(0, 0.0)
+        except BaseException:
+            if waiter.future.done():
+                # Admitted while bailing out (cancelled, listener failed): hand the slot on.
+                self._release(user)
+                self._wake()
+            else:
+                waiter.future.cancel()
+                self._dequeue(waiter)
+            raise
+
+        waited = time.monotonic() - started
+        self._wait_total_s += waited
+        self._waits += 1
+        return waited
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.user)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+            self._queued -= 1
+        except ValueError:
+            return
+        if not queue:
+            del self._queues[waiter.user]
+
+    def _wake(self) -> None:
+        while self._queues and self._in_flight < self.limit:
+            user = next((u for u in self._queues if self._eligible(u)), None)
+            if user is None:
+                return
+            queue = self._queues.pop(user)
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._queues[user] = queue
+            self._admit(user)
+            waiter.future.set_result(None)
+
+    # ---------- Adaptation ----------
+
+    def _adapt(self, permit: Permit, held_s: float) -> None:
+        saturated = self._in_flight + 1 >= self.limit
+        if permit.overload:
+            self._stats.overloads += 1
+            self._decrease("endpoint overloaded")
+            return
+        if permit.first_byte_s is None:
+            return  # cancelled or failed before the first byte: no signal either way
+
+        self._hold_s += (held_s - self._hold_s) * self._EWMA
+        self._short.append(permit.first_byte_s)
+        self._long.append(permit.first_byte_s)
+        self._short_p50_s = statistics.median(self._short)
+
+        if saturated and len(self._long) >= self._MIN_SAMPLES and (
+            self._short_p50_s > statistics.median(self._long) * self._tolerance
+        ):
+            self._stats.latency_backoffs += 1
+            self._decrease("first-byte latency rising under load")
+        elif saturated and self._limit < self._max:
+            # Additive increase: about +1 per limit's worth of successful calls
+            self._limit = min(self._max, self._limit + 1 / self._limit)
+
+    def _decrease(self, reason: str) -> None:
+        now = time.monotonic()
+        # One decrease per observed round trip; calls that were already in flight carry stale news.
+        if now - self._last_decrease < (self._short_p50_s or 1.0):
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self._limit = max(self._min, self._limit * self._backoff)
+        if self.limit != previous:
+            logger.warning("MAS concurrency limit %d -> %d (%s)", previous, self.limit, reason)
+
+    # ---------- Queue position ----------
+
+    def position(self, waiter: _Waiter) -> tuple[int, float]:
+        """1-based position under round-robin service, and the estimated wait in seconds."""
+        users = list(self._queues)
+        try:
+            rank = users.index(waiter.user)
+            index = self._queues[waiter.user].index(waiter)
+        except ValueError:
+            return 0, 0.0
+        ahead = index
+        for i, user in enumerate(users):
+            if user != waiter.user:
+                ahead += min(len(self._queues[user]), index + 1 if i < rank else index)
+        position = ahead + 1
+        return position, position * self._hold_s / self.limit
+
+    def stats(self) -> LimiterStats:
+        return self._stats.model_copy(update={
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "wait_ms_avg": round(self._wait_total_s / self._waits * 1000, 1) if self._waits else 0.0,
+            "first_byte_ms_p50_long": round(statistics.median(self._long) * 1000, 1) if self._long else 0.0,
+            "first_byte_ms_p50_short": round((self._short_p50_s or 0.0) * 1000, 1),
+        })
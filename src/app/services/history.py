@@ -0,0 +1,127 @@
+# services/history.py
+from __future__ import annotations
+
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils.logging import logger
+
+
+def message_text(msg: Dict[str, Any]) -> str:
+    """Text of a message's content; works for string content and [{type,text}, ...] blocks."""
+    c = msg.get("content", "")
+    if isinstance(c, str):
+        return c
+    if isinstance(c, list):
+        return "".join(block.get("text", "") for block in c if isinstance(block, dict))
+    return ""
+
+
+class LengthCounter:
+    """
+    Measures message length in tokens when a tokenizer is available (tiktoken), otherwise in
+    characters. `budget` is expressed in the same unit, so callers never need to care which.
+    """
+
+    def __init__(self, count: Callable[[str], int], unit: str, budget: int):
+        self.count = count
+        self.unit = unit
+        self.budget = budget
+
+
+_counter_lock = threading.Lock()
+
+
+def get_length_counter(encoding: str, max_tokens: int, max_chars: int) -> LengthCounter:
+    """
+    Shared counter for these settings. The first call may download the encoding (tiktoken,
+    no timeout), so call it from a worker thread; concurrent first calls load it once.
+    """
+    with _counter_lock:
+        return _load_length_counter(encoding, max_tokens, max_chars)
+
+
+@lru_cache(maxsize=None)
+def _load_length_counter(encoding: str, max_tokens: int, max_chars: int) -> LengthCounter:
+    try:
+        import tiktoken
+
+        enc = tiktoken.get_encoding(encoding)
+        # disallowed_special=() so user text containing "<|endoftext|>" is counted, not rejected
+        return LengthCounter(lambda s: len(enc.encode(s, disallowed_special=())), "tokens", max_tokens)
+    except Exception as e:  # ImportError, or the encoding file could not be fetched
+        logger.warning(f"Tokenizer '{encoding}' unavailable ({e}); history budget falls back to chars")
+        return LengthCounter(len, "chars", max_chars)
+
+
+class ConversationHistory:
+    """
+    Per-session OpenAI-style message history, maintained incrementally.
+
+    Keeps the earliest system message plus a ring buffer of the last `max_turns` non-system
+    messages, each stored with its length computed once on append. Building the prompt walks
+    at most `max_turns` cached entries, so its cost does not grow with the thread length.
+    """
+
+    def __init__(self, max_turns: int, counter: LengthCounter):
+        self._counter = counter
+        self._system: Optional[Dict[str, Any]] = None
+        self._recent: Deque[Tuple[Dict[str, Any], int]] = deque(maxlen=max_turns)
+
+    @classmethod
+    def from_messages(
+        cls, messages: List[Dict[str, Any]], max_turns: int, counter: LengthCounter
+    ) -> "ConversationHistory":
+        history = cls(max_turns, counter)
+        # Only the tail can survive the ring buffer; skip measuring the rest.
+        system = next((m for m in messages if m.get("role") == "system"), None)
+        if system is not None:
+            history.append(system)
+        tail: List[Dict[str, Any]] = []
+        for m in reversed(messages):
+            if len(tail) >= max_turns:
+                break
+            if m.get("role") != "system":
+                tail.append(m)
+        for m in reversed(tail):
+            history.append(m)
+        return history
+
+    def append(self, msg: Dict[str, Any]) -> None:
+        if msg.get("role") == "system":
+            if self._system is None:
+                self._system = msg
+            return
+        self._recent.append((msg, self._counter.count(message_text(msg))))
+
+    def build(self, user_text: str) -> List[Dict[str, Any]]:
+        """
+        Build the prompt:
+          - Keep the earliest system message (if present)
+          - Keep up to max_turns most recent non-system messages
+          - Enforce the token (or char) budget, walking from the newest backwards
+          - Append the current user message last
+        """
+        budget = self._counter.budget
+        trimmed: List[Dict[str, Any]] = []
+        for msg, length in reversed(self._recent):
+            if length > budget and trimmed:
+                break
+            budget -= length
+            trimmed.append(msg)
+        trimmed.reverse()  # restore chronological order
+
+        prefix = [self._system] if self._system is not None else []
+        messages = [*prefix, *trimmed, {"role": "user", "content": user_text}]
+
+        logger.debug(
+            "history_built",
+            extra={
+                "system": len(prefix),
+                "kept_turns": len(trimmed),
+                f"total_{self._counter.unit}": self._counter.budget - budget,
+            },
+        )
+        return messages
@@ -0,0 +1,165 @@
+# services/http_pool.py
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from pydantic import BaseModel
+
+from services.tracing import current_trace
+from utils.logging import logger
+
+
+class PoolStats(BaseModel):
+    http2: bool
+    active_connections: int = 0
+    idle_connections: int = 0
+    requests: int = 0
+    new_connections: int = 0
+    reused_connections: int = 0
+    handshake_ms_avg: float = 0.0
+    handshake_ms_last: float = 0.0
+
+
+class _RequestTrace:
+    """httpcore trace hook for a single request: detects new vs reused connections."""
+
+    def __init__(self, pool: "HttpPool"):
+        self._pool = pool
+        self._connect_started: Optional[float] = None
+        self._step_started: Optional[float] = None
+        self._new_connection = False
+        self._handshake_s = 0.0
+
+    async def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.started":
+            self._new_connection = True
+            self._connect_started = self._step_started = time.perf_counter()
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            # One span per step (mas.connect_tcp, then mas.start_tls for TLS), back to back, so
+            # the handshake is counted once; it ends after start_tls, or on connect for plain TCP.
+            if self._connect_started is not None:
+                ended = time.perf_counter()
+                self._handshake_s = ended - self._connect_started
+                trace = current_trace()
+                if trace is not None:
+                    trace.add_span(f"mas.{event_name.split('.')[1]}", self._step_started, ended)
+                self._step_started = ended
+        elif event_name.endswith("send_request_headers.started"):
+            self._pool._record_request(self._new_connection, self._handshake_s)
+
+
+class HttpPool:
+    """
+    Process-wide pooled httpx.AsyncClient for calls to the serving endpoint.
+
+    One client is shared across all chat turns, so TCP/TLS handshakes are paid once per
+    connection rather than once per message. HTTP/2 is used when the optional `h2` package
+    is installed, letting concurrent streams multiplex over a single connection.
+    """
+
+    def __init__(
+        self,
+        *,
+        timeout_s: float,
+        connect_timeout_s: Optional[float] = None,
+        read_timeout_s: Optional[float] = None,
+        http2: bool = True,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry_s: float = 60.0,
+    ) -> None:
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("h2 not installed; MAS HTTP pool falling back to HTTP/1.1")
+                http2 = False
+
+        self._http2 = http2
+        self._timeout = httpx.Timeout(
+            timeout_s,
+            connect=connect_timeout_s if connect_timeout_s is not None else timeout_s,
+            read=read_timeout_s if read_timeout_s is not None else timeout_s,
+        )
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry_s,
+        )
+        self._transport: Optional[httpx.AsyncHTTPTransport] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self._requests = 0
+        self._new_connections = 0
+        self._handshake_total_s = 0.0
+        self._last_handshake_s = 0.0
+
+    # ---------- Lifecycle ----------
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+        self._ensure_client()
+        logger.info(
+            f"MAS HTTP pool started (http2={self._http2}, "
+            f"max_connections={self._limits.max_connections}, "
+            f"max_keepalive={self._limits.max_keepalive_connections})"
+        )
+
+    async def close(self) -> None:
+        if self._client is None:
+            return
+        client, self._client, self._transport = self._client, None, None
+        await client.aclose()
+        logger.info(f"MAS HTTP pool closed: {self.stats()}")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared client; created lazily if the app startup hook has not run (e.g. scripts)."""
+        return self._ensure_client()
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._transport = httpx.AsyncHTTPTransport(http2=self._http2, limits=self._limits)
+            self._client = httpx.AsyncClient(transport=self._transport, timeout=self._timeout)
+        return self._client
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return self._timeout
+
+    # ---------- Instrumentation ----------
+
+    def trace_extensions(self) -> Dict[str, Any]:
+        """Per-request `extensions=` argument enabling connection reuse/handshake tracking."""
+        return {"trace": _RequestTrace(self)}
+
+    def _record_request(self, new_connection: bool, handshake_s: float) -> None:
+        self._requests += 1
+        if new_connection:
+            self._new_connections += 1
+            self._handshake_total_s += handshake_s
+            self._last_handshake_s = handshake_s
+
+    def stats(self) -> PoolStats:
+        active = idle = 0
+        # httpx keeps the httpcore pool private; read it best-effort for live connection counts.
+        pool = getattr(self._transport, "_pool", None)
+        for conn in getattr(pool, "connections", None) or []:
+            if conn.is_idle():
+                idle += 1
+            else:
+                active += 1
+        avg = self._handshake_total_s / self._new_connections if self._new_connections else 0.0
+        return PoolStats(
+            http2=self._http2,
+            active_connections=active,
+            idle_connections=idle,
+            requests=self._requests,
+            new_connections=self._new_connections,
+            reused_connections=self._requests - self._new_connections,
+            handshake_ms_avg=round(avg * 1000, 2),
+            handshake_ms_last=round(self._last_handshake_s * 1000, 2),
+        )
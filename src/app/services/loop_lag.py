@@ -0,0 +1,196 @@
+# services/loop_lag.py
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.tracing import LatencyHistogram, task_trace
+from utils.logging import logger
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Innermost frames kept per captured stack
+_STACK_LIMIT = 40
+# Distinct blocking sites counted; further ones are counted under "other"
+_MAX_SITES = 100
+
+
+class LoopLagMonitor:
+    """
+    Event-loop lag and slow-callback watchdog.
+
+    A heartbeat task measures how late a timer scheduled every `interval_s` actually fires;
+    anything that holds the loop (a synchronous SDK call, pandas, a large json.loads) shows
+    up as lag for every session served by the process. By the time the heartbeat runs again
+    the culprit has returned, so a watchdog thread keeps checking the heartbeat's deadline
+    and, once the loop is `stall_ms` overdue, captures the loop thread's stack
+    (sys._current_frames) and the running task. The task's context gives the chat turn
+    (RequestTrace) it belongs to, which also gets a "loop_stall" span.
+
+    The `worst` longest stalls are kept with their stacks; `snapshot()` summarizes them
+    without stacks or users, `dump()` writes everything. A stall seen without a stack was
+    shorter than the watchdog could catch, or many small callbacks saturated the loop.
+    """
+
+    def __init__(
+        self,
+        interval_s: float = 0.05,
+        stall_ms: float = 100.0,
+        warn_ms: float = 500.0,
+        worst: int = 20,
+        dump_dir: Optional[str] = None,
+    ):
+        self._interval_s = interval_s
+        self._stall_ms = stall_ms
+        self._warn_ms = warn_ms
+        self._keep = worst
+        self._dump_dir = dump_dir
+        self._histogram = LatencyHistogram()
+        self._stall_histogram = LatencyHistogram()
+        self._last_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        # Deadline (loop.time(), i.e. monotonic) of the next heartbeat, set by the loop
+        self._due = 0.0
+        # Capture handed from the watchdog thread to the loop: (deadline, record, trace)
+        self._lock = threading.Lock()
+        self._capture: Optional[Tuple[float, Dict[str, Any], Any]] = None
+        self._worst: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._seq = itertools.count()
+        self._sites: Dict[str, int] = {}
+
+    def start(self) -> None:
+        if self._task is not None or self._interval_s <= 0:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._due = self._loop.time() + self._interval_s
+        self._task = self._loop.create_task(self._run())
+        if self._stall_ms > 0:
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._stopped.set()
+        self._watchdog = None
+
+    # ---------- Loop side ----------
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._due = scheduled = loop.time() + self._interval_s
+            await asyncio.sleep(self._interval_s)
+            lag_ms = max(0.0, (loop.time() - scheduled) * 1000)
+            self.observe(lag_ms)
+            if self._stall_ms > 0 and lag_ms >= self._stall_ms:
+                self._stalled(scheduled, lag_ms)
+
+    def observe(self, lag_ms: float) -> None:
+        self._last_ms = lag_ms
+        self._histogram.observe(lag_ms)
+
+    def _stalled(self, scheduled: float, lag_ms: float) -> None:
+        with self._lock:
+            capture, self._capture = self._capture, None
+        if capture is not None and capture[0] == scheduled:
+            _, record, trace = capture
+        else:
+            record, trace = {"site": None, "task": None, "stack": None}, None
+        record.update(lag_ms=round(lag_ms, 1), at=time.time())
+        if trace is not None:
+            now = time.perf_counter()
+            trace.add_span("loop_stall", now - lag_ms / 1000, now, site=record["site"])
+
+        self._stall_histogram.observe(lag_ms)
+        site = record["site"] or "unknown"
+        if site not in self._sites and len(self._sites) >= _MAX_SITES:
+            site = "other"
+        self._sites[site] = self._sites.get(site, 0) + 1
+        entry = (lag_ms, next(self._seq), record)
+        if len(self._worst) < self._keep:
+            heapq.heappush(self._worst, entry)
+        elif self._keep and lag_ms > self._worst[0][0]:
+            heapq.heapreplace(self._worst, entry)
+        if lag_ms >= self._warn_ms:
+            logger.warning("Event loop stalled %.0f ms at %s (trace %s)", lag_ms, site, record.get("trace_id"))
+
+    # ---------- Watchdog thread ----------
+
+    def _watch(self) -> None:
+        captured = 0.0
+        # Poll often enough to catch a stall just over the threshold while it is still running
+        poll_s = min(self._interval_s, self._stall_ms / 4000)
+        while not self._stopped.wait(poll_s):
+            due = self._due
+            if due == captured or (time.monotonic() - due) * 1000 < self._stall_ms:
+                continue
+            captured = due
+            record, trace = self._sample()
+            with self._lock:
+                self._capture = (due, record, trace)
+
+    def _sample(self) -> Tuple[Dict[str, Any], Any]:
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = traceback.extract_stack(frame, limit=_STACK_LIMIT) if frame is not None else []
+        site = next((f for f in reversed(stack) if f.filename.startswith(APP_ROOT)), stack[-1] if stack else None)
+        record: Dict[str, Any] = {
+            "site": f"{os.path.relpath(site.filename, APP_ROOT)}:{site.lineno} {site.name}" if site else None,
+            "stack": [f"{f.filename}:{f.lineno} {f.name}: {f.line}" for f in stack],
+            "task": None,
+        }
+        trace = None
+        task = asyncio.current_task(self._loop)
+        if task is not None:
+            record["task"] = task.get_name()
+            trace = task_trace(task)
+            if trace is not None:
+                record.update(trace_id=trace.trace_id, user=trace.user, endpoint=trace.endpoint)
+        return record, trace
+
+    # ---------- Export ----------
+
+    def worst(self) -> List[Dict[str, Any]]:
+        """Longest stalls first, with stacks and the user of the chat turn (if any)."""
+        return [record for _, _, record in sorted(self._worst, reverse=True)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Lag histogram plus a stall summary without stacks or user data."""
+        top_sites = sorted(self._sites.items(), key=lambda kv: kv[1], reverse=True)[:10]
+        return {
+            "interval_ms": self._interval_s * 1000,
+            "last_ms": round(self._last_ms, 2),
+            **self._histogram.snapshot(),
+            "stalls": {
+                "threshold_ms": self._stall_ms,
+                **self._stall_histogram.snapshot(),
+                "sites": dict(top_sites),
+                "worst": [
+                    {k: r.get(k) for k in ("lag_ms", "at", "site", "task", "trace_id", "endpoint")}
+                    for r in self.worst()
+                ],
+            },
+        }
+
+    def dump(self, path: Optional[str] = None) -> Optional[str]:
+        """Write the lag histograms and the worst stalls (with stacks) to a local JSON file."""
+        path = path or (os.path.join(self._dump_dir, "loop_stalls.json") if self._dump_dir else None)
+        if path is None:
+            return None
+        with open(path, "w") as f:
+            json.dump({"lag": self.snapshot(), "worst": self.worst()}, f, indent=2, default=str)
+        return path
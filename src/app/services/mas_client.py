@@ -1,15 +1,35 @@
 # services/mas_client.py
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import json
-from typing import AsyncIterator, Any, Dict, List, Optional
-
-import httpx
-from openai import AsyncOpenAI
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Any, Dict, List, Optional
 
 from auth.identity import Identity
 from config import settings
-from utils.logging import logger
+from services.concurrency import AdaptiveLimiter, LimiterStats, Permit
+from services.http_pool import HttpPool, PoolStats
+from services.resilience import (
+    MASHTTPError,
+    ResumeFilter,
+    RetryPolicy,
+    RetryStats,
+    first_to_respond,
+    parse_retry_after,
+)
+from services.sse_parser import iter_sse_json
+from services.tracing import current_trace
+from utils.logging import get_logger, logger
+
+stream_logger = get_logger("stream")
+
+# Responses that mean the endpoint is shedding load (the concurrency limit backs off)
+_OVERLOAD_STATUS = (429, 503)
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
 
 class MASChatClient:
@@ -19,15 +39,83 @@ class MASChatClient:
     - PAT (auth_type == "pat"): use OpenAI-compatible client for streaming.
     - OBO (auth_type == "obo"): use raw REST SSE to /invocations for streaming.
 
+    Both transports share one process-wide HttpPool, so connections (and their TLS
+    handshakes) are reused across chat turns instead of being rebuilt per message.
+    Calls go through an AdaptiveLimiter (when enabled): at most `limit` run at once and
+    the rest wait in a fair per-user queue instead of piling up on a saturated endpoint.
+    Failed streams are retried with backoff (optionally hedged when the first byte is late)
+    and resume without repeating what the caller has already received.
+
     Public:
       - stream_raw(identity, messages) -> async iterator of raw events (dicts or SDK objects)
       - create_once(identity, messages) -> one-shot non-streaming response (dict)
+      - startup() / aclose() -> open/close the shared connection pool (app lifecycle)
+      - pool_stats() -> connection pool statistics
+      - limiter_stats() -> concurrency limit / queue statistics (None when disabled)
+      - retry_stats() -> retry / resume / hedge counters
     """
 
     def __init__(self) -> None:
         self._base_url: str = settings.agent_base_url.rstrip("/")
         self._endpoint: str = settings.agent_endpoint
-        self._timeout_s: int = getattr(settings, "http_timeout_s", 180)
+        self._first_byte_timeout_s: float = settings.http_first_byte_timeout_s
+        self._pool = HttpPool(
+            timeout_s=settings.http_timeout_s,
+            connect_timeout_s=settings.http_connect_timeout_s,
+            read_timeout_s=settings.http_read_timeout_s,
+            http2=settings.http2_enabled,
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry_s=settings.http_keepalive_expiry_s,
+        )
+        self._retry = RetryPolicy(
+            attempts=settings.mas_retry_attempts,
+            backoff_s=settings.mas_retry_backoff_s,
+            backoff_max_s=settings.mas_retry_backoff_max_s,
+        )
+        self._hedge_after_s: float = settings.mas_hedge_after_s
+        self._retry_stats = RetryStats()
+        self._limiter: Optional[AdaptiveLimiter] = None
+        if settings.mas_concurrency_enabled:
+            self._limiter = AdaptiveLimiter(
+                initial=settings.mas_concurrency_initial,
+                min_limit=settings.mas_concurrency_min,
+                max_limit=settings.mas_concurrency_max,
+                per_user=settings.mas_concurrency_per_user,
+                latency_tolerance=settings.mas_latency_tolerance,
+                max_queue=settings.mas_queue_max,
+                queue_timeout_s=settings.mas_queue_timeout_s,
+            )
+
+    # ---------- Lifecycle ----------
+
+    async def startup(self) -> None:
+        await self._pool.start()
+
+    async def aclose(self) -> None:
+        await self._pool.close()
+
+    def pool_stats(self) -> PoolStats:
+        return self._pool.stats()
+
+    def limiter_stats(self) -> Optional[LimiterStats]:
+        return self._limiter.stats() if self._limiter is not None else None
+
+    def retry_stats(self) -> RetryStats:
+        return self._retry_stats.model_copy()
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, identity: Identity) -> AsyncIterator[Optional[Permit]]:
+        """Concurrency slot for one upstream call; the fair queue is keyed by user."""
+        if self._limiter is None:
+            yield None
+            return
+        started = time.perf_counter()
+        async with self._limiter.slot(identity.email or identity.auth_type) as permit:
+            trace = current_trace()
+            if permit.queued_s and trace is not None:
+                trace.add_span("mas.queue", started, time.perf_counter())
+            yield permit
 
     # ---------- Public API ----------
 
@@ -37,20 +125,74 @@ class MASChatClient:
         """
         Yield raw streaming events. Choose transport based on identity.auth_type.
         `messages` must be OpenAI-style: [{"role":"user","content":"..."}] (+ history if desired).
+
+        Connect errors, 429/5xx responses and streams that drop mid-answer are retried with
+        exponential backoff and jitter. A retry re-runs the request, but events the caller
+        already received (text, tool calls) are filtered out, so the answer continues
+        where it stopped (see ResumeFilter).
         """
         bearer = identity.token_source.bearer_token()
         if not bearer:
             raise RuntimeError("Missing bearer token")
 
-        if identity.auth_type == "pat":
-            async for ev in self._stream_rest_sse(bearer, messages):
-                yield ev
-            # async for ev in self._stream_openai(bearer, messages): Commented out for now as it is causing issues with out of order events
-            #     yield ev
-        else:
-            # Default to OBO path
-            async for ev in self._stream_rest_sse(bearer, messages):
-                yield ev
+        resume = ResumeFilter()
+        retry = 0
+        while True:
+            try:
+                async for ev in first_to_respond(
+                    lambda: self._attempt(identity, messages), self._hedge_after_s, self._may_hedge
+                ):
+                    ev = resume.accept(ev)
+                    if ev is not None:
+                        yield ev
+                break
+            except Exception as e:
+                if resume.completed:
+                    break  # the whole answer was delivered; only the connection teardown failed
+                if not self._retry.retryable(e):
+                    raise
+                if retry >= self._retry.attempts:
+                    self._retry_stats.exhausted += 1
+                    raise
+                delay = self._retry.delay(retry, e)
+                retry += 1
+                self._retry_stats.retries += 1
+                if resume.delivered_anything:
+                    self._retry_stats.resumed += 1
+                logger.warning(
+                    "MAS call failed (%s: %s); retry %d/%d in %.2f s",
+                    type(e).__name__, e, retry, self._retry.attempts, delay,
+                )
+                trace = current_trace()
+                started = time.perf_counter()
+                await asyncio.sleep(delay)
+                if trace is not None:
+                    trace.add_span("mas.retry_backoff", started, time.perf_counter(), retry=retry)
+                resume.restart()
+
+        if resume.diverged_at is not None:
+            logger.info("Retried MAS stream diverged from the shown text at char %d", resume.diverged_at)
+
+    def _may_hedge(self) -> bool:
+        # A hedge is a second upstream call: only when a slot is free right away.
+        if self._limiter is not None and not self._limiter.has_capacity():
+            return False
+        self._retry_stats.hedges += 1
+        return True
+
+    async def _attempt(self, identity: Identity, messages: List[Dict[str, Any]]) -> AsyncIterator[Any]:
+        """One upstream call in its own concurrency slot (the token is re-read per attempt)."""
+        bearer = identity.token_source.bearer_token()
+        async with self._slot(identity) as permit:
+            if identity.auth_type == "pat":
+                async for ev in self._stream_rest_sse(bearer, messages, permit):
+                    yield ev
+                # async for ev in self._stream_openai(bearer, messages): Commented out for now as it is causing issues with out of order events
+                #     yield ev
+            else:
+                # Default to OBO path
+                async for ev in self._stream_rest_sse(bearer, messages, permit):
+                    yield ev
 
     async def create_once(
         self, identity: Identity, messages: List[Dict[str, Any]]
@@ -62,19 +204,19 @@ class MASChatClient:
         if not bearer:
             raise RuntimeError("Missing bearer token")
 
-        if identity.auth_type == "pat":
-            client = self._client_openai(bearer)
-            resp = await client.responses.create(
-                model=self._endpoint,
-                input=messages,
-                stream=False,
-            )
-            # Convert SDK object to dict (best-effort)
-            return json.loads(json.dumps(resp, default=lambda o: getattr(o, "__dict__", str(o))))
-        else:
-            url = f"{self._base_url}/{self._endpoint}/invocations"
-            async with httpx.AsyncClient(timeout=self._timeout_s) as http:
-                r = await http.post(
+        async with self._slot(identity) as permit:
+            if identity.auth_type == "pat":
+                client = self._client_openai(bearer)
+                resp = await client.responses.create(
+                    model=self._endpoint,
+                    input=messages,
+                    stream=False,
+                )
+                # Convert SDK object to dict (best-effort)
+                return json.loads(json.dumps(resp, default=lambda o: getattr(o, "__dict__", str(o))))
+            else:
+                url = f"{self._base_url}/{self._endpoint}/invocations"
+                r = await self._pool.client.post(
                     url,
                     headers={
                         "Authorization": f"Bearer {bearer}",
@@ -82,15 +224,27 @@ class MASChatClient:
                         "Accept": "application/json",
                     },
                     json={"input": messages, "stream": False},
+                    extensions=self._pool.trace_extensions(),
                 )
                 if r.status_code >= 400:
-                    raise RuntimeError(f"MAS HTTP {r.status_code}: {r.text}")
+                    if r.status_code in _OVERLOAD_STATUS and permit is not None:
+                        permit.overloaded()
+                    raise MASHTTPError(r.status_code, r.text, parse_retry_after(r.headers.get("retry-after")))
                 return r.json()
 
     # ---------- PAT path (OpenAI client) ----------
 
     def _client_openai(self, bearer: str) -> AsyncOpenAI:
-        return AsyncOpenAI(api_key=bearer, base_url=self._base_url, timeout=self._timeout_s)
+        # The SDK wrapper is cheap; the bearer differs per user, but the connections are shared.
+        # Imported on first use: the REST path does not need the SDK at startup.
+        from openai import AsyncOpenAI
+
+        return AsyncOpenAI(
+            api_key=bearer,
+            base_url=self._base_url,
+            timeout=self._pool.timeout,
+            http_client=self._pool.client,
+        )
 
     async def _stream_openai(
         self, bearer: str, messages: List[Dict[str, Any]]
@@ -99,15 +253,13 @@ class MASChatClient:
         Streaming via OpenAI-compatible SDK (works well with PAT).
         Yields SDK event objects (your normalizer already handles getattr/ dict).
         """
-        logger.info(f"[DEBUG] _stream_openai called with bearer: {bearer}")
-        logger.info(f"[DEBUG] token length: {len(bearer)}")
         client = self._client_openai(bearer)
         async with client.responses.stream(
             model=self._endpoint,
             input=messages,
         ) as stream:
             async for event in stream:
-                logger.info(f"[DEBUG] OpenAI stream event: {event}")
+                stream_logger.debug("OpenAI stream event: %s", event)
                 yield event
             # If you want the final consolidated response:
             # final = await stream.get_final_response()
@@ -116,14 +268,15 @@ class MASChatClient:
     # ---------- OBO path (direct REST SSE) ----------
 
     async def _stream_rest_sse(
-        self, bearer: str, messages: List[Dict[str, Any]]
+        self, bearer: str, messages: List[Dict[str, Any]], permit: Optional[Permit] = None
     ) -> AsyncIterator[Dict[str, Any]]:
         """
         Streaming via raw SSE from /invocations (needed for OBO).
         Yields dicts shaped like OpenAI events (with a 'type' key) so your normalizer works unchanged.
+
+        The response headers and the first event must arrive within the first-byte timeout;
+        after that only the pool's read timeout (longest gap between chunks) applies.
         """
-        logger.info(f"[DEBUG] _stream_rest_sse called with bearer: {bearer}")
-        logger.info(f"[DEBUG] token length: {len(bearer)}")
         url = f"{self._base_url}/{self._endpoint}/invocations"
         headers = {
             "Authorization": f"Bearer {bearer}",
@@ -132,34 +285,40 @@ class MASChatClient:
         }
         payload = {"input": messages, "stream": True}
 
-        async with httpx.AsyncClient(timeout=self._timeout_s) as http:
-            async with http.stream("POST", url, headers=headers, json=payload) as resp:
-                if resp.status_code >= 400:
-                    body = await resp.aread()
-                    raise RuntimeError(f"MAS HTTP {resp.status_code}: {body.decode('utf-8', errors='ignore')}")
-
-                async for line in resp.aiter_lines():
-                    if not line:
-                        continue
-                    # SSE lines can be comments (':keepalive') or 'data: {...}'
-                    if line.startswith(":"):
-                        continue
-                    if line.lower().startswith("data:"):
-                        data = line[5:].strip()
-                    else:
-                        # Some servers omit "data:" prefix; handle anyway
-                        data = line.strip()
-
-                    if not data or data == "[DONE]":
-                        continue
-
-                    try:
-                        obj = json.loads(data)
-                    except json.JSONDecodeError:
-                        # Log and continue; optionally yield as text error event
-                        logger.warning(f"SSE parse warning: {data[:200]}")
-                        continue
+        http = self._pool.client
+        trace = current_trace()
+        started = time.perf_counter()
+        async with contextlib.AsyncExitStack() as stack:
+            try:
+                async with asyncio.timeout(self._first_byte_timeout_s):
+                    resp = await stack.enter_async_context(http.stream(
+                        "POST", url, headers=headers, json=payload, extensions=self._pool.trace_extensions()
+                    ))
+                    if trace is not None:
+                        trace.add_span("mas.response_headers", started, time.perf_counter(), status=resp.status_code)
+                    if resp.status_code >= 400:
+                        body = (await resp.aread()).decode("utf-8", errors="ignore")
+                        if resp.status_code in _OVERLOAD_STATUS and permit is not None:
+                            permit.overloaded()
+                        raise MASHTTPError(resp.status_code, body, parse_retry_after(resp.headers.get("retry-after")))
 
                     # Expect MAS to send objects with "type" keys similar to OpenAI events
                     # Example types: response.output_text.delta, response.output_item.done, response.error
-                    yield obj
+                    events = iter_sse_json(resp.aiter_bytes())
+                    first = await anext(events, None)
+            except TimeoutError:
+                if permit is not None:
+                    permit.overloaded()
+                raise TimeoutError(
+                    f"MAS endpoint sent no response within {self._first_byte_timeout_s:.0f} s"
+                ) from None
+
+            if first is None:
+                return
+            if permit is not None:
+                permit.first_byte(time.perf_counter() - started)
+            if trace is not None:
+                trace.mark("mas.first_event")
+            yield first
+            async for obj in events:
+                yield obj
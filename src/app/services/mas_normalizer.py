@@ -1,59 +1,199 @@
 # services/mas_normalizer.py
-from typing import Dict, Any, AsyncIterator, List
+from __future__ import annotations
 
-async def normalize(raw_events) -> AsyncIterator[Dict[str, Any]]:
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, ClassVar, Dict, List, Optional, Union
+
+# ---------- Normalized events ----------
+
+
+@dataclass(slots=True)
+class ResponseCreated:
+    type: ClassVar[str] = "response.created"
+    response_id: Optional[str] = None
+
+
+@dataclass(slots=True)
+class TextDelta:
+    type: ClassVar[str] = "text.delta"
+    item_id: Optional[str]
+    delta: str
+
+
+@dataclass(slots=True)
+class TextDone:
+    type: ClassVar[str] = "text.done"
+    item_id: Optional[str]
+    text: str
+    # Set for the error message made from response.error: shown, but not an assistant answer
+    error: bool = False
+
+
+@dataclass(slots=True)
+class ItemAdded:
+    type: ClassVar[str] = "item.added"
+    item_id: Optional[str]
+    item_type: Optional[str]
+    name: Optional[str] = None
+
+
+@dataclass(slots=True)
+class ToolCall:
+    type: ClassVar[str] = "tool.call"
+    item_id: Optional[str]
+    name: Optional[str]
+    args: str
+    call_id: Optional[str] = None
+
+
+@dataclass(slots=True)
+class ToolOutput:
+    type: ClassVar[str] = "tool.output"
+    item_id: Optional[str]
+    name: Optional[str]
+    output: str
+    call_id: Optional[str] = None
+
+
+@dataclass(slots=True)
+class ReasoningDelta:
+    type: ClassVar[str] = "reasoning.delta"
+    item_id: Optional[str]
+    delta: str
+
+
+@dataclass(slots=True)
+class Usage:
+    type: ClassVar[str] = "usage"
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+
+
+NormalizedEvent = Union[
+    ResponseCreated, TextDelta, TextDone, ItemAdded, ToolCall, ToolOutput, ReasoningDelta, Usage
+]
+
+# ---------- Field access (chosen once per stream) ----------
+
+Getter = Callable[[Any, str], Any]
+
+
+def _dict_get(obj: Any, key: str) -> Any:
+    return obj.get(key) if isinstance(obj, dict) else None
+
+
+def _attr_get(obj: Any, key: str) -> Any:
+    return getattr(obj, key, None)
+
+
+# ---------- Handlers ----------
+
+
+def _on_created(ev: Any, get: Getter) -> Optional[NormalizedEvent]:
+    return ResponseCreated(response_id=get(get(ev, "response"), "id"))
+
+
+def _on_text_delta(ev: Any, get: Getter) -> Optional[NormalizedEvent]:
+    return TextDelta(get(ev, "item_id"), get(ev, "delta") or "")
+
+
+def _on_reasoning_delta(ev: Any, get: Getter) -> Optional[NormalizedEvent]:
+    return ReasoningDelta(get(ev, "item_id"), get(ev, "delta") or "")
+
+
+def _on_item_added(ev: Any, get: Getter) -> Optional[NormalizedEvent]:
+    item = get(ev, "item")
+    if not item:
+        return None
+    return ItemAdded(get(ev, "item_id") or get(item, "id"), get(item, "type"), get(item, "name"))
+
+
+def _item_message(ev: Any, item: Any, get: Getter) -> Optional[NormalizedEvent]:
+    parts: List[str] = []
+    for c in get(item, "content") or []:
+        t = get(c, "text")
+        if t:
+            parts.append(t)
+    return TextDone(get(ev, "item_id"), "\n".join(parts).strip())
+
+
+def _item_function_call(ev: Any, item: Any, get: Getter) -> Optional[NormalizedEvent]:
+    return ToolCall(
+        get(ev, "item_id"), get(item, "name"), get(item, "arguments") or "", get(item, "call_id")
+    )
+
+
+def _item_function_call_output(ev: Any, item: Any, get: Getter) -> Optional[NormalizedEvent]:
+    call_id = get(item, "call_id")
+    return ToolOutput(get(ev, "item_id"), call_id, get(item, "output") or "", call_id)
+
+
+_ITEM_DONE_HANDLERS: Dict[str, Callable[[Any, Any, Getter], Optional[NormalizedEvent]]] = {
+    "message": _item_message,
+    "function_call": _item_function_call,
+    "function_call_output": _item_function_call_output,
+}
+
+
+def _on_item_done(ev: Any, get: Getter) -> Optional[NormalizedEvent]:
+    item = get(ev, "item")
+    if not item:
+        return None
+    handler = _ITEM_DONE_HANDLERS.get(get(item, "type"))
+    return handler(ev, item, get) if handler else None
+
+
+def _on_completed(ev: Any, get: Getter) -> Optional[NormalizedEvent]:
+    usage = get(get(ev, "response"), "usage")
+    if not usage:
+        return None
+    return Usage(
+        input_tokens=get(usage, "input_tokens") or 0,
+        output_tokens=get(usage, "output_tokens") or 0,
+        total_tokens=get(usage, "total_tokens") or 0,
+    )
+
+
+def _on_error(ev: Any, get: Getter) -> Optional[NormalizedEvent]:
+    # Surface a final error message; upstream can display it.
+    err = get(ev, "error") or str(ev)
+    return TextDone(None, f"❌ {err}", error=True)
+
+
+_HANDLERS: Dict[str, Callable[[Any, Getter], Optional[NormalizedEvent]]] = {
+    "response.output_text.delta": _on_text_delta,
+    "response.created": _on_created,
+    "response.output_item.added": _on_item_added,
+    "response.output_item.done": _on_item_done,
+    "response.reasoning_text.delta": _on_reasoning_delta,
+    "response.reasoning_summary_text.delta": _on_reasoning_delta,
+    "response.completed": _on_completed,
+    "response.error": _on_error,
+    "error": _on_error,
+}
+
+
+async def normalize(raw_events) -> AsyncIterator[NormalizedEvent]:
     """
-    Normalize OpenAI/MAS SDK events into 4 shapes:
-      - {"type":"text.delta","item_id":str,"delta":str}
-      - {"type":"text.done","item_id":str,"text":str}
-      - {"type":"tool.call","item_id":str,"name":str,"args":str}
-      - {"type":"tool.output","item_id":str,"name":str,"output":str}
+    Normalize OpenAI/MAS SDK events into slotted event objects (see NormalizedEvent):
+      - TextDelta(item_id, delta)          <- response.output_text.delta
+      - TextDone(item_id, text[, error])   <- output_item.done (message) / response.error
+      - ToolCall(item_id, name, args)      <- output_item.done (function_call)
+      - ToolOutput(item_id, name, output)  <- output_item.done (function_call_output)
+      - ResponseCreated, ItemAdded, ReasoningDelta, Usage
+
+    Whether events are SDK objects or dicts is decided once, from the first event, and
+    each event is dispatched through a type -> handler table. Unknown types are dropped.
     """
+    get: Optional[Getter] = None
+    handlers = _HANDLERS
     async for ev in raw_events:
-        et = getattr(ev, "type", None) or (isinstance(ev, dict) and ev.get("type"))
-
-        if et == "response.output_text.delta":
-            yield {
-                "type": "text.delta",
-                "item_id": getattr(ev, "item_id", None) or (isinstance(ev, dict) and ev.get("item_id")),
-                "delta": getattr(ev, "delta", None) or (isinstance(ev, dict) and ev.get("delta")) or ""
-            }
-
-        elif et == "response.output_item.done":
-            item = getattr(ev, "item", None) or (isinstance(ev, dict) and ev.get("item"))
-            if not item:
-                continue
-            itype = getattr(item, "type", None) or (isinstance(item, dict) and item.get("type"))
-
-            if itype == "message":
-                content = getattr(item, "content", None) or (isinstance(item, dict) and item.get("content")) or []
-                parts: List[str] = []
-                for c in content or []:
-                    t = getattr(c, "text", None) or (isinstance(c, dict) and c.get("text"))
-                    if t: parts.append(t)
-                yield {
-                    "type": "text.done",
-                    "item_id": getattr(ev, "item_id", None) or (isinstance(ev, dict) and ev.get("item_id")),
-                    "text": "\n".join(parts).strip()
-                }
-
-            elif itype == "function_call":
-                yield {
-                    "type": "tool.call",
-                    "item_id": getattr(ev, "item_id", None) or (isinstance(ev, dict) and ev.get("item_id")),
-                    "name": getattr(item, "name", None) or (isinstance(item, dict) and item.get("name")),
-                    "args": getattr(item, "arguments", None) or (isinstance(item, dict) and item.get("arguments")) or ""
-                }
-
-            elif itype == "function_call_output":
-                yield {
-                    "type": "tool.output",
-                    "item_id": getattr(ev, "item_id", None) or (isinstance(ev, dict) and ev.get("item_id")),
-                    "name": getattr(item, "call_id", None) or (isinstance(item, dict) and item.get("call_id")),
-                    "output": getattr(item, "output", None) or (isinstance(item, dict) and item.get("output")) or ""
-                }
-
-        elif et == "response.error":
-            # Surface a final error message; upstream can display it.
-            err = getattr(ev, "error", None) or (isinstance(ev, dict) and ev.get("error")) or str(ev)
-            yield {"type": "text.done", "item_id": None, "text": f"❌ {err}"}
+        if get is None:
+            get = _dict_get if isinstance(ev, dict) else _attr_get
+        handler = handlers.get(get(ev, "type"))
+        if handler is None:
+            continue
+        out = handler(ev, get)
+        if out is not None:
+            yield out
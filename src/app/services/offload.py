@@ -0,0 +1,114 @@
+# services/offload.py
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import multiprocessing
+import time
+from typing import Any, Callable, Literal, Optional, TypeVar
+
+from pydantic import BaseModel
+
+from config import settings
+from utils.logging import logger
+
+T = TypeVar("T")
+
+OffloadMode = Literal["off", "thread", "process"]
+
+
+class OffloadStats(BaseModel):
+    mode: str
+    workers: int
+    inline: int = 0
+    offloaded: int = 0
+    cancelled: int = 0
+    failed: int = 0
+    in_flight: int = 0
+    queue_wait_ms_max: float = 0.0
+    run_ms_total: float = 0.0
+    run_ms_max: float = 0.0
+
+
+class CpuExecutor:
+    """
+    Bounded pool for CPU-heavy post-processing (table parsing, DataFrame typing, Parquet
+    export), so a large answer does not stall every other user's token stream.
+
+    Callers pass an estimated `cost` (cells for tables); work below `inline_below` runs on
+    the event loop, where a thread hop would cost more than it saves. At most `max_pending`
+    jobs are submitted at once; further callers wait on the event loop, not in the pool.
+    Cancelling the awaiting task (the user stopped the answer) drops a job that has not
+    started; a job already running finishes in the background and its result is discarded.
+
+    "thread" keeps results in-process and shares the GIL, which pure-Python parsing holds,
+    but the interpreter still switches back to the loop every few milliseconds. "process"
+    runs on other cores; functions and arguments must be picklable module-level objects.
+    """
+
+    def __init__(self, mode: OffloadMode = "thread", workers: int = 2, inline_below: int = 2000, max_pending: int = 16):
+        self.mode = mode
+        self._workers = max(1, workers)
+        self._inline_below = inline_below
+        self._gate = asyncio.Semaphore(max(1, max_pending))
+        self._pool: Optional[concurrent.futures.Executor] = None
+        self._stats = OffloadStats(mode=mode, workers=self._workers)
+
+    def _executor(self) -> concurrent.futures.Executor:
+        if self._pool is None:
+            if self.mode == "process":
+                # spawn: forking a process that runs an event loop and helper threads is unsafe
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    self._workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._pool = concurrent.futures.ThreadPoolExecutor(self._workers, thread_name_prefix="cpu-offload")
+            logger.info("CPU offload pool started (%s, %d workers)", self.mode, self._workers)
+        return self._pool
+
+    async def run(self, fn: Callable[..., T], *args: Any, cost: int = 0) -> T:
+        if self.mode == "off" or cost < self._inline_below:
+            self._stats.inline += 1
+            return fn(*args)
+
+        queued = time.perf_counter()
+        async with self._gate:
+            started = time.perf_counter()
+            self._stats.queue_wait_ms_max = max(self._stats.queue_wait_ms_max, (started - queued) * 1000)
+            future = self._executor().submit(fn, *args)
+            self._stats.offloaded += 1
+            self._stats.in_flight += 1
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                future.cancel()
+                self._stats.cancelled += 1
+                raise
+            except Exception:
+                self._stats.failed += 1
+                raise
+            finally:
+                self._stats.in_flight -= 1
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self._stats.run_ms_total += elapsed_ms
+                self._stats.run_ms_max = max(self._stats.run_ms_max, elapsed_ms)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> OffloadStats:
+        return self._stats.model_copy(update={
+            "run_ms_total": round(self._stats.run_ms_total, 2),
+            "run_ms_max": round(self._stats.run_ms_max, 2),
+            "queue_wait_ms_max": round(self._stats.queue_wait_ms_max, 2),
+        })
+
+
+cpu_executor = CpuExecutor(
+    settings.cpu_offload,
+    settings.cpu_offload_workers,
+    settings.cpu_offload_min_cells,
+    settings.cpu_offload_max_pending,
+)
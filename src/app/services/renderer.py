@@ -1,19 +1,67 @@
 # services/renderers.py
+import asyncio
+import time
 import chainlit as cl
 from typing import Optional
-from services.table_parser import extract_first_table
+from config import settings
+from services.offload import cpu_executor
+from services.table_parser import StreamingTableExtractor, build_table, extract_tables
+from utils.logging import get_logger
+
+logger = get_logger("stream")
 
 class ChainlitStream:
-    """Single in-flight message for assistant text, plus small cards for tool status."""
-    def __init__(self):
+    """
+    Single in-flight message for assistant text, plus small cards for tool status.
+
+    Text deltas are coalesced before being emitted over the websocket: the first token is
+    sent immediately (time-to-first-token), later ones are buffered and flushed once
+    `flush_interval_ms` has passed or `max_batch_chars` are pending. Set the interval to 0
+    to emit every delta as its own frame.
+
+    Deltas are also fed to a StreamingTableExtractor, so every markdown pipe-table in the
+    answer is already parsed when the text completes and is attached as a Dataframe element.
+    Building the DataFrames goes through the CPU offload pool for large tables.
+    """
+    def __init__(
+        self,
+        flush_interval_ms: Optional[int] = None,
+        max_batch_chars: Optional[int] = None,
+    ):
         self.status_msg: Optional[cl.Message] = None
+        self._title = ""
         self.text_msg: Optional[cl.Message] = None
         self._status_lines: list[str] = []
 
+        interval_ms = settings.stream_flush_interval_ms if flush_interval_ms is None else flush_interval_ms
+        self._flush_interval_s = max(interval_ms, 0) / 1000
+        self._max_batch_chars = settings.stream_max_batch_chars if max_batch_chars is None else max_batch_chars
+        self._pending: list[str] = []
+        self._pending_chars = 0
+        self._last_flush = 0.0
+        self._flush_lock = asyncio.Lock()
+        self._flush_timer: Optional[asyncio.Task] = None
+        self.deltas_received = 0
+        self.frames_sent = 0
+        self._tables = StreamingTableExtractor()
+
     async def start(self, title: str = "**Analyzing your query…**"):
-        self.status_msg = cl.Message(content=f"**{title}**\n\n_Status:_ initializing...")
+        self._title = f"**{title}**"
+        self.status_msg = cl.Message(content=f"{self._title}\n\n_Status:_ initializing...")
         await self.status_msg.send()
 
+    async def on_queued(self, position: int, eta_s: float):
+        """Queue position while the MAS call waits for a concurrency slot (0 once admitted)."""
+        if not self.status_msg or self._status_lines:
+            return
+        if position:
+            wait = f"{eta_s:.0f} s" if eta_s < 90 else f"{eta_s / 60:.0f} min"
+            status = f"_Status:_ waiting for capacity, position {position} in queue (about {wait})"
+        else:
+            status = "_Status:_ initializing..."
+        self.status_msg.content = f"{self._title}\n\n{status}"
+        await self.status_msg.update()
+
     async def on_tool_call(self, name: str, args: str):
         self._status_lines.append(f"🛠️ **{name or 'tool'}** started")
         await self._update_status()
@@ -32,29 +80,73 @@ class ChainlitStream:
         await self.status_msg.update()
 
     async def on_text_delta(self, token: str):
+        if not token:
+            return
+        self.deltas_received += 1
+        self._tables.feed(token)
         if self.text_msg is None:
             # Create AFTER status so this sits below it in the chat.
             self.text_msg = cl.Message(content="")
             await self.text_msg.send()
-        await self.text_msg.stream_token(token or "")
+
+        self._pending.append(token)
+        self._pending_chars += len(token)
+        if self.frames_sent == 0 or not self._flush_interval_s:
+            await self.flush()
+            return
+
+        due = self._last_flush + self._flush_interval_s - time.monotonic()
+        if due <= 0 or self._pending_chars >= self._max_batch_chars:
+            await self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.create_task(self._flush_later(due))
+
+    async def _flush_later(self, delay_s: float):
+        await asyncio.sleep(delay_s)
+        self._flush_timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Emit all buffered tokens as a single websocket frame."""
+        timer, self._flush_timer = self._flush_timer, None
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        async with self._flush_lock:
+            if not self._pending or self.text_msg is None:
+                return
+            chunk = "".join(self._pending)
+            self._pending.clear()
+            self._pending_chars = 0
+            self._last_flush = time.monotonic()
+            self.frames_sent += 1
+            await self.text_msg.stream_token(chunk)
 
     async def on_text_done(self, text: str):
+        await self.flush()
+        if self.deltas_received:
+            logger.info("Stream frames: %d frames for %d deltas", self.frames_sent, self.deltas_received)
+
         if self.text_msg is None:
             self.text_msg = cl.Message(content=text or "")
             await self.text_msg.send()
             return
 
-        # Optional: upgrade a markdown pipe-table to a DataFrame element
+        # Upgrade markdown pipe-tables to DataFrame elements. The streamed deltas were parsed
+        # as they arrived; only a final text that differs from them (e.g. an error) is parsed here.
+        # The final text is stripped, the streamed content is not.
         if text:
             try:
-                df, remainder = extract_first_table(text)
+                if text == self.text_msg.content.strip():
+                    tables, remainder = await self._build_tables(self._tables.finish())
+                else:
+                    tables, remainder = await cpu_executor.run(extract_tables, text, cost=text.count("|"))
             except Exception:
-                df, remainder = None, text
+                tables, remainder = [], text
 
-            if df is not None:
-                self.text_msg.content = (remainder or " ").strip()
+            if tables:
+                self.text_msg.content = remainder or " "
                 try:
-                    self.text_msg.elements = [cl.Dataframe(df=df, name="Results")]
+                    self.text_msg.elements = await self._table_elements(tables)
                 except Exception:
                     self.text_msg.content = text  # fallback to raw text
             else:
@@ -62,6 +154,26 @@ class ChainlitStream:
 
         await self.text_msg.update()
 
+    async def _build_tables(self, extractor: StreamingTableExtractor):
+        frames = await asyncio.gather(*(
+            cpu_executor.run(build_table, t.columns, t.rows, cost=t.cells) for t in extractor.pending
+        ))
+        extractor.resolve(list(frames))
+        return extractor.tables, extractor.text
+
+    async def _table_elements(self, tables) -> list:
+        elements = []
+        for i, df in enumerate(tables, 1):
+            name = "Results" if len(tables) == 1 else f"Results {i}"
+            elements.append(cl.Dataframe(df=df, name=name))
+            if settings.table_parquet_export:
+                from services.table_types import to_parquet
+
+                data = await cpu_executor.run(to_parquet, df, cost=df.size)
+                if data is not None:
+                    elements.append(cl.File(name=f"{name}.parquet", content=data, mime="application/vnd.apache.parquet"))
+        return elements
+
     # async def on_text_delta(self, token: str):
     #     if self.msg is None:
     #         await self.start()
@@ -0,0 +1,184 @@
+# services/resilience.py
+from __future__ import annotations
+
+import asyncio
+import random
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+# Upstream statuses worth another attempt (throttling, gateway and transient server errors)
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+_END = object()
+
+
+class MASHTTPError(RuntimeError):
+    """Non-2xx response from the serving endpoint."""
+
+    def __init__(self, status: int, body: str, retry_after_s: Optional[float] = None):
+        super().__init__(f"MAS HTTP {status}: {body}")
+        self.status = status
+        self.retry_after_s = retry_after_s
+
+
+class RetryStats(BaseModel):
+    retries: int = 0
+    resumed: int = 0
+    hedges: int = 0
+    exhausted: int = 0
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for connect errors, 429/5xx and dropped streams."""
+
+    def __init__(self, attempts: int = 2, backoff_s: float = 0.5, backoff_max_s: float = 8.0):
+        self.attempts = attempts
+        self.backoff_s = backoff_s
+        self.backoff_max_s = backoff_max_s
+
+    @staticmethod
+    def retryable(error: BaseException) -> bool:
+        if isinstance(error, MASHTTPError):
+            return error.status in RETRYABLE_STATUS
+        # httpx.TransportError covers connect/read failures, protocol errors and timeouts;
+        # TimeoutError is the first-byte deadline.
+        return isinstance(error, (httpx.TransportError, TimeoutError))
+
+    def delay(self, retry: int, error: BaseException) -> float:
+        """Seconds to wait before retry number `retry` (0-based); honours Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max_s, self.backoff_s * 2 ** retry))
+        retry_after = getattr(error, "retry_after_s", None)
+        if retry_after:
+            delay = max(delay, min(retry_after, self.backoff_max_s))
+        return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None  # HTTP-date form; fall back to the computed backoff
+
+
+class ResumeFilter:
+    """
+    Tracks which raw MAS events the consumer has already received, so a retried stream
+    continues where the failed one stopped instead of rendering the answer twice.
+
+    Text deltas are compared by character position with the text already delivered and
+    only the unseen tail is passed on. Other events are counted per kind (tool calls, tool
+    outputs, message items, ...) and a retry skips as many of each kind as were delivered.
+    If the regenerated text differs from what was shown, the tail is still appended and the
+    final message event (which carries the whole answer) replaces the streamed text.
+    """
+
+    def __init__(self) -> None:
+        self._parts: List[str] = []
+        self._length = 0
+        self._delivered: Dict[str, int] = {}
+        self._seen: Dict[str, int] = {}
+        self._replayed = 0
+        self._replay_text: Optional[str] = None
+        self.diverged_at: Optional[int] = None
+        self.completed = False
+
+    @property
+    def delivered_anything(self) -> bool:
+        return bool(self._length or self._delivered)
+
+    def restart(self) -> None:
+        """Called before each retry: the next stream starts from the beginning of the answer."""
+        self._seen = {}
+        self._replayed = 0
+        self._replay_text = "".join(self._parts)
+        self.diverged_at = None
+
+    def accept(self, ev: Any) -> Any:
+        """The event to pass on (possibly with a trimmed delta), or None to drop it."""
+        if not isinstance(ev, dict):
+            return ev
+        kind = ev.get("type")
+        if kind == "response.output_text.delta":
+            return self._accept_delta(ev)
+
+        if kind in ("response.output_item.added", "response.output_item.done"):
+            kind = f"{kind}:{(ev.get('item') or {}).get('type')}"
+        n = self._seen[kind] = self._seen.get(kind, 0) + 1
+        if n <= self._delivered.get(kind, 0):
+            return None
+        self._delivered[kind] = n
+        if kind == "response.completed":
+            self.completed = True
+        return ev
+
+    def _accept_delta(self, ev: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        delta = ev.get("delta") or ""
+        start = self._replayed
+        self._replayed += len(delta)
+        if start < self._length:
+            replay = self._replay_text or ""
+            overlap = min(len(delta), self._length - start)
+            if self.diverged_at is None and delta[:overlap] != replay[start:start + overlap]:
+                self.diverged_at = start
+            if overlap == len(delta):
+                return None
+            delta = delta[overlap:]
+            ev = {**ev, "delta": delta}
+        self._parts.append(delta)
+        self._length += len(delta)
+        return ev
+
+
+async def first_to_respond(
+    start: Callable[[], AsyncIterator[T]],
+    hedge_after_s: Optional[float],
+    may_hedge: Callable[[], bool],
+) -> AsyncIterator[T]:
+    """
+    Iterate the stream returned by `start()`. If it has produced nothing after
+    `hedge_after_s`, start a second one (when `may_hedge()` allows) and continue with
+    whichever produces its first item first; the other is cancelled and closed. A stream
+    that fails before its first item leaves the race to the other one.
+    """
+    stream = start()
+    pending = {asyncio.ensure_future(anext(stream, _END)): stream}
+    winner: Optional[AsyncIterator[T]] = None
+    first: Any = _END
+    error: Optional[BaseException] = None
+    timeout = hedge_after_s or None
+    try:
+        while pending and winner is None:
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                timeout = None
+                if may_hedge():
+                    stream = start()
+                    pending[asyncio.ensure_future(anext(stream, _END))] = stream
+                continue
+            for fut in done:
+                stream = pending.pop(fut)
+                if fut.exception() is None:
+                    winner, first = stream, fut.result()
+                    break
+                error = fut.exception()
+                await stream.aclose()
+    finally:
+        for fut, stream in pending.items():
+            fut.cancel()
+            await asyncio.gather(fut, return_exceptions=True)
+            await stream.aclose()
+
+    if winner is None:
+        raise error
+    try:
+        if first is _END:
+            return
+        yield first
+        async for item in winner:
+            yield item
+    finally:
+        await winner.aclose()
@@ -0,0 +1,175 @@
+# services/response_cache.py
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Protocol, Tuple
+
+from pydantic import BaseModel
+
+from auth.identity import Identity
+from services.history import message_text
+from utils.logging import logger
+
+_WS_RE = re.compile(r"\s+")
+
+# Event types whose presence means the answer must not be cached.
+_ERROR_TYPES = frozenset({"response.error", "error", "response.failed"})
+
+
+class CacheStore(Protocol):
+    """Persistent tier behind the in-memory LRU (e.g. Lakebase)."""
+
+    async def get(self, key: str) -> Optional[List[Dict[str, Any]]]: ...
+
+    async def set(self, key: str, events: List[Dict[str, Any]], ttl_s: int) -> None: ...
+
+
+class CacheStats(BaseModel):
+    hits: int = 0
+    persistent_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    entries: int = 0
+    hit_rate: float = 0.0
+
+
+def _to_jsonable(ev: Any) -> Dict[str, Any]:
+    if isinstance(ev, dict):
+        return ev
+    # OpenAI SDK event objects are pydantic models
+    return ev.model_dump(mode="json") if hasattr(ev, "model_dump") else json.loads(json.dumps(ev, default=str))
+
+
+def entitlement_scope(identity: Identity, mode: str = "user") -> str:
+    """Who may share an answer: the caller's identity ("user"), or everyone ("global")."""
+    if mode == "global":
+        return "global"
+    return f"{identity.auth_type}:{identity.email}"
+
+
+def cache_key(messages: List[Dict[str, Any]], scope: str) -> str:
+    """Stable key over (scope, roles, whitespace/case-normalized message text)."""
+    normalized = [
+        (m.get("role", ""), _WS_RE.sub(" ", message_text(m)).strip().lower()) for m in messages
+    ]
+    raw = json.dumps([scope, normalized], separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache of complete MAS answers, stored as their raw event stream.
+
+    Sits in front of MASChatClient.stream_raw: a hit replays the recorded events so the
+    normalizer and ChainlitStream see an ordinary stream; a miss passes the upstream
+    events through while recording them, and stores them only if the stream finished
+    without error. Entries are keyed per entitlement scope (the caller's identity by
+    default) so users never receive answers computed under someone else's permissions.
+
+    Tier 1 is an in-process TTL + LRU map; tier 2 is an optional CacheStore.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_s: int,
+        max_entries: int,
+        scope: str = "user",
+        store: Optional[CacheStore] = None,
+    ) -> None:
+        self._ttl_s = ttl_s
+        self._max_entries = max_entries
+        self._scope = scope
+        self._store = store
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._stats = CacheStats()
+
+    # ---------- Public API ----------
+
+    async def stream(
+        self,
+        identity: Identity,
+        messages: List[Dict[str, Any]],
+        upstream: Callable[[Identity, List[Dict[str, Any]]], AsyncIterator[Any]],
+    ) -> AsyncIterator[Any]:
+        key = cache_key(messages, entitlement_scope(identity, self._scope))
+        cached = await self._lookup(key)
+        if cached is not None:
+            for ev in cached:
+                yield ev
+            return
+
+        self._stats.misses += 1
+        recorded: List[Dict[str, Any]] = []
+        cacheable = True
+        async for ev in upstream(identity, messages):
+            if cacheable:
+                try:
+                    item = _to_jsonable(ev)
+                    recorded.append(item)
+                    cacheable = item.get("type") not in _ERROR_TYPES
+                except Exception:
+                    cacheable = False
+            yield ev
+
+        # Reached only when the upstream stream completed (no exception, not abandoned).
+        if cacheable and recorded:
+            await self._put(key, recorded)
+
+    def stats(self) -> CacheStats:
+        s = self._stats
+        lookups = s.hits + s.persistent_hits + s.misses
+        return s.model_copy(update={
+            "entries": len(self._entries),
+            "hit_rate": round((s.hits + s.persistent_hits) / lookups, 4) if lookups else 0.0,
+        })
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    # ---------- Tiers ----------
+
+    async def _lookup(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, events = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+                logger.info("Response cache hit (%d events)", len(events))
+                return events
+            del self._entries[key]
+
+        if self._store is not None:
+            try:
+                events = await self._store.get(key)
+            except Exception as e:
+                logger.warning(f"Response cache store read failed: {e}")
+                events = None
+            if events:
+                self._stats.persistent_hits += 1
+                self._remember(key, events)
+                logger.info("Response cache persistent hit (%d events)", len(events))
+                return events
+        return None
+
+    async def _put(self, key: str, events: List[Dict[str, Any]]) -> None:
+        self._remember(key, events)
+        self._stats.stores += 1
+        if self._store is not None:
+            try:
+                await self._store.set(key, events, self._ttl_s)
+            except Exception as e:
+                logger.warning(f"Response cache store write failed: {e}")
+
+    def _remember(self, key: str, events: List[Dict[str, Any]]) -> None:
+        self._entries[key] = (time.monotonic() + self._ttl_s, events)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self._stats.evictions += 1
@@ -0,0 +1,108 @@
+# services/single_flight.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from auth.identity import Identity
+from services.response_cache import cache_key, entitlement_scope
+from utils.logging import logger
+
+
+class FlightStats(BaseModel):
+    flights: int = 0
+    coalesced: int = 0
+    in_flight: int = 0
+
+
+class _Flight:
+    """One upstream stream and its replay log, shared by every subscriber."""
+
+    __slots__ = ("events", "done", "error", "cond", "subscribers", "task")
+
+    def __init__(self) -> None:
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.cond = asyncio.Condition()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical MAS requests into one upstream stream.
+
+    The first caller for a (scope, messages) key starts the upstream call in a background
+    task that appends every raw event to a shared log; all callers, including ones that join
+    mid-stream, read that log from the start at their own pace. A slow subscriber therefore
+    never holds back the upstream read or the other subscribers. The upstream call is
+    cancelled only once every subscriber has gone away.
+
+    Only callers in the same entitlement scope share a flight (see entitlement_scope).
+    """
+
+    def __init__(self, scope: str = "user") -> None:
+        self._scope = scope
+        self._flights: Dict[str, _Flight] = {}
+        self._stats = FlightStats()
+
+    async def stream(
+        self,
+        identity: Identity,
+        messages: List[Dict[str, Any]],
+        upstream: Callable[[Identity, List[Dict[str, Any]]], AsyncIterator[Any]],
+    ) -> AsyncIterator[Any]:
+        key = cache_key(messages, entitlement_scope(identity, self._scope))
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, upstream(identity, messages)))
+            self._stats.flights += 1
+        else:
+            self._stats.coalesced += 1
+            logger.info("Single-flight: joined in-flight MAS request (%d already waiting)", flight.subscribers)
+
+        flight.subscribers += 1
+        try:
+            pos = 0
+            while True:
+                async with flight.cond:
+                    await flight.cond.wait_for(lambda: len(flight.events) > pos or flight.done)
+                    batch = flight.events[pos:]
+                    finished = flight.done
+                pos += len(batch)
+                for ev in batch:
+                    yield ev
+                if finished and pos >= len(flight.events):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done and flight.task is not None:
+                flight.task.cancel()
+
+    async def _run(self, key: str, flight: _Flight, events: AsyncIterator[Any]) -> None:
+        try:
+            async for ev in events:
+                async with flight.cond:
+                    flight.events.append(ev)
+                    flight.cond.notify_all()
+        except asyncio.CancelledError:
+            flight.error = RuntimeError("MAS request cancelled")
+        except Exception as e:
+            flight.error = e
+        finally:
+            # Later identical requests start a fresh call (or hit the response cache).
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def stats(self) -> FlightStats:
+        return self._stats.model_copy(update={"in_flight": len(self._flights)})
@@ -0,0 +1,206 @@
+# services/sse_parser.py
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from utils.logging import logger
+
+# Optional fast JSON decoders; both parse bytes directly, so frames are never decoded to str.
+_loads: Callable[[bytes], Any]
+_decode_errors: tuple = (ValueError,)
+try:
+    import orjson
+
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import msgspec
+
+        _loads = msgspec.json.decode
+        _decode_errors = (ValueError, msgspec.DecodeError)
+        JSON_BACKEND = "msgspec"
+    except ImportError:
+        _json_decode = json.JSONDecoder().decode
+
+        def _loads(data: bytes) -> Any:
+            # Explicit utf-8 decode skips json.loads' per-call encoding sniffing on bytes.
+            return _json_decode(data.decode("utf-8"))
+
+        JSON_BACKEND = "json"
+
+_LF = 0x0A
+_DONE = b"[DONE]"
+
+
+@dataclass(slots=True)
+class SSEEvent:
+    data: bytes
+    event: Optional[str] = None
+    id: Optional[str] = None
+
+
+class SSEParser:
+    """
+    Incremental Server-Sent Events parser (WHATWG EventSource framing).
+
+    Feed raw byte chunks as they arrive; complete events are returned once their
+    terminating blank line is seen. Handles CR, LF and CRLF line endings split across
+    chunks, comment/keepalive lines, `event:`/`id:`/`retry:` fields and multi-line
+    `data:` frames. The line buffer is a single bytearray reused for the whole stream;
+    single-line `data:` payloads are handed to the JSON decoder without re-joining.
+
+    One leniency over the spec: a bare JSON line (starting with "{") is dispatched as a
+    complete event, since some servers omit the `data:` prefix and the blank line.
+    """
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+        self._data: List[bytes] = []
+        self._event: Optional[str] = None
+        self.last_event_id: Optional[str] = None
+        self.retry_ms: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        buf = self._buf
+        buf += chunk
+        if buf.find(b"\r") != -1:
+            return self._feed_general()
+
+        # Fast path (LF-only streams, i.e. nearly all of them): split complete lines at C speed.
+        last = buf.rfind(b"\n")
+        if last == -1:
+            return []
+        lines = bytes(buf[:last]).split(b"\n")
+        del buf[:last + 1]
+        out: List[SSEEvent] = []
+        data = self._data
+        for line in lines:
+            if line[:5] == b"data:":
+                data.append(line[6:] if line[5:6] == b" " else line[5:])
+            elif not line:
+                if data:
+                    out.append(self._dispatch())
+                else:
+                    self._event = None
+            else:
+                ev = self._other_line(line)
+                if ev is not None:
+                    out.append(ev)
+        return out
+
+    def close(self) -> List[SSEEvent]:
+        """End of stream: process any unterminated line and dispatch a pending event."""
+        out: List[SSEEvent] = []
+        if self._buf:
+            tail = bytes(self._buf).rstrip(b"\r")
+            self._buf.clear()
+            out.extend(self._lines([tail]))
+        if self._data:
+            out.append(self._dispatch())
+        return out
+
+    def _feed_general(self) -> List[SSEEvent]:
+        buf = self._buf
+        lines: List[bytes] = []
+        n = len(buf)
+        pos = 0
+        while pos < n:
+            lf = buf.find(b"\n", pos)
+            cr = buf.find(b"\r", pos, lf if lf != -1 else n)
+            if cr != -1:
+                if cr + 1 == n:
+                    break  # can't tell yet whether this CR starts a CRLF
+                end, nxt = cr, (cr + 2 if buf[cr + 1] == _LF else cr + 1)
+            elif lf != -1:
+                end, nxt = lf, lf + 1
+            else:
+                break
+            lines.append(bytes(buf[pos:end]))
+            pos = nxt
+        if pos:
+            del buf[:pos]
+        return self._lines(lines)
+
+    def _lines(self, lines: List[bytes]) -> List[SSEEvent]:
+        out: List[SSEEvent] = []
+        for line in lines:
+            if line[:5] == b"data:":
+                self._data.append(line[6:] if line[5:6] == b" " else line[5:])
+            elif not line:
+                if self._data:
+                    out.append(self._dispatch())
+                else:
+                    self._event = None
+            else:
+                ev = self._other_line(line)
+                if ev is not None:
+                    out.append(ev)
+        return out
+
+    def _other_line(self, line: bytes) -> Optional[SSEEvent]:
+        """Any non-empty line that is not `data:` — comments, other fields, bare JSON."""
+        first = line[0]
+        if first == 0x3A:  # ":" comment / keepalive
+            return None
+        if first == 0x7B and not self._data:
+            # Bare JSON line: a complete event on its own (NDJSON-style servers).
+            return SSEEvent(data=line, event=self._event, id=self.last_event_id)
+        field, sep, value = line.partition(b":")
+        if sep and value[:1] == b" ":
+            value = value[1:]
+        if field == b"event":
+            self._event = value.decode("utf-8", errors="replace")
+        elif field == b"id":
+            if b"\x00" not in value:
+                self.last_event_id = value.decode("utf-8", errors="replace")
+        elif field == b"retry":
+            if value.isdigit():
+                self.retry_ms = int(value)
+        elif field == b"data":
+            self._data.append(value)
+        return None
+
+    def _dispatch(self) -> SSEEvent:
+        data = self._data
+        payload = data[0] if len(data) == 1 else b"\n".join(data)
+        ev = SSEEvent(data=payload, event=self._event, id=self.last_event_id)
+        data.clear()
+        self._event = None
+        return ev
+
+
+def decode_event(ev: SSEEvent) -> Optional[Dict[str, Any]]:
+    """
+    Decode an SSE event's JSON payload. Returns None for `[DONE]` and unparseable frames.
+    If the payload lacks a "type" but the frame carried an `event:` name, that name is used.
+    """
+    data = ev.data
+    if data == _DONE:
+        return None
+    try:
+        obj = _loads(data)
+    except _decode_errors:
+        logger.warning("SSE parse warning: %r", data[:200])
+        return None
+    if not isinstance(obj, dict):
+        return None
+    if ev.event and "type" not in obj:
+        obj["type"] = ev.event
+    return obj
+
+
+async def iter_sse_json(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """Yield decoded JSON objects from an async iterator of raw SSE byte chunks."""
+    parser = SSEParser()
+    async for chunk in chunks:
+        for ev in parser.feed(chunk):
+            obj = decode_event(ev)
+            if obj is not None:
+                yield obj
+    for ev in parser.close():
+        obj = decode_event(ev)
+        if obj is not None:
+            yield obj
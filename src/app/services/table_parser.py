@@ -1,31 +1,180 @@
 # services/table_parser.py
+from __future__ import annotations
+
 import re
-from typing import Optional
-import pandas as pd
-
-# conservative pipe-table detection
-_TABLE_RE = re.compile(
-    r"^\s*\|.+?\|\s*$\n^\s*\|(?:\s*[:-]+-+\s*\|)+\s*$\n(?:^\s*\|.+?\|\s*$\n?)+",
-    re.MULTILINE
-)
-
-def extract_first_table(md: str) -> tuple[Optional[pd.DataFrame], str]:
-    """Return (df, text_without_table) if a clean pipe-table is found; else (None, original_text)."""
-    m = _TABLE_RE.search(md or "")
-    if not m:
-        return None, md
-
-    lines = [l.strip() for l in m.group(0).strip().splitlines()]
-    header = [c.strip() for c in lines[0].strip("|").split("|")]
-    rows = []
-    for l in lines[2:]:
-        if "|" not in l: 
-            continue
-        rows.append([c.strip() for c in l.strip("|").split("|")])
+from typing import TYPE_CHECKING, List, Optional
+
+# pandas (and the typing stage) load on the first completed table, not at app startup.
+if TYPE_CHECKING:
+    import pandas as pd
+
+# GFM delimiter row: | --- | :---: | ---: |
+_SEPARATOR_RE = re.compile(r"^\|(?:\s*:?-+:?\s*\|)+$")
+_CELL_SPLIT_RE = re.compile(r"(?<!\\)\|")
+_FENCES = ("```", "~~~")
+
+
+def _is_row(stripped: str) -> bool:
+    return len(stripped) > 1 and stripped[0] == "|" and stripped[-1] == "|"
+
+
+def _cells(stripped: str) -> List[str]:
+    inner = stripped[1:-1] if stripped.endswith("|") and not stripped.endswith("\\|") else stripped[1:]
+    if "\\" not in inner:
+        return [c.strip() for c in inner.split("|")]
+    return [c.strip().replace("\\|", "|") for c in _CELL_SPLIT_RE.split(inner)]
+
+
+def build_table(columns: List[str], rows: List[List[str]]) -> Optional[pd.DataFrame]:
+    """DataFrame with inferred dtypes for one parsed table, or None if it cannot be built."""
+    import pandas as pd
+    from services.table_types import infer_dtypes, unique_columns
+
+    width = len(columns)
     try:
-        df = pd.DataFrame(rows, columns=header)
-        # remove the table block from text
-        remaining = (md[:m.start()] + md[m.end():]).strip()
-        return df, remaining
+        df = pd.DataFrame([(r + [""] * width)[:width] for r in rows], columns=unique_columns(columns))
+        return infer_dtypes(df)
     except Exception:
-        return None, md
+        return None
+
+
+class ParsedTable:
+    """Cells of one table found in the text, waiting to become a DataFrame."""
+
+    __slots__ = ("columns", "rows", "raw", "at")
+
+    def __init__(self, columns: List[str], rows: List[List[str]], raw: List[str], at: int):
+        self.columns = columns
+        self.rows = rows
+        self.raw = raw
+        self.at = at  # position in the prose, where the raw lines go back if building fails
+
+    @property
+    def cells(self) -> int:
+        return len(self.columns) * len(self.rows)
+
+
+class StreamingTableExtractor:
+    """
+    Incremental markdown pipe-table detector fed with text deltas as they stream in.
+
+    Complete lines are classified once: prose, a candidate header, the delimiter row that
+    confirms it, or a body row. Each finished table's cells are kept in `pending` and its
+    lines are dropped from `text`, so the final answer never has to be rescanned. Lines
+    inside code fences are left alone.
+
+    Building the DataFrames (the CPU-heavy part) is separate: `close()` does it inline,
+    while the renderer calls `finish()`, builds `pending` with `build_table` off the event
+    loop, and hands the results to `resolve()`.
+    """
+
+    def __init__(self):
+        self.tables: List[pd.DataFrame] = []
+        self.pending: List[ParsedTable] = []
+        self._partial: List[str] = []
+        self._prose: List[str] = []
+        self._in_fence = False
+        self._header: Optional[str] = None
+        self._columns: Optional[List[str]] = None
+        self._rows: List[List[str]] = []
+        self._raw: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """Text seen so far with the extracted tables removed."""
+        return "\n".join(self._prose).strip()
+
+    def feed(self, delta: str) -> None:
+        if "\n" not in delta:
+            if delta:
+                self._partial.append(delta)
+            return
+        head, *lines, tail = delta.split("\n")
+        self._partial.append(head)
+        self._line("".join(self._partial))
+        for line in lines:
+            self._line(line)
+        self._partial = [tail] if tail else []
+
+    def finish(self) -> "StreamingTableExtractor":
+        """Process the trailing partial line and end any open table (without building it)."""
+        if self._partial:
+            self._line("".join(self._partial))
+            self._partial = []
+        self._end_table()
+        self._release_header()
+        return self
+
+    def resolve(self, frames: List[Optional[pd.DataFrame]]) -> None:
+        """Results of build_table for `pending`, in order; failed tables go back into the text."""
+        failed = []
+        for table, df in zip(self.pending, frames):
+            if df is None:
+                failed.append(table)
+            else:
+                self.tables.append(df)
+        for table in reversed(failed):
+            self._prose[table.at:table.at] = table.raw
+        self.pending = []
+
+    def close(self) -> "StreamingTableExtractor":
+        """finish(), then build the pending tables inline."""
+        self.finish()
+        self.resolve([build_table(t.columns, t.rows) for t in self.pending])
+        return self
+
+    def _line(self, line: str) -> None:
+        stripped = line.strip()
+        if stripped.startswith(_FENCES):
+            self._end_table()
+            self._release_header()
+            self._in_fence = not self._in_fence
+            self._prose.append(line)
+            return
+        if self._in_fence:
+            self._prose.append(line)
+            return
+
+        if self._columns is not None:
+            # Body rows may omit the closing pipe
+            if stripped.startswith("|"):
+                self._rows.append(_cells(stripped))
+                self._raw.append(line)
+                return
+            self._end_table()
+        elif self._header is not None:
+            header, self._header = self._header, None
+            columns = _cells(header.strip())
+            if _SEPARATOR_RE.match(stripped) and len(_cells(stripped)) == len(columns):
+                self._columns = columns
+                self._raw = [header, line]
+                return
+            self._prose.append(header)
+
+        if _is_row(stripped):
+            self._header = line
+        else:
+            self._prose.append(line)
+
+    def _release_header(self) -> None:
+        if self._header is not None:
+            self._prose.append(self._header)
+            self._header = None
+
+    def _end_table(self) -> None:
+        if self._columns is None:
+            return
+        columns, rows, raw = self._columns, self._rows, self._raw
+        self._columns, self._rows, self._raw = None, [], []
+        if rows:
+            self.pending.append(ParsedTable(columns, rows, raw, len(self._prose)))
+        else:
+            self._prose.extend(raw)
+
+
+def extract_tables(md: str) -> tuple[List[pd.DataFrame], str]:
+    """Return (tables, text_without_tables) for every clean pipe-table in a complete text."""
+    extractor = StreamingTableExtractor()
+    extractor.feed(md or "")
+    extractor.close()
+    return extractor.tables, extractor.text
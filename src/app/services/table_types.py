@@ -0,0 +1,200 @@
+# services/table_types.py
+import io
+from functools import lru_cache
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from utils.logging import logger
+
+# Cells treated as missing values rather than text.
+_NULLS = ["", "-", "—", "n/a", "N/A", "NA", "null", "None", "nan", "NaN"]
+
+# -$1,234.50  ($1,234)  $(1,234)  +12.3%  1.2M  .5  € 3,000
+_CURRENCIES = ["$", "€", "£", "¥", "₹"]
+_NUMBER_RE = (
+    r"^(?P<sign>[-+(])?\s*(?P<cur>[$€£¥₹])?\s*(?P<sign2>[-(])?"
+    r"(?P<num>(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.(?P<dec>\d+))?|\.(?P<dec2>\d+))"
+    r"\s*(?P<suffix>[KMB%])?\)?$"
+)
+_SCALE = {"K": 1e3, "M": 1e6, "B": 1e9}
+# Cheap pre-check that rejects text columns before the full extract
+_NUMBER_START_RE = r"^[-+(]?\s*[$€£¥₹]?\s*[-(]?\.?\d"
+# Zero-padded identifiers (zip codes, account numbers, SKUs) stay text
+_ZERO_PADDED_RE = r"^0\d"
+
+_DATE_RE = (
+    r"^(?:\d{4}-\d{1,2}(?:-\d{1,2})?|\d{1,2}/\d{1,2}/\d{2,4}"
+    r"|[A-Za-z]{3,9}\.? \d{1,2},? \d{4}|\d{1,2} [A-Za-z]{3,9}\.? \d{4}|[A-Za-z]{3,9}\.? \d{4})"
+    r"(?:[T ]\d{1,2}:\d{2}(?::\d{2})?)?$"
+)
+
+# Text columns with at most this share of distinct values (and enough rows) become categories.
+_CATEGORY_MAX_RATIO = 0.5
+_CATEGORY_MIN_ROWS = 8
+
+_INT32 = np.iinfo(np.int32)
+
+
+def _parse_numbers(values: pd.Series, present: pd.Series):
+    """Parse numeric-looking strings; returns (float64 series, unit, decimals) or None."""
+    filled = values[present]
+    if not filled.str.match(_NUMBER_START_RE).all() or filled.str.match(_ZERO_PADDED_RE).any():
+        return None
+
+    # Fast path: plain numbers with thousands separators and at most one uniform unit
+    # (leading currency symbol or trailing %); anything else goes through the full regex.
+    core, unit = values, None
+    if filled.str.endswith("%").all():
+        core, unit = values.str[:-1], "%"
+    else:
+        lead = filled.str[0]
+        if lead.isin(_CURRENCIES).all() and lead.nunique() == 1:
+            core, unit = values.str[1:], lead.iloc[0]
+    plain = core.str.replace(",", "", regex=False)
+    numbers = pd.to_numeric(plain, errors="coerce")
+    if numbers[present].notna().all() and not plain[present].str.contains(r"[^\d.+-]", regex=True).any():
+        dot = plain.str.find(".")
+        dec = (plain.str.len() - dot - 1).where(dot >= 0, 0)
+        return numbers, unit, int(dec.max())
+
+    parts = values.str.extract(_NUMBER_RE)
+    if parts["num"][present].isna().any():
+        return None
+
+    currencies = parts["cur"].dropna().unique()
+    percent = parts["suffix"] == "%"
+    if len(currencies) > 1 or (len(currencies) and percent.any()) or 0 < percent[present].sum() < present.sum():
+        return None
+
+    numbers = pd.to_numeric(parts["num"].str.replace(",", "", regex=False))
+    negative = parts["sign"].isin(["-", "("]) | parts["sign2"].isin(["-", "("])
+    numbers = numbers.where(~negative, -numbers)
+    scale = parts["suffix"].map(_SCALE)
+    if scale.notna().any():
+        numbers = numbers * scale.fillna(1.0)
+        decimals = None
+    else:
+        # map(len), not .str: with no decimals anywhere both groups are all-NaN floats
+        dec = parts["dec"].combine_first(parts["dec2"]).dropna().map(len)
+        decimals = int(dec.max()) if len(dec) else 0
+
+    unit = currencies[0] if len(currencies) else ("%" if percent.any() else None)
+    return numbers, unit, decimals
+
+
+def _compact_numbers(numbers: pd.Series, decimals: Optional[int]) -> pd.Series:
+    """Downcast to int32 / nullable Int32 / float32 when no displayed precision is lost."""
+    valid = numbers.dropna()
+    if valid.empty:
+        return numbers
+    if (valid % 1 == 0).all():
+        if valid.min() >= _INT32.min and valid.max() <= _INT32.max:
+            return numbers.astype("int32" if len(valid) == len(numbers) else "Int32")
+        return numbers.astype("int64" if len(valid) == len(numbers) else "Int64")
+    if decimals is not None:
+        narrowed = numbers.astype("float32")
+        if (narrowed.astype("float64").round(decimals) == numbers.round(decimals))[numbers.notna()].all():
+            return narrowed
+    return numbers
+
+
+def _parse_dates(values: pd.Series, present: pd.Series) -> Optional[pd.Series]:
+    # ISO 8601 is parsed in C; other layouts are checked against known shapes first because
+    # format="mixed" falls back to per-element parsing. Mixed time zones stay text.
+    try:
+        dates = pd.to_datetime(values, errors="coerce", format="ISO8601")
+        if dates[present].notna().all():
+            return dates
+        if not values[present].str.match(_DATE_RE).all():
+            return None
+        dates = pd.to_datetime(values, errors="coerce", format="mixed")
+    except (ValueError, OverflowError):
+        return None
+    if dates[present].isna().any():
+        return None
+    return dates
+
+
+def infer_column(col: pd.Series):
+    """Return (typed_series, unit) for one column of stripped strings."""
+    present = ~col.isin(_NULLS)
+    if not present.any():
+        return col, None
+    values = col.where(present)
+
+    parsed = _parse_numbers(values, present)
+    if parsed is not None:
+        numbers, unit, decimals = parsed
+        return _compact_numbers(numbers, decimals), unit
+
+    dates = _parse_dates(values, present)
+    if dates is not None:
+        return dates, None
+
+    if len(col) >= _CATEGORY_MIN_ROWS and col.nunique() <= len(col) * _CATEGORY_MAX_RATIO:
+        return col.astype("category"), None
+    return col, None
+
+
+def unique_columns(names: List[str]) -> List[str]:
+    """Non-empty, unique column names (Arrow/Parquet reject duplicates)."""
+    seen: Dict[str, int] = {}
+    result = []
+    for i, name in enumerate(names, 1):
+        name = name or f"Column {i}"
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        result.append(name if not count else f"{name}.{count}")
+    return result
+
+
+def infer_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Type every column of a string DataFrame in place: numbers (currency, percent, thousands
+    separators, K/M/B suffixes, accounting negatives), dates, low-cardinality categories.
+    Currency and percent columns keep the number as displayed and get the unit appended
+    to their name (also recorded in `df.attrs["units"]`).
+    """
+    units: Dict[str, str] = {}
+    names = list(df.columns)
+    for i in range(df.shape[1]):
+        typed, unit = infer_column(df.iloc[:, i].str.strip())
+        df.isetitem(i, typed)
+        if unit:
+            if unit not in str(names[i]):
+                names[i] = f"{names[i]} ({unit})"
+            units[names[i]] = unit
+    df.columns = names
+    df.attrs["units"] = units
+    return df
+
+
+@lru_cache(maxsize=None)
+def _pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        logger.warning("pyarrow not installed; table Arrow/Parquet export disabled")
+        return None
+
+
+def to_arrow_ipc(df: pd.DataFrame) -> Optional[bytes]:
+    """Serialize a typed table to an Arrow IPC stream, or None without pyarrow."""
+    pa = _pyarrow()
+    if pa is None:
+        return None
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_parquet(df: pd.DataFrame) -> Optional[bytes]:
+    """Serialize a typed table to Parquet bytes, or None without pyarrow."""
+    if _pyarrow() is None:
+        return None
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False)
+    return buf.getvalue()
@@ -0,0 +1,333 @@
+# services/tracing.py
+from __future__ import annotations
+
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from utils.logging import logger
+
+try:  # Optional: spans are mirrored to OpenTelemetry when the API package is installed
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# Histogram bucket upper bounds in ms (last bucket is +inf)
+BUCKETS_MS: Tuple[float, ...] = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000,
+)
+
+_current: contextvars.ContextVar[Optional["RequestTrace"]] = contextvars.ContextVar("request_trace", default=None)
+
+
+def current_trace() -> Optional["RequestTrace"]:
+    """The trace of the chat turn running in this task, if any (also visible to child tasks)."""
+    return _current.get()
+
+
+def task_trace(task: asyncio.Task) -> Optional["RequestTrace"]:
+    """The trace of the chat turn `task` runs in; read from its context, so usable from another thread."""
+    return task.get_context().get(_current)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; O(log buckets) per sample, percentiles from buckets."""
+
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile (max for the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS_MS[i], self.max_ms) if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max_ms, 2),
+            "buckets_ms": list(BUCKETS_MS),
+            "counts": list(self.counts),
+        }
+
+
+class RequestTrace:
+    """
+    Spans and stream timings for one chat turn, from on_message to the last token.
+
+    Stages are recorded with `span()`; per-token work is a couple of float operations
+    (TTFT, inter-token gaps), and tool calls are paired by call id.
+    """
+
+    def __init__(self, tracer: "Tracer", user: Optional[str], endpoint: Optional[str]):
+        self._tracer = tracer
+        self.trace_id = uuid.uuid4().hex
+        self.user = user
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self.attrs: Dict[str, Any] = {}
+        self.marks: Dict[str, float] = {}
+        self.tokens = 0
+        self.first_token_s: Optional[float] = None
+        self._last_token: Optional[float] = None
+        self.gaps_ms: List[float] = []
+        self.tools: List[Dict[str, Any]] = []
+        self._open_tools: Dict[str, Tuple[str, float]] = {}
+        self.render_s = 0.0
+        self.error: Optional[str] = None
+        self._otel_root = None
+        if otel_trace is not None:
+            self._otel_root = otel_trace.get_tracer("bi-hub-app").start_span(
+                "chat.turn", attributes={"mas.endpoint": endpoint or ""}
+            )
+
+    # ---------- Stages ----------
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, started, time.perf_counter(), **attrs)
+
+    def add_span(self, name: str, started: float, ended: float, **attrs: Any) -> None:
+        """Record a stage timed elsewhere (perf_counter start/end)."""
+        self.spans.append({
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round((ended - started) * 1000, 3),
+            **attrs,
+        })
+        if self._otel_root is not None:
+            ctx = otel_trace.set_span_in_context(self._otel_root)
+            offset_ns = time.time_ns() - time.perf_counter_ns()
+            otel_span = otel_trace.get_tracer("bi-hub-app").start_span(
+                name, context=ctx, start_time=int(started * 1e9) + offset_ns, attributes=attrs or None
+            )
+            otel_span.end(end_time=int(ended * 1e9) + offset_ns)
+
+    def mark(self, name: str) -> None:
+        """Record the first time a point in the turn is reached (e.g. first upstream byte)."""
+        if name not in self.marks:
+            self.marks[name] = round((time.perf_counter() - self.started) * 1000, 3)
+
+    # ---------- Stream events ----------
+
+    def token(self) -> None:
+        now = time.perf_counter()
+        if self._last_token is None:
+            self.first_token_s = now - self.started
+        else:
+            self.gaps_ms.append((now - self._last_token) * 1000)
+        self._last_token = now
+        self.tokens += 1
+
+    def tool_call(self, call_id: Optional[str], name: Optional[str]) -> None:
+        self._open_tools[call_id or name or ""] = (name or "tool", time.perf_counter())
+
+    def tool_output(self, call_id: Optional[str], name: Optional[str]) -> None:
+        opened = self._open_tools.pop(call_id or name or "", None)
+        if opened is None:
+            return
+        tool_name, started = opened
+        ended = time.perf_counter()
+        self.tools.append({"name": tool_name, "call_id": call_id, "duration_ms": round((ended - started) * 1000, 3)})
+        self.add_span("tool", started, ended, tool=tool_name)
+
+    def rendered(self, seconds: float) -> None:
+        """Time spent in renderer callbacks (websocket sends), as opposed to waiting upstream."""
+        self.render_s += seconds
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    # ---------- Completion ----------
+
+    def summary(self) -> Dict[str, Any]:
+        e2e_ms = (time.perf_counter() - self.started) * 1000
+        gaps = sorted(self.gaps_ms)
+        return {
+            "trace_id": self.trace_id,
+            "timestamp": self.wall_started,
+            "user": self.user,
+            "endpoint": self.endpoint,
+            "e2e_ms": round(e2e_ms, 3),
+            "ttft_ms": round(self.first_token_s * 1000, 3) if self.first_token_s is not None else None,
+            "tokens": self.tokens,
+            "inter_token_ms": {
+                "p50": round(gaps[len(gaps) // 2], 3),
+                "p95": round(gaps[int(len(gaps) * 0.95)], 3),
+                "max": round(gaps[-1], 3),
+            } if gaps else None,
+            "render_ms": round(self.render_s * 1000, 3),
+            "marks": self.marks,
+            "spans": self.spans,
+            "tools": self.tools,
+            "error": self.error,
+            **self.attrs,
+        }
+
+    def finish(self, error: Optional[BaseException] = None) -> Dict[str, Any]:
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        summary = self.summary()
+        if self._otel_root is not None:
+            self._otel_root.set_attributes({
+                k: v for k, v in summary.items() if isinstance(v, (int, float, str)) and k != "user"
+            })
+            if error is not None:
+                self._otel_root.record_exception(error)
+            self._otel_root.end()
+        self._tracer.record(self, summary)
+        return summary
+
+
+class _NullTrace:
+    """Stands in for RequestTrace when tracing is disabled, so callers need no checks."""
+
+    user = endpoint = None
+
+    def span(self, name: str, **attrs: Any):
+        return contextlib.nullcontext()
+
+    def _noop(self, *args: Any, **kwargs: Any) -> None:
+        return None
+
+    add_span = mark = token = tool_call = tool_output = rendered = set = finish = _noop
+
+
+_NULL_TRACE = _NullTrace()
+
+
+class Tracer:
+    """
+    Process-wide collector: latency histograms per endpoint and per user (bounded LRU),
+    a ring buffer of recent turn summaries, and an optional JSONL dump for offline analysis.
+    """
+
+    METRICS = ("e2e", "ttft", "inter_token", "tool")
+
+    def __init__(self, enabled: bool = True, dump_dir: Optional[str] = None, max_users: int = 500, recent: int = 200):
+        self.enabled = enabled
+        self._dump_dir = dump_dir
+        self._max_users = max_users
+        self._endpoints: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self._users: "OrderedDict[str, Dict[str, LatencyHistogram]]" = OrderedDict()
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=recent)
+        self._pending_dump: List[str] = []
+        self._dump_task: Optional[asyncio.Task] = None
+        if dump_dir:
+            os.makedirs(dump_dir, exist_ok=True)
+
+    def start(self, user: Optional[str] = None, endpoint: Optional[str] = None):
+        if not self.enabled:
+            return _NULL_TRACE
+        trace = RequestTrace(self, user, endpoint)
+        _current.set(trace)
+        return trace
+
+    def _histograms(self, table: Dict[str, Dict[str, LatencyHistogram]], key: str) -> Dict[str, LatencyHistogram]:
+        hists = table.get(key)
+        if hists is None:
+            hists = table[key] = {m: LatencyHistogram() for m in self.METRICS}
+        return hists
+
+    def record(self, trace: RequestTrace, summary: Dict[str, Any]) -> None:
+        targets = [self._histograms(self._endpoints, trace.endpoint or "unknown")]
+        if trace.user:
+            targets.append(self._histograms(self._users, trace.user))
+            self._users.move_to_end(trace.user)
+            while len(self._users) > self._max_users:
+                self._users.popitem(last=False)
+        for hists in targets:
+            hists["e2e"].observe(summary["e2e_ms"])
+            if summary["ttft_ms"] is not None:
+                hists["ttft"].observe(summary["ttft_ms"])
+            observe_gap = hists["inter_token"].observe
+            for gap in trace.gaps_ms:
+                observe_gap(gap)
+            for tool in trace.tools:
+                hists["tool"].observe(tool["duration_ms"])
+
+        self._recent.append(summary)
+        logger.info(
+            "turn_trace",
+            extra={
+                "trace_id": trace.trace_id,
+                "e2e_ms": summary["e2e_ms"],
+                "ttft_ms": summary["ttft_ms"],
+                "tokens": trace.tokens,
+                "tools": len(trace.tools),
+                "render_ms": summary["render_ms"],
+            },
+        )
+        if self._dump_dir:
+            self._pending_dump.append(json.dumps(summary, default=str))
+            if self._dump_task is None or self._dump_task.done():
+                self._dump_task = asyncio.get_running_loop().create_task(self._flush_dump())
+
+    async def _flush_dump(self) -> None:
+        lines, self._pending_dump = self._pending_dump, []
+        try:
+            await asyncio.to_thread(self._append, os.path.join(self._dump_dir, "traces.jsonl"), lines)
+        except OSError as e:
+            logger.warning(f"Trace dump failed: {e}")
+
+    @staticmethod
+    def _append(path: str, lines: List[str]) -> None:
+        with open(path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def snapshot(self, include_users: bool = False) -> Dict[str, Any]:
+        """Histogram snapshot. Per-user data is only included on request (it contains emails)."""
+        data: Dict[str, Any] = {
+            "endpoints": {k: {m: h.snapshot() for m, h in v.items()} for k, v in self._endpoints.items()},
+        }
+        if include_users:
+            data["users"] = {k: {m: h.snapshot() for m, h in v.items()} for k, v in self._users.items()}
+            data["recent"] = list(self._recent)
+        return data
+
+    def dump(self, path: Optional[str] = None) -> Optional[str]:
+        """Write histograms (per endpoint and per user) and recent turns to a local JSON file."""
+        path = path or (os.path.join(self._dump_dir, "latency_histograms.json") if self._dump_dir else None)
+        if path is None:
+            return None
+        if self._pending_dump:
+            self._append(os.path.join(self._dump_dir, "traces.jsonl"), self._pending_dump)
+            self._pending_dump = []
+        with open(path, "w") as f:
+            json.dump(self.snapshot(include_users=True), f, indent=2, default=str)
+        return path
@@ -1,4 +1,189 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from typing import Dict, Optional
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
\ No newline at end of file
+# Records are only formatted on the listener thread; the calling thread (usually the event
+# loop) pays for a level check, a sampling/rate-limit check, rendering the message (and
+# any traceback) of records that pass, and a non-blocking enqueue.
+
+_SECRET_PATTERNS = [
+    # Authorization: Bearer <token>
+    (re.compile(r"(?i)(bearer\s+)[A-Za-z0-9\-._~+/]+=*"), r"\1[REDACTED]"),
+    # Databricks personal access tokens
+    (re.compile(r"\bdapi[0-9a-f]{32}(?:-\d+)?\b"), "[REDACTED]"),
+    # JWTs (OAuth access tokens)
+    (re.compile(r"\beyJ[\w-]+\.[\w-]+\.[\w-]+"), "[REDACTED]"),
+    # token=..., 'x-forwarded-access-token': '...', password: ...
+    (re.compile(
+        r"(?i)(\b(?:access[-_]?token|token|password|secret|authorization|api[-_]?key|pat)['\"]?\s*[:=]\s*['\"]?)"
+        r"[^'\"\s,}]+"
+    ), r"\1[REDACTED]"),
+]
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; extra= fields are included as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = redact(value) if isinstance(value, str) else value
+        if record.exc_text or record.exc_info:
+            entry["exc"] = redact(record.exc_text or self.formatException(record.exc_info))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class CategoryFilter(logging.Filter):
+    """
+    Per-category sampling and rate limits, keyed by the logger name below "app" (e.g.
+    "app.stream" -> "stream"). Sampling only thins records below WARNING; rate limits
+    apply to every level and report how many records were suppressed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.sampling: Dict[str, float] = {}
+        self.rate_limits: Dict[str, float] = {}
+        self._buckets: Dict[str, list] = {}
+        self._suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def category(name: str) -> str:
+        return name[4:] if name.startswith("app.") else name
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.sampling and not self.rate_limits:
+            return True
+        category = self.category(record.name)
+        rate = self.sampling.get(category)
+        if rate is not None and record.levelno < logging.WARNING and random.random() >= rate:
+            return False
+        limit = self.rate_limits.get(category)
+        if limit is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._buckets.setdefault(category, [limit, now])
+            bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * limit)
+            bucket[1] = now
+            if bucket[0] < 1:
+                self._suppressed[category] = self._suppressed.get(category, 0) + 1
+                return False
+            bucket[0] -= 1
+            suppressed = self._suppressed.pop(category, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+_EXC_FORMATTER = logging.Formatter()
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener and drops (and counts) when full."""
+
+    def __init__(self, q: "queue.Queue[logging.LogRecord]"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Called once the record passed the level and filter checks. Render %-args now (they
+        # may be mutated before the listener gets to them) and the traceback (a queued
+        # exc_info keeps its frames alive); the formatter itself still runs on the listener.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=10000)
+_stream_handler = logging.StreamHandler(sys.stderr)
+_queue_handler = NonBlockingQueueHandler(_queue)
+_category_filter = CategoryFilter()
+_queue_handler.addFilter(_category_filter)
+_listener = logging.handlers.QueueListener(_queue, _stream_handler, respect_handler_level=False)
+
+
+def configure_logging(
+    level: str = "INFO",
+    fmt: str = "json",
+    sampling: Optional[Dict[str, float]] = None,
+    rate_limits: Optional[Dict[str, float]] = None,
+    queue_size: Optional[int] = None,
+) -> None:
+    """(Re)configure the root logging pipeline; called once settings are loaded."""
+    global _queue
+    if fmt == "json":
+        _stream_handler.setFormatter(JsonFormatter())
+    else:
+        _stream_handler.setFormatter(RedactingFormatter("%(levelname)s:%(name)s:%(message)s"))
+    _category_filter.sampling = dict(sampling or {})
+    _category_filter.rate_limits = dict(rate_limits or {})
+    if queue_size and queue_size != _queue.maxsize:
+        _listener.stop()
+        _queue = queue.Queue(maxsize=queue_size)
+        _queue_handler.queue = _listener.queue = _queue
+        _listener.start()
+    logging.getLogger().setLevel(level.upper())
+
+
+def logging_stats() -> Dict[str, int]:
+    return {"queued": _queue.qsize(), "dropped": _queue_handler.dropped}
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Logger for a sampling/rate-limit category, e.g. get_logger("stream")."""
+    return logging.getLogger(f"app.{category}")
+
+
+def _install() -> None:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(logging.INFO)
+    _stream_handler.setFormatter(JsonFormatter())
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+_install()
+logger = logging.getLogger("app")